@@ -0,0 +1,4 @@
+% addpath(genpath('.\'))
+
+Lua_String = 'ar1.StopFrame()';
+ErrStatus = RtttNetClientAPI.RtttNetClient.SendCommand(Lua_String);
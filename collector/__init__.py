@@ -1,5 +1,7 @@
 from .cam_driver import run_single_camera
 from .cam_mul_driver import run_multiple_cameras
+from .cam_session import CaptureSession
+from .process_capture import ProcessCaptureSession
 from .radar_driver import copy_radar_data
 from .radar_driver import run_radar
 from .radar_driver import init_radar
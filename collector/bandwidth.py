@@ -0,0 +1,246 @@
+try:
+    import PySpin
+except:
+    print("Warning: PySpin is not installed!")
+
+from .cam_config import roi_from_rows
+
+# Bits per pixel of the pixel formats
+PIXEL_FORMAT_BITS = {
+    'Mono8': 8,
+    'BayerRG8': 8,
+    'BayerBG8': 8,
+    'BayerGR8': 8,
+    'BayerGB8': 8,
+    'Mono10p': 10,
+    'BayerRG10p': 10,
+    'Mono12p': 12,
+    'BayerRG12p': 12,
+    'Mono16': 16,
+    'BayerRG16': 16,
+    'YCbCr422_8': 16,
+    'RGB8': 24,
+    'BGR8': 24,
+}
+
+# Protocol overhead (USB3 Vision / GigE Vision leaders, trailers and headers)
+# and chunk data, as fraction of the image data
+LINK_OVERHEAD = 0.02
+
+
+class LinkInfo:
+    """
+    Image size and link nodes of one initialized camera.
+    """
+
+    def __init__(self, cam_idx, width, height, pixel_format, link_speed, limit_min=None, limit_max=None,
+                 limit_inc=None, limit=None, packet_size_max=None, binning=None, sensor_width=None,
+                 sensor_height=None):
+        self.cam_idx = cam_idx
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.link_speed = link_speed
+        self.limit_min = limit_min
+        self.limit_max = limit_max
+        self.limit_inc = limit_inc
+        self.limit = limit
+        self.packet_size_max = packet_size_max
+        self.binning = binning
+        self.sensor_width = sensor_width
+        self.sensor_height = sensor_height
+
+    def profile_size(self, profile):
+        """
+        :return: Width and height of the frames after the binning and ROI of a profile are applied.
+        :rtype: tuple
+        """
+        if (profile.binning is None and profile.roi_rows is None) or self.sensor_width is None \
+                or self.sensor_height is None:
+            return self.width, self.height
+        binning = profile.binning or self.binning or 1
+        width, height = self.sensor_width // binning, self.sensor_height // binning
+        if profile.roi_rows is not None:
+            height = roi_from_rows(height, profile.roi_rows)[1]
+        elif profile.binning == self.binning:
+            width, height = self.width, self.height
+        return width, height
+
+
+def read_link_info(cam, cam_idx=None):
+    """
+    Read the image size, pixel format, link speed and throughput limit range
+    of an initialized camera. Nodes which are not available are None, e.g.
+    the packet size of USB3 cameras.
+
+    :type cam: CameraPtr
+    :rtype: LinkInfo
+    """
+    nodemap = cam.GetNodeMap()
+
+    def integer(name, attr='GetValue'):
+        node = PySpin.CIntegerPtr(nodemap.GetNode(name))
+        if not PySpin.IsAvailable(node) or not PySpin.IsReadable(node):
+            return None
+        return int(getattr(node, attr)())
+
+    node_pixel_format = PySpin.CEnumerationPtr(nodemap.GetNode('PixelFormat'))
+    pixel_format = PySpin.CEnumEntryPtr(node_pixel_format.GetCurrentEntry()).GetSymbolic()
+    return LinkInfo(cam_idx, integer('Width'), integer('Height'), pixel_format, integer('DeviceLinkSpeed'),
+                    limit_min=integer('DeviceLinkThroughputLimit', 'GetMin'),
+                    limit_max=integer('DeviceLinkThroughputLimit', 'GetMax'),
+                    limit_inc=integer('DeviceLinkThroughputLimit', 'GetInc'),
+                    limit=integer('DeviceLinkThroughputLimit'),
+                    packet_size_max=integer('GevSCPSPacketSize', 'GetMax'),
+                    binning=integer('BinningVertical'),
+                    sensor_width=integer('SensorWidth'),
+                    sensor_height=integer('SensorHeight'))
+
+
+def required_bandwidth(width, height, pixel_format, frame_rate, overhead=LINK_OVERHEAD):
+    """
+    :return: Bytes per second sent by one camera.
+    :rtype: float
+    """
+    bits = PIXEL_FORMAT_BITS.get(pixel_format)
+    if bits is None:
+        print('WARNING!!! Unknown pixel format %s, assuming 8 bits per pixel.' % pixel_format)
+        bits = 8
+    return width * height * bits / 8.0 * frame_rate * (1.0 + overhead)
+
+
+class BandwidthPlan:
+    """
+    This class checks that the frames of all cameras fit into the link
+    budget and divides the budget into per-camera throughput limits. The
+    cameras share one host controller, so the budget is host_limit if given,
+    otherwise the lowest link speed of the cameras. Every camera gets a share
+    of the budget in proportion to its required bandwidth; the plan is
+    feasible if the required bandwidth plus headroom fits into the budget.
+    If it is not, the limits are set to the required bandwidth plus headroom,
+    so the frame rate can still be set when recording anyway.
+
+    The packet size of GigE cameras is only set if packet_size is given, as
+    packets larger than the MTU of the network card are lost.
+    """
+
+    def __init__(self, links, frame_rate, host_limit=None, headroom=0.1, packet_size=None):
+        """
+        :param links: Link information of all cameras.
+        :param frame_rate: Acquisition frame rate of all cameras.
+        :param host_limit: Bandwidth of the host controller in bytes/s, None for the lowest link speed.
+        :param headroom: Fraction of the required bandwidth reserved on top of it.
+        :param packet_size: Packet size of GigE cameras in bytes, e.g. 9000 with jumbo frames, None to keep it.
+        :type links: list
+        """
+        self.links = links
+        self.frame_rate = frame_rate
+        self.headroom = headroom
+        self.required = [required_bandwidth(link.width, link.height, link.pixel_format, frame_rate) for link in links]
+        self.total = sum(self.required)
+
+        link_speeds = [link.link_speed for link in links if link.link_speed is not None]
+        if host_limit is not None:
+            self.budget = float(host_limit)
+        elif len(link_speeds) > 0:
+            self.budget = float(min(link_speeds))
+        else:
+            self.budget = None
+        self.feasible = self.budget is None or self.total * (1.0 + headroom) <= self.budget
+
+        self.limits = []
+        self.packet_sizes = []
+        for link, required in zip(links, self.required):
+            self.limits.append(self._limit(link, required))
+            if packet_size is not None and link.packet_size_max is not None:
+                self.packet_sizes.append(min(packet_size, link.packet_size_max))
+            else:
+                self.packet_sizes.append(None)
+
+    def _limit(self, link, required):
+        if link.limit_max is None or self.budget is None or self.total == 0:
+            return None
+        if self.feasible:
+            limit = self.budget * required / self.total
+        else:
+            limit = required * (1.0 + self.headroom)
+        if link.link_speed is not None:
+            limit = min(limit, link.link_speed)
+        limit = int(min(max(limit, link.limit_min or 0), link.limit_max))
+        if link.limit_inc:
+            limit -= (limit - (link.limit_min or 0)) % link.limit_inc
+        if limit < required:
+            self.feasible = False
+        return limit
+
+    def report(self):
+        print('*** LINK BANDWIDTH ***')
+        for link, required, limit in zip(self.links, self.required, self.limits):
+            print('Camera %s: %dx%d %s at %.1f FPS needs %.1f MB/s, link %s, throughput limit %s'
+                  % (link.cam_idx, link.width, link.height, link.pixel_format, self.frame_rate, required / 1e6,
+                     '%.0f MB/s' % (link.link_speed / 1e6) if link.link_speed is not None else 'unknown',
+                     '%.1f MB/s' % (limit / 1e6) if limit is not None else 'not available'))
+        if self.budget is None:
+            print('Total %.1f MB/s, link budget unknown' % (self.total / 1e6))
+            return
+        print('Total %.1f MB/s + %d%% headroom of %.1f MB/s budget (%.0f%%)'
+              % (self.total / 1e6, self.headroom * 100, self.budget / 1e6,
+                 self.total * (1.0 + self.headroom) / self.budget * 100))
+        if not self.feasible:
+            max_rate = self.frame_rate * self.budget / (self.total * (1.0 + self.headroom))
+            print('WARNING!!! The cameras need more bandwidth than the link budget, frames will be incomplete '
+                  'or lost. Lower the frame rate to %.1f FPS, the resolution or the pixel format.' % max_rate)
+
+
+def plan_bandwidth(cam_list, profiles, frame_rate, host_limit=None, headroom=0.1, packet_size=None,
+                   cam_indices=None, links=None):
+    """
+    Plan the link bandwidth of initialized cameras and put the throughput
+    limits and packet sizes into their profiles, to be applied with the rest
+    of the profile.
+
+    :param cam_list: Initialized cameras.
+    :param profiles: Profiles of the cameras, updated in place.
+    :param frame_rate: Acquisition frame rate.
+    :param host_limit: Bandwidth of the host controller in bytes/s, None for the lowest link speed.
+    :param headroom: Fraction of the required bandwidth reserved on top of it.
+    :param packet_size: Packet size of GigE cameras in bytes, None to keep it.
+    :param cam_indices: Camera indices in the report, default the positions in cam_list.
+    :param links: Link information of the cameras, e.g. read by the camera processes, instead of cam_list.
+    :rtype: BandwidthPlan
+    """
+    if links is None:
+        if cam_indices is None:
+            cam_indices = range(len(cam_list))
+        links = [read_link_info(cam, i) for i, cam in zip(cam_indices, cam_list)]
+    for link, profile in zip(links, profiles):
+        if profile.pixel_format is not None:
+            link.pixel_format = profile.pixel_format
+        link.width, link.height = link.profile_size(profile)
+    plan = BandwidthPlan(links, frame_rate, host_limit=host_limit, headroom=headroom, packet_size=packet_size)
+    for profile, limit, packet_size in zip(profiles, plan.limits, plan.packet_sizes):
+        profile.throughput_limit = limit
+        profile.packet_size = packet_size
+    plan.report()
+    return plan
+
+
+def check_bandwidth(cam_list, profiles, frame_rate, host_limit=None, policy='refuse', packet_size=None,
+                    cam_indices=None, links=None):
+    """
+    Plan the link bandwidth before recording, see plan_bandwidth. With policy
+    'refuse', a configuration which does not fit into the budget is refused;
+    with 'warn', it is recorded anyway after the warning; 'off' skips the
+    planning and leaves the throughput limits as they are.
+
+    :return: False if the configuration is refused, True otherwise.
+    :rtype: bool
+    """
+    if policy == 'off':
+        return True
+    plan = plan_bandwidth(cam_list, profiles, frame_rate, host_limit=host_limit, packet_size=packet_size,
+                          cam_indices=cam_indices, links=links)
+    if not plan.feasible and policy == 'refuse':
+        print('Refusing to record. Change the configuration, or record anyway with link policy "warn".')
+        return False
+    return True
@@ -3,6 +3,10 @@ try:
 except:
     print("Warning: PySpin is not installed!")
 
+import time
+import math
+from collections import namedtuple
+
 
 serial_left_1   = '18384019'
 serial_right_1  = '19325055'
@@ -118,6 +122,75 @@ def configure_chunk_data(nodemap):
     return result
 
 
+# Chunk data of one frame: timestamp in ns, frame ID, exposure time in us
+# and gain in 0.001 dB, all as integers.
+ChunkInfo = namedtuple('ChunkInfo', ['timestamp', 'frame_id', 'exposure', 'gain'])
+
+
+class ChunkReader:
+    """
+    This class reads the per-frame chunk data needed by the acquisition loop.
+    Unlike display_chunk_data_from_nodemap, the chunk nodes are resolved once
+    per camera and the values are read as numbers, so there is no per-frame
+    node lookup or string parsing.
+
+    With source == ChunkDataTypes.IMAGE, the values are read from the chunk
+    payload of the image itself (image.GetChunkData()); with
+    ChunkDataTypes.NODEMAP, from the cached chunk nodes of the device nodemap,
+    which hold the chunk data of the latest grabbed image.
+    """
+
+    def __init__(self, nodemap, source=None):
+        """
+        :param nodemap: Device nodemap.
+        :param source: ChunkDataTypes.IMAGE or ChunkDataTypes.NODEMAP, default CHOSEN_CHUNK_DATA_TYPE.
+        :type nodemap: INodeMap
+        """
+        self.source = CHOSEN_CHUNK_DATA_TYPE if source is None else source
+        self.node_timestamp = None
+        self.node_frame_id = None
+        self.node_exposure = None
+        self.node_gain = None
+
+        if self.source == ChunkDataTypes.NODEMAP:
+            self.node_timestamp = self._resolve(nodemap, 'ChunkTimestamp', PySpin.CIntegerPtr)
+            self.node_frame_id = self._resolve(nodemap, 'ChunkFrameID', PySpin.CIntegerPtr)
+            self.node_exposure = self._resolve(nodemap, 'ChunkExposureTime', PySpin.CFloatPtr)
+            self.node_gain = self._resolve(nodemap, 'ChunkGain', PySpin.CFloatPtr)
+            if self.node_timestamp is None:
+                print('Unable to retrieve chunk timestamp node. Timestamps will be 0.')
+
+    @staticmethod
+    def _resolve(nodemap, name, ptr_type):
+        # Chunk nodes only become readable once chunk data of an image is
+        # attached, so only their existence can be checked here.
+        node = nodemap.GetNode(name)
+        if node is None:
+            return None
+        return ptr_type(node)
+
+    def read(self, image):
+        """
+        Read the chunk data of the given (unreleased) image.
+
+        :param image: Grabbed image.
+        :type image: ImagePtr
+        :return: Chunk data of the image.
+        :rtype: ChunkInfo
+        """
+        if self.source == ChunkDataTypes.IMAGE:
+            chunk_data = image.GetChunkData()
+            return ChunkInfo(int(chunk_data.GetTimestamp()),
+                             int(chunk_data.GetFrameID()),
+                             int(round(chunk_data.GetExposureTime())),
+                             int(round(chunk_data.GetGain() * 1000)))
+
+        return ChunkInfo(self.node_timestamp.GetValue() if self.node_timestamp is not None else 0,
+                         self.node_frame_id.GetValue() if self.node_frame_id is not None else 0,
+                         int(round(self.node_exposure.GetValue())) if self.node_exposure is not None else 0,
+                         int(round(self.node_gain.GetValue() * 1000)) if self.node_gain is not None else 0)
+
+
 def display_chunk_data_from_nodemap(nodemap, verbose=False):
     """
     This function displays all available chunk data by looping through the
@@ -519,12 +592,10 @@ def configure_trigger_multi(cam_list, sync=False):
     try:
         result = True
         if sync:
-            # cam_1 = cam_list.GetBySerial(serial_left_1)
-            # cam_2 = cam_list.GetBySerial(serial_right_1)
-            cam_1 = cam_list[0]
-            cam_2 = cam_list[1]
-            configure_trigger(cam_1.GetNodeMap(), trigger_type=TriggerType.NULL)
-            configure_trigger(cam_2.GetNodeMap(), trigger_type=TriggerType.HARDWARE_SEC)
+            topology = make_topology(cam_list)
+            for i, cam in enumerate(cam_list):
+                trigger_type = TriggerType.NULL if i == topology.master else TriggerType.HARDWARE_SEC
+                result &= configure_trigger(cam.GetNodeMap(), trigger_type=trigger_type)
 
         else:
             for cam in cam_list:
@@ -536,6 +607,420 @@ def configure_trigger_multi(cam_list, sync=False):
     return result
 
 
+def configure_acquisition(cam, frame_rate):
+    """
+    Set continuous acquisition at the given frame rate.
+
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    nodemap = cam.GetNodeMap()
+    node_acquisition_mode = PySpin.CEnumerationPtr(nodemap.GetNode('AcquisitionMode'))
+    if not PySpin.IsAvailable(node_acquisition_mode) or not PySpin.IsWritable(node_acquisition_mode):
+        print('Unable to set acquisition mode to continuous (node retrieval). Aborting...')
+        return False
+    node_acquisition_mode_continuous = node_acquisition_mode.GetEntryByName('Continuous')
+    node_acquisition_mode.SetIntValue(node_acquisition_mode_continuous.GetValue())
+
+    acquisition_frame_rate_active = PySpin.CBooleanPtr(nodemap.GetNode('AcquisitionFrameRateEnable'))
+    if PySpin.IsAvailable(acquisition_frame_rate_active) and PySpin.IsWritable(acquisition_frame_rate_active):
+        acquisition_frame_rate_active.SetValue(True)
+    node_acquisition_frame_rate = PySpin.CFloatPtr(nodemap.GetNode('AcquisitionFrameRate'))
+    if not PySpin.IsAvailable(node_acquisition_frame_rate) or not PySpin.IsWritable(node_acquisition_frame_rate):
+        print('Unable to set frame rate (node retrieval). Aborting...')
+        return False
+    node_acquisition_frame_rate.SetValue(frame_rate)
+    print('Acquisition frame rate set to %d...' % frame_rate)
+    return True
+
+
+# Chunk entries read by ChunkReader. Only these are enabled by a camera
+# profile, so the chunk payload of every frame carries nothing else.
+CHUNK_ENTRIES = ['FrameID', 'Timestamp', 'ExposureTime', 'Gain']
+
+# Trigger source of each trigger type, None for free running
+TRIGGER_SOURCES = {
+    TriggerType.NULL: None,
+    TriggerType.SOFTWARE: 'Software',
+    TriggerType.HARDWARE: 'Line0',
+    TriggerType.HARDWARE_SEC: 'Line3',
+}
+
+
+# Capture modes: binning and the rows of the sensor read out (first and last
+# row as fraction of the sensor height). The rows below 80% of the height
+# are cropped by preprocess/cam_stereo_rectify.py, so the 'top' modes do not
+# read them out, which saves link bandwidth and raises the maximum frame
+# rate. The rows are rounded outwards to the increments of the camera and
+# there is a margin for the distortion, which maps the rectified rows to
+# raw rows further down.
+CAPTURE_MODES = {
+    'full': (1, (0.0, 1.0)),
+    'top': (1, (0.0, 0.85)),
+    'bin2': (2, (0.0, 1.0)),
+    'bin2_top': (2, (0.0, 0.85)),
+}
+
+
+def roi_from_rows(height_max, roi_rows, inc=1):
+    """
+    Sensor ROI of a range of rows.
+
+    :param height_max: Maximum height of the image at the current binning.
+    :param roi_rows: First and last row as fraction of the sensor height.
+    :param inc: Increment of OffsetY and Height.
+    :return: OffsetY and Height.
+    :rtype: tuple
+    """
+    offset = int(roi_rows[0] * height_max) // inc * inc
+    last = int(math.ceil(roi_rows[1] * height_max))
+    height = (last - offset + inc - 1) // inc * inc
+    return offset, min(height, (height_max - offset) // inc * inc)
+
+
+class CameraProfile:
+    """
+    This class declares the configuration of a camera: trigger, stream
+    buffers, chunk entries, acquisition frame rate, pixel format, binning,
+    region of interest and link throughput. A value of None leaves the node
+    as it is. It is applied with ProfileApplier.
+    """
+
+    def __init__(self, trigger=TriggerType.NULL, frame_rate=None, pixel_format=None, buffer_handling='OldestFirst',
+                 buffer_count=0, chunk_entries=None, acquisition_mode='Continuous', throughput_limit=None,
+                 packet_size=None, binning=None, roi_rows=None):
+        """
+        :param trigger: Trigger type, TriggerType.NULL for free running.
+        :param frame_rate: Acquisition frame rate, None for cameras which follow a hardware trigger.
+        :param pixel_format: Pixel format name, e.g. 'BayerRG8'.
+        :param buffer_handling: Stream buffer handling mode, e.g. 'OldestFirst'.
+        :param buffer_count: Number of stream buffers, 0 for the maximum.
+        :param chunk_entries: Names of the chunk entries to enable, default CHUNK_ENTRIES.
+        :param acquisition_mode: Acquisition mode, e.g. 'Continuous'.
+        :param throughput_limit: Link throughput limit in bytes/s, see collector.bandwidth.
+        :param packet_size: Stream packet size in bytes of GigE cameras.
+        :param binning: Horizontal and vertical binning factor, e.g. 2.
+        :param roi_rows: First and last row read out as fraction of the sensor height, e.g. (0.0, 0.85).
+            The full width is read out.
+        :type trigger: int
+        :type chunk_entries: list
+        :type roi_rows: tuple
+        """
+        self.trigger = trigger
+        self.frame_rate = frame_rate
+        self.pixel_format = pixel_format
+        self.buffer_handling = buffer_handling
+        self.buffer_count = buffer_count
+        self.chunk_entries = list(CHUNK_ENTRIES if chunk_entries is None else chunk_entries)
+        self.acquisition_mode = acquisition_mode
+        self.throughput_limit = throughput_limit
+        self.packet_size = packet_size
+        self.binning = binning
+        self.roi_rows = roi_rows
+
+    def __repr__(self):
+        return ('CameraProfile(trigger=%s, frame_rate=%s, pixel_format=%s, buffer_handling=%s, buffer_count=%s, '
+                'chunk_entries=%s, acquisition_mode=%s, throughput_limit=%s, packet_size=%s, binning=%s, '
+                'roi_rows=%s)'
+                % (self.trigger, self.frame_rate, self.pixel_format, self.buffer_handling, self.buffer_count,
+                   self.chunk_entries, self.acquisition_mode, self.throughput_limit, self.packet_size,
+                   self.binning, self.roi_rows))
+
+
+class ProfileApplier:
+    """
+    This class applies camera profiles to one camera. The current value of
+    every node in the profile is read and only the nodes which differ are
+    written, so applying the same profile again costs reads only. Node
+    handles and enumeration entries are resolved once and cached, so the
+    applier of a camera should be kept while the camera is initialized.
+    """
+
+    def __init__(self, cam, cam_idx=None):
+        """
+        :param cam: Initialized camera.
+        :param cam_idx: Camera index, used in the messages.
+        :type cam: CameraPtr
+        """
+        self.cam_idx = cam_idx
+        self.nodemaps = {'device': cam.GetNodeMap(), 'stream': cam.GetTLStreamNodeMap()}
+        self.nodes = {}
+        self.entries = {}
+        self.chunk_selectors = None
+        self.n_checked = 0
+        self.n_written = 0
+
+    def node(self, name, ptr_type, nodemap='device'):
+        key = (nodemap, name)
+        if key not in self.nodes:
+            self.nodes[key] = ptr_type(self.nodemaps[nodemap].GetNode(name))
+        return self.nodes[key]
+
+    def entry_value(self, node, name, symbolic):
+        key = (name, symbolic)
+        if key not in self.entries:
+            entry = node.GetEntryByName(symbolic)
+            if not PySpin.IsAvailable(entry) or not PySpin.IsReadable(entry):
+                raise ValueError('%s is not a valid entry of %s' % (symbolic, name))
+            self.entries[key] = entry.GetValue()
+        return self.entries[key]
+
+    def set_enum(self, name, symbolic, nodemap='device'):
+        node = self.node(name, PySpin.CEnumerationPtr, nodemap)
+        value = self.entry_value(node, name, symbolic)
+        self.n_checked += 1
+        if node.GetIntValue() == value:
+            return
+        node.SetIntValue(value)
+        self.n_written += 1
+
+    def set_value(self, name, value, ptr_type, nodemap='device'):
+        node = self.node(name, ptr_type, nodemap)
+        self.n_checked += 1
+        current = node.GetValue()
+        if isinstance(value, float):
+            if abs(current - value) <= 1e-4 * max(1.0, abs(value)):
+                return
+        elif current == value:
+            return
+        node.SetValue(value)
+        self.n_written += 1
+
+    def apply_trigger(self, trigger):
+        source = TRIGGER_SOURCES[trigger]
+        if source is not None:
+            node_trigger_source = self.node('TriggerSource', PySpin.CEnumerationPtr)
+            if node_trigger_source.GetIntValue() != self.entry_value(node_trigger_source, 'TriggerSource', source):
+                # The trigger source can only be changed while trigger mode is off.
+                self.set_enum('TriggerMode', 'Off')
+                self.set_enum('TriggerSource', source)
+        if trigger == TriggerType.HARDWARE_SEC:
+            self.set_enum('TriggerOverlap', 'ReadOut')
+        self.set_enum('TriggerMode', 'Off' if source is None else 'On')
+
+    def apply_chunk_entries(self, chunk_entries):
+        self.set_value('ChunkModeActive', True, PySpin.CBooleanPtr)
+
+        chunk_selector = self.node('ChunkSelector', PySpin.CEnumerationPtr)
+        if self.chunk_selectors is None:
+            self.chunk_selectors = []
+            for entry in chunk_selector.GetEntries():
+                entry = PySpin.CEnumEntryPtr(entry)
+                if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
+                    self.chunk_selectors.append((entry.GetSymbolic(), entry.GetValue()))
+        chunk_enable = self.node('ChunkEnable', PySpin.CBooleanPtr)
+
+        for symbolic, value in self.chunk_selectors:
+            chunk_selector.SetIntValue(value)
+            if not PySpin.IsWritable(chunk_enable):
+                # e.g. the image itself, which is always enabled
+                continue
+            self.n_checked += 1
+            enable = symbolic in chunk_entries
+            if chunk_enable.GetValue() != enable:
+                chunk_enable.SetValue(enable)
+                self.n_written += 1
+
+    def apply_format(self, binning, roi_rows):
+        if binning is not None:
+            # changing the binning resets the ROI of the camera
+            self.set_value('BinningHorizontal', int(binning), PySpin.CIntegerPtr)
+            self.set_value('BinningVertical', int(binning), PySpin.CIntegerPtr)
+        if roi_rows is not None:
+            width_max = self.node('WidthMax', PySpin.CIntegerPtr).GetValue()
+            height_max = self.node('HeightMax', PySpin.CIntegerPtr).GetValue()
+            inc = max(self.node('Height', PySpin.CIntegerPtr).GetInc(),
+                      self.node('OffsetY', PySpin.CIntegerPtr).GetInc())
+            offset_y, height = roi_from_rows(height_max, roi_rows, inc)
+            # the offsets are moved to 0 before the size grows, and set after it shrinks
+            self.set_value('OffsetX', 0, PySpin.CIntegerPtr)
+            self.set_value('Width', width_max, PySpin.CIntegerPtr)
+            self.set_value('OffsetY', min(offset_y, self.node('OffsetY', PySpin.CIntegerPtr).GetValue()),
+                           PySpin.CIntegerPtr)
+            self.set_value('Height', height, PySpin.CIntegerPtr)
+            self.set_value('OffsetY', offset_y, PySpin.CIntegerPtr)
+
+    def apply(self, profile):
+        """
+        Apply a profile. The camera must not be acquiring.
+
+        :param profile: Profile to apply.
+        :type profile: CameraProfile
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        t_start = time.perf_counter()
+        self.n_checked = 0
+        self.n_written = 0
+        name = 'Camera' if self.cam_idx is None else 'Camera %d' % self.cam_idx
+        try:
+            self.apply_trigger(profile.trigger)
+
+            if profile.buffer_handling is not None:
+                self.set_enum('StreamBufferHandlingMode', profile.buffer_handling, 'stream')
+            if profile.buffer_count is not None:
+                self.set_enum('StreamBufferCountMode', 'Manual', 'stream')
+                buffer_count = self.node('StreamBufferCountManual', PySpin.CIntegerPtr, 'stream')
+                count = profile.buffer_count if profile.buffer_count > 0 else buffer_count.GetMax()
+                self.set_value('StreamBufferCountManual', min(count, buffer_count.GetMax()), PySpin.CIntegerPtr,
+                               'stream')
+
+            self.apply_chunk_entries(profile.chunk_entries)
+
+            if profile.pixel_format is not None:
+                self.set_enum('PixelFormat', profile.pixel_format)
+            if profile.acquisition_mode is not None:
+                self.set_enum('AcquisitionMode', profile.acquisition_mode)
+            # The binning and ROI bound the throughput and the maximum frame rate
+            self.apply_format(profile.binning, profile.roi_rows)
+            # The throughput limit bounds the maximum frame rate, so it is set first
+            if profile.throughput_limit is not None:
+                self.set_value('DeviceLinkThroughputLimit', int(profile.throughput_limit), PySpin.CIntegerPtr)
+            if profile.packet_size is not None:
+                self.set_value('GevSCPSPacketSize', int(profile.packet_size), PySpin.CIntegerPtr)
+            if profile.frame_rate is not None:
+                self.set_value('AcquisitionFrameRateEnable', True, PySpin.CBooleanPtr)
+                self.set_value('AcquisitionFrameRate', float(profile.frame_rate), PySpin.CFloatPtr)
+
+        except (PySpin.SpinnakerException, ValueError) as ex:
+            print('%s: unable to apply profile: %s' % (name, ex))
+            return False
+
+        print('%s profile applied: %d of %d nodes written in %.1f ms'
+              % (name, self.n_written, self.n_checked, (time.perf_counter() - t_start) * 1e3))
+        return True
+
+
+def get_serial_number(cam):
+    """
+    Read the serial number of a camera from its transport layer device
+    nodemap, which is readable before the camera is initialized.
+
+    :return: Serial number, '' if it is not readable.
+    :rtype: str
+    """
+    node_device_serial_number = PySpin.CStringPtr(cam.GetTLDeviceNodeMap().GetNode('DeviceSerialNumber'))
+    if PySpin.IsAvailable(node_device_serial_number) and PySpin.IsReadable(node_device_serial_number):
+        return node_device_serial_number.GetValue()
+    return ''
+
+
+class CameraTopology:
+    """
+    This class describes the trigger topology of synchronized cameras: one
+    free-running master camera and any number of slave cameras, which are
+    triggered on Line3 by the master. The master is the camera with serial
+    number master_serial (the left camera of the stereo rig), or the first
+    camera if it is not connected.
+
+    Cameras are referred to by their index in the sorted camera list, which
+    is also the index of their output files (images_N, frame_log_N.bin).
+    """
+
+    def __init__(self, serials, master_serial=serial_left_1):
+        """
+        :param serials: Serial numbers of the cameras, in camera list order.
+        :param master_serial: Serial number of the master camera.
+        :type serials: list
+        """
+        self.serials = list(serials)
+        if master_serial in self.serials:
+            self.master = self.serials.index(master_serial)
+        else:
+            self.master = 0
+            if len(self.serials) > 1:
+                print('WARNING!!! Master camera %s not found, using camera 0 (%s) as master.'
+                      % (master_serial, self.serials[0]))
+        self.slaves = [i for i in range(len(self.serials)) if i != self.master]
+
+    @property
+    def num_cameras(self):
+        return len(self.serials)
+
+    def name(self, cam_idx):
+        serial = self.serials[cam_idx]
+        if serial == serial_left_1:
+            return 'left'
+        if serial == serial_right_1:
+            return 'right'
+        return ''
+
+    def arm_order(self):
+        """
+        :return: Camera indices in the order to begin acquisition: the slaves
+            first, so they are waiting for the first trigger of the master.
+        :rtype: list
+        """
+        return self.slaves + [self.master]
+
+    def profiles(self, frame_rate, pixel_format=None, binning=None, roi_rows=None):
+        """
+        :return: Camera profile of every camera: the master runs free at the
+            frame rate, the slaves follow its trigger.
+        :rtype: list
+        """
+        profiles = []
+        for i in range(self.num_cameras):
+            if i == self.master:
+                profiles.append(CameraProfile(TriggerType.NULL, frame_rate=frame_rate, pixel_format=pixel_format,
+                                              binning=binning, roi_rows=roi_rows))
+            else:
+                profiles.append(CameraProfile(TriggerType.HARDWARE_SEC, pixel_format=pixel_format,
+                                              binning=binning, roi_rows=roi_rows))
+        return profiles
+
+    def report(self):
+        for i, serial in enumerate(self.serials):
+            role = 'master' if i == self.master else 'slave (Line3)'
+            name = self.name(i)
+            print('Camera %d: %s %s%s' % (i, serial, role, ' [%s]' % name if name else ''))
+
+
+def make_topology(cam_list, master_serial=serial_left_1):
+    """
+    Build the trigger topology of a sorted camera list.
+
+    :type cam_list: list
+    :rtype: CameraTopology
+    """
+    return CameraTopology([get_serial_number(cam) for cam in cam_list], master_serial)
+
+
+def read_image_format(cam):
+    """
+    Read the binning and region of interest of an initialized camera, in the
+    format of utils.calib (offsets in binned pixels).
+
+    :type cam: CameraPtr
+    :rtype: dict
+    """
+    nodemap = cam.GetNodeMap()
+
+    def integer(name, default):
+        node = PySpin.CIntegerPtr(nodemap.GetNode(name))
+        if not PySpin.IsAvailable(node) or not PySpin.IsReadable(node):
+            return default
+        return int(node.GetValue())
+
+    width = integer('Width', 0)
+    height = integer('Height', 0)
+    return {'binning_x': integer('BinningHorizontal', 1), 'binning_y': integer('BinningVertical', 1),
+            'x_offset': integer('OffsetX', 0), 'y_offset': integer('OffsetY', 0), 'width': width, 'height': height,
+            'sensor_width': integer('SensorWidth', width), 'sensor_height': integer('SensorHeight', height)}
+
+
+def apply_profile(cam, profile, cam_idx=None):
+    """
+    Apply a camera profile once with a new ProfileApplier. The node cache of
+    the applier is discarded, so code which applies profiles to the same
+    camera more than once should keep a ProfileApplier per camera instead.
+
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    return ProfileApplier(cam, cam_idx).apply(profile)
+
+
 def grab_next_image_by_trigger(nodemap, trigger_type=TriggerType.SOFTWARE):
     """
     This function acquires an image by executing the trigger node.
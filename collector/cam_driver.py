@@ -7,26 +7,58 @@ except:
 import os
 import time
 
-from .cam_config import ChunkDataTypes, CHOSEN_CHUNK_DATA_TYPE
-from .cam_config import configure_chunk_data, disable_chunk_data, \
-    display_chunk_data_from_image, display_chunk_data_from_nodemap
-from .cam_config import configure_buffer, configure_trigger
+from .cam_config import disable_chunk_data
+from .cam_config import TriggerType, CameraProfile, ProfileApplier
 from .cam_config import print_device_info
-from .radar_driver import run_radar
-from .radar_driver import init_radar
-from .radar_driver import check_datetime
+from .frame_sink import FrameSink
+from .frame_consumer import FrameDispatcher
+from .telemetry import write_capture_stats
+from .radar_driver import start_radar
 
 
-def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img, radar=True, interval=0):
+def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img, radar=True, interval=0,
+                   num_writers=0, max_queue=64, raw=False, num_encoders=0, quality=95, verbose=True,
+                   drop_alarm=0.01, configure=True, consumers=None, radar_client=None):
     """
     This function acquires and saves 10 images from a device.
 
+    If num_writers > 0, frames are saved in producer/consumer mode: this loop only
+    grabs the frames and puts copies of them into a bounded queue, which is drained
+    by a pool of num_writers writer threads.
+
+    If raw is True, the raw sensor buffers are appended to the preallocated
+    container raw_frames.bin instead of being encoded; they are decoded after
+    the capture by preprocess/raw_decode.py.
+
+    The timing of the capture stages and the frame counters are written to
+    capture_stats.json in the sequence directory. Gaps in the frame IDs and the
+    frames which could not be stored are listed in frame_gaps.txt.
+
     :param cam: Camera to acquire images from.
     :param nodemap: Device nodemap.
     :param nodemap_tldevice: Transport layer device nodemap.
+    :param num_writers: Number of writer threads, 0 to save frames in the grab loop.
+    :param max_queue: Maximum number of frames waiting to be written.
+    :param raw: If True, write raw frames to a container instead of image files.
+    :param num_encoders: Number of JPEG encoder processes, 0 to use the writer threads or the SDK.
+    :param quality: JPEG quality of the encoder processes.
+    :param verbose: If True, print a line for every frame.
+    :param drop_alarm: Fraction of missing frames which triggers a warning, 0 to disable it.
+    :param configure: If False, skip setting acquisition mode and frame rate, e.g. when a
+        CaptureSession has configured the camera already.
+    :param consumers: In-process frame consumers, which get a read-only view of every stored frame.
+    :param radar_client: Client of a running radar service, None to start a MATLAB engine for the radar.
     :type cam: CameraPtr
     :type nodemap: INodeMap
     :type nodemap_tldevice: INodeMap
+    :type num_writers: int
+    :type max_queue: int
+    :type raw: bool
+    :type num_encoders: int
+    :type quality: int
+    :type verbose: bool
+    :type configure: bool
+    :type consumers: list
     :return: True if successful, False otherwise.
     :rtype: bool
     """
@@ -37,48 +69,56 @@ def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img,
     try:
         result = True
 
-        # Set acquisition mode to continuous
-        node_acquisition_mode = PySpin.CEnumerationPtr(nodemap.GetNode('AcquisitionMode'))
-        if not PySpin.IsAvailable(node_acquisition_mode) or not PySpin.IsWritable(node_acquisition_mode):
-            print('Unable to set acquisition mode to continuous (node retrieval). Aborting...')
-            return False
-        node_acquisition_mode_continuous = node_acquisition_mode.GetEntryByName('Continuous')
-        if not PySpin.IsAvailable(node_acquisition_mode_continuous) or not PySpin.IsReadable(node_acquisition_mode_continuous):
-            print('Unable to set acquisition mode to continuous (entry retrieval). Aborting...')
-            return False
-        acquisition_mode_continuous = node_acquisition_mode_continuous.GetValue()
-        node_acquisition_mode.SetIntValue(acquisition_mode_continuous)
-        print('Acquisition mode set to continuous...')
-
-        # Set acquisition frame rate enable to true
-        acquisition_frame_rate_active = PySpin.CBooleanPtr(nodemap.GetNode('AcquisitionFrameRateEnable'))
-        if PySpin.IsAvailable(acquisition_frame_rate_active) and PySpin.IsWritable(acquisition_frame_rate_active):
-            acquisition_frame_rate_active.SetValue(True)
-        print('Acquisition frame rate activated...')
-
-        # Set frame rate to the given value
-        node_acquisition_frame_rate = PySpin.CFloatPtr(nodemap.GetNode('AcquisitionFrameRate'))
-        if not PySpin.IsAvailable(node_acquisition_frame_rate) or not PySpin.IsWritable(node_acquisition_frame_rate):
-            print('Unable to set frame rate (node retrieval). Aborting...')
-            return False
-        node_acquisition_frame_rate.SetValue(frame_rate)
-        print('Acquisition frame rate set to %d...\n' % frame_rate)
-
-        timestamp_txt = open(os.path.join(seq_dir, 'timestamps.txt'), 'w')
+        if configure:
+            # Set acquisition mode to continuous
+            node_acquisition_mode = PySpin.CEnumerationPtr(nodemap.GetNode('AcquisitionMode'))
+            if not PySpin.IsAvailable(node_acquisition_mode) or not PySpin.IsWritable(node_acquisition_mode):
+                print('Unable to set acquisition mode to continuous (node retrieval). Aborting...')
+                return False
+            node_acquisition_mode_continuous = node_acquisition_mode.GetEntryByName('Continuous')
+            if not PySpin.IsAvailable(node_acquisition_mode_continuous) or not PySpin.IsReadable(node_acquisition_mode_continuous):
+                print('Unable to set acquisition mode to continuous (entry retrieval). Aborting...')
+                return False
+            acquisition_mode_continuous = node_acquisition_mode_continuous.GetValue()
+            node_acquisition_mode.SetIntValue(acquisition_mode_continuous)
+            print('Acquisition mode set to continuous...')
+
+            # Set acquisition frame rate enable to true
+            acquisition_frame_rate_active = PySpin.CBooleanPtr(nodemap.GetNode('AcquisitionFrameRateEnable'))
+            if PySpin.IsAvailable(acquisition_frame_rate_active) and PySpin.IsWritable(acquisition_frame_rate_active):
+                acquisition_frame_rate_active.SetValue(True)
+            print('Acquisition frame rate activated...')
+
+            # Set frame rate to the given value
+            node_acquisition_frame_rate = PySpin.CFloatPtr(nodemap.GetNode('AcquisitionFrameRate'))
+            if not PySpin.IsAvailable(node_acquisition_frame_rate) or not PySpin.IsWritable(node_acquisition_frame_rate):
+                print('Unable to set frame rate (node retrieval). Aborting...')
+                return False
+            node_acquisition_frame_rate.SetValue(frame_rate)
+            print('Acquisition frame rate set to %d...\n' % frame_rate)
+
+        # Output of the grabbed images: chunk data, frame log and image files
+        sink = FrameSink(nodemap, seq_dir, num_img, frame_rate, num_writers=num_writers, max_queue=max_queue, raw=raw,
+                         num_encoders=num_encoders, quality=quality,
+                         stream_nodemap=cam.GetTLStreamNodeMap(), drop_alarm=drop_alarm)
+        dispatcher = None
+        if consumers:
+            dispatcher = FrameDispatcher(consumers, seq_dir)
+            sink.dispatcher = dispatcher
+        if raw:
+            print('Writing raw frames to a container...')
+        elif num_encoders > 0:
+            print('Encoding images with %d processes at JPEG quality %d (queue size %d)...'
+                  % (num_encoders, quality, max_queue))
+        elif num_writers > 0:
+            print('Writing images with %d writer threads (queue size %d)...' % (num_writers, max_queue))
 
         # pause
         # input("Initialization finished! Press Enter to continue ...")
 
         if radar:
-            # Init radar
-            engine = init_radar()
-        
-        if radar and interval != 0:
-            assert check_datetime(interval) is True
-        
-        if radar:
-            # Run radar
-            run_radar(engine)
+            # Init and run radar, through the radar service if a client is given
+            start_radar(interval, radar_client)
 
         # record start time
         start_time = time.time()
@@ -128,7 +168,10 @@ def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img,
                 # Once an image from the buffer is saved and/or no longer
                 # needed, the image must be released in order to keep the
                 # buffer from filling up.
+                grab_start = time.perf_counter()
                 image_result = cam.GetNextImage()
+                host_ts = time.perf_counter()
+                sink.grabbed(grab_start, host_ts, image_result.IsIncomplete())
 
                 # Ensure image completion
                 #
@@ -149,7 +192,8 @@ def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img,
                     # name a few.
                     width = image_result.GetWidth()
                     height = image_result.GetHeight()
-                    print('Grabbed Image %d, width = %d, height = %d' % (i, width, height))
+                    if verbose:
+                        print('Grabbed Image %d, width = %d, height = %d' % (i, width, height))
 
                     # Convert image to mono 8
                     #
@@ -164,32 +208,16 @@ def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img,
                     # image_converted = image_result.Convert(PySpin.PixelFormat_Mono8, PySpin.HQ_LINEAR)
 
                     
-                    # Create a unique filename
-                    # filename = '%s/images/%010d.jpg' % (seq_dir, i)
-                    filename = os.path.join(seq_dir, 'images', '%010d.jpg' % i)
-
-                    # Save image
+                    # Read chunk data, log and save image
                     #
                     # *** NOTES ***
-                    # The standard practice of the examples is to use device
-                    # serial numbers to keep images of one device from
-                    # overwriting those of another.
-                    # print('TEST1')
+                    # The image is saved as images/%010d.jpg, queued to the
+                    # writer pool or stored in the raw container, depending on
+                    # the configuration of the sink.
                     # image_converted.Save(filename)
-                    image_result.Save(filename)
-                    print('Image saved at %s' % filename)
-                    
-
-                    # Display chunk data
-                    if CHOSEN_CHUNK_DATA_TYPE == ChunkDataTypes.IMAGE:
-                        result &= display_chunk_data_from_image(image_result)
-                    elif CHOSEN_CHUNK_DATA_TYPE == ChunkDataTypes.NODEMAP:
-                        result, ts_str = display_chunk_data_from_nodemap(nodemap)
-
-                        if i == 0:
-                            FIRST_TS = int(ts_str)
-                        value_new = (int(ts_str) - FIRST_TS) * 1e-9
-                        timestamp_txt.write("%.10f\n" % value_new)
+                    sink.put(image_result, i, host_ts)
+                    if verbose:
+                        print('Image %d stored' % i)
 
                     # Release image
                     #
@@ -197,14 +225,30 @@ def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img,
                     # Images retrieved directly from the camera (i.e. non-converted
                     # images) need to be released in order to keep from filling the
                     # buffer.
-                    image_result.Release()
-                    print('')
+                    sink.release(image_result)
+                    if verbose:
+                        print('')
 
             except PySpin.SpinnakerException as ex:
                 print('Error: %s' % ex)
+                sink.telemetry.count('sdk_exceptions')
+                if dispatcher is not None:
+                    dispatcher.close()
+                sink.close()
+                write_capture_stats(os.path.join(seq_dir, 'capture_stats.json'), [sink.telemetry],
+                                    frame_rate=frame_rate, num_img=num_img, start_time=start_time, result=False)
                 return False
 
-        timestamp_txt.close()
+        # Wait for the consumers and the queued images to be written and close the logs
+        consumer_stats = None
+        if dispatcher is not None:
+            dispatcher.close()
+            dispatcher.report()
+            consumer_stats = dispatcher.summary()
+        result &= sink.close()
+        write_capture_stats(os.path.join(seq_dir, 'capture_stats.json'), [sink.telemetry],
+                            frame_rate=frame_rate, num_img=num_img, start_time=start_time, result=result,
+                            consumers=consumer_stats)
 
         with open(os.path.join(seq_dir, 'start_time.txt'), 'w') as start_time_txt:
             start_time_txt.write("%s" % start_time)
@@ -224,12 +268,21 @@ def acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img,
     return result
 
 
-def run_single_camera(cam, seq_dir, frame_rate, num_img, radar=True, interval=0):
+def run_single_camera(cam, seq_dir, frame_rate, num_img, radar=True, interval=0, num_writers=0, max_queue=64,
+                      raw=False, num_encoders=0, quality=95, verbose=True, drop_alarm=0.01, consumers=None):
     """
     This function acts as the body of the example; please see NodeMapInfo example
     for more in-depth comments on setting up cameras.
 
     :param cam: Camera to run on.
+    :param num_writers: Number of writer threads, 0 to save frames in the grab loop.
+    :param max_queue: Maximum number of frames waiting to be written.
+    :param raw: If True, write raw frames to a container instead of image files.
+    :param num_encoders: Number of JPEG encoder processes, 0 to use the writer threads or the SDK.
+    :param quality: JPEG quality of the encoder processes.
+    :param verbose: If True, print a line for every frame.
+    :param drop_alarm: Fraction of missing frames which triggers a warning, 0 to disable it.
+    :param consumers: In-process frame consumers, see collector.frame_consumer.
     :type cam: CameraPtr
     :return: True if successful, False otherwise.
     :rtype: bool
@@ -247,19 +300,17 @@ def run_single_camera(cam, seq_dir, frame_rate, num_img, radar=True, interval=0)
 
         # Retrieve GenICam nodemap
         nodemap = cam.GetNodeMap()
-        # Retrieve Stream Parameters device nodemap
-        s_node_map = cam.GetTLStreamNodeMap()
 
-        if configure_trigger(nodemap) is False:
-            return False
-        # Configure chunk data
-        if configure_chunk_data(nodemap) is False:
-            return False
-        if configure_buffer(s_node_map) is False:
+        # Configure trigger, stream buffers, chunk data and frame rate
+        applier = ProfileApplier(cam)
+        if applier.apply(CameraProfile(TriggerType.SOFTWARE, frame_rate=frame_rate)) is False:
             return False
 
         # Acquire images and display chunk data
-        result &= acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img, radar, interval)
+        result &= acquire_images(cam, nodemap, nodemap_tldevice, seq_dir, frame_rate, num_img, radar, interval,
+                                 num_writers=num_writers, max_queue=max_queue, raw=raw,
+                                 num_encoders=num_encoders, quality=quality, verbose=verbose,
+                                 drop_alarm=drop_alarm, configure=False, consumers=consumers)
 
         # Disable chunk data
         if disable_chunk_data(nodemap) is False:
@@ -7,24 +7,223 @@ except:
 import os
 import time
 import datetime
-import numpy as np
+import threading
 
-from .cam_config import ChunkDataTypes, CHOSEN_CHUNK_DATA_TYPE
-from .cam_config import configure_chunk_data, disable_chunk_data, \
-    display_chunk_data_from_image, display_chunk_data_from_nodemap
-from .cam_config import configure_buffer, configure_trigger_multi, grab_next_image_by_trigger
+from .cam_config import disable_chunk_data, ProfileApplier, make_topology, serial_right_1
+from .cam_config import grab_next_image_by_trigger
 from .cam_config import print_device_info_multi
-from .radar_driver import run_radar
-from .radar_driver import init_radar
-from .radar_driver import check_datetime
+from .frame_sink import FrameSink
+from .stereo_pairer import StereoPairer
+from .bandwidth import check_bandwidth
+from .frame_consumer import FrameDispatcher
+from .telemetry import write_capture_stats, sync_skew
+from .radar_driver import start_radar
+from utils.frame_log import load_frame_log
 
 
-def acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval=0):
+def acquire_camera_worker(cam_idx, cam, num_img, sink, stop_event, state, grab_timeout=1000, max_errors=10,
+                          verbose=True):
     """
-    This function acquires and saves 10 images from each device.
+    This function grabs and saves the images of one camera. It is run in a
+    dedicated thread per camera by acquire_images_concurrent. Results are stored
+    in the given state dict, which is merged by the caller after the thread joins.
+
+    :param cam_idx: Camera index.
+    :param cam: Camera to acquire images from.
+    :param sink: Output of the images of this camera.
+    :param stop_event: Shared stop/abort signal of all camera workers.
+    :param state: Dict to store the results of this worker.
+    :param grab_timeout: Timeout of GetNextImage in milliseconds.
+    :param max_errors: Number of consecutive errors before all workers are aborted.
+    :param verbose: If True, print a line for every frame.
+    :type cam_idx: int
+    :type cam: CameraPtr
+    :type sink: FrameSink
+    :type stop_event: threading.Event
+    :type state: dict
+    """
+    state.update({'result': True, 'first_ts': None, 'n_saved': 0, 'n_incomplete': 0, 'n_grabbed': 0, 'errors': []})
+
+    n = 0
+    n_errors = 0
+    while n < num_img and not stop_event.is_set():
+        try:
+            grab_start = time.perf_counter()
+            image_result = cam.GetNextImage(grab_timeout)
+            try:
+                host_ts = time.perf_counter()
+                sink.grabbed(grab_start, host_ts, image_result.IsIncomplete())
+                n_errors = 0
+
+                if image_result.IsIncomplete():
+                    print('Camera %d image incomplete with image status %d ...'
+                          % (cam_idx, image_result.GetImageStatus()))
+                    state['n_incomplete'] += 1
+                else:
+                    sink.put(image_result, n, host_ts)
+                    if verbose:
+                        print('Camera %d grabbed image %d' % (cam_idx, n))
+            finally:
+                # the image goes back to the camera whatever happened to it
+                sink.release(image_result)
+            n += 1
+
+        except PySpin.SpinnakerException as ex:
+            print('Camera %d error: %s' % (cam_idx, ex))
+            sink.telemetry.count('sdk_exceptions')
+            state['errors'].append(str(ex))
+            state['result'] = False
+            n_errors += 1
+            if n_errors >= max_errors:
+                print('Camera %d failed %d times in a row. Aborting all cameras...' % (cam_idx, n_errors))
+                stop_event.set()
+        except Exception as ex:
+            # e.g. a full disk, which does not go away by grabbing the next image
+            print('Camera %d error: %s. Aborting all cameras...' % (cam_idx, ex))
+            state['errors'].append(str(ex))
+            state['result'] = False
+            stop_event.set()
+
+    state['first_ts'] = sink.first_ts
+    state['n_saved'] = sink.n_stored
+    state['n_grabbed'] = n
+    if n < num_img:
+        state['result'] = False
+
+
+def acquire_images_concurrent(cam_list, num_img, sinks, verbose=True):
+    """
+    This function runs one acquire_camera_worker thread per camera and merges
+    their results when all workers have joined. A KeyboardInterrupt or a failing
+    camera aborts all workers through the shared stop signal.
+
+    :param cam_list: List of cameras, acquisition must have begun.
+    :param sinks: List of frame sinks, one per camera.
+    :type cam_list: CameraList
+    :return: Per-camera result states.
+    :rtype: list
+    """
+    stop_event = threading.Event()
+    states = [{} for _ in cam_list]
+    workers = []
+    for i, cam in enumerate(cam_list):
+        worker = threading.Thread(target=acquire_camera_worker, name='grab-cam%d' % i,
+                                  args=(i, cam, num_img, sinks[i], stop_event, states[i]),
+                                  kwargs={'verbose': verbose})
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(0.5)
+    except KeyboardInterrupt:
+        print('Interrupted. Stopping all cameras...')
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+    for i, state in enumerate(states):
+        if 'result' not in state:
+            # worker died before initializing its state
+            state.update({'result': False, 'first_ts': None, 'n_saved': 0, 'n_incomplete': 0, 'n_grabbed': 0,
+                          'errors': ['worker failed']})
+        print('Camera %d: %d/%d images grabbed, %d saved, %d incomplete, %d errors'
+              % (i, state['n_grabbed'], num_img, state['n_saved'], state['n_incomplete'], len(state['errors'])))
+
+    return states
+
+
+def stereo_right(topology):
+    """
+    :return: Camera index of the right camera, which is paired with the left (master) camera.
+    :rtype: int
+    """
+    if serial_right_1 in topology.serials:
+        return topology.serials.index(serial_right_1)
+    return topology.slaves[0]
+
+
+def report_skew(topology, frame_log_paths):
+    """
+    Skew of every slave camera to the trigger master, from the frame logs.
+
+    :param frame_log_paths: Frame log of every camera, by camera index.
+    :return: Skew statistics of the slave cameras, see sync_skew.
+    :rtype: list
+    """
+    skew = []
+    master_log = load_frame_log(frame_log_paths[topology.master])
+    for i in topology.slaves:
+        stats = sync_skew(master_log, load_frame_log(frame_log_paths[i]))
+        stats.update({'cam_idx': i, 'serial': topology.serials[i]})
+        skew.append(stats)
+        if stats['n_pairs'] > 0:
+            print('Camera %d skew to master camera %d: host p50 %.3f ms, p95 %.3f ms, max %.3f ms; '
+                  'device p50 %.1f us, p95 %.1f us, max %.1f us (%d frames)'
+                  % (i, topology.master, stats['host_skew_ms']['p50'], stats['host_skew_ms']['p95'],
+                     stats['host_skew_ms']['max'], stats['device_skew_us']['p50'],
+                     stats['device_skew_us']['p95'], stats['device_skew_us']['max'], stats['n_pairs']))
+    del master_log
+    return skew
+
+
+def write_start_time(seq_dir, start_time, start_time_cam, first_ts_list):
+    """
+    Write start_time.txt: the start time of the sequence, the time the
+    cameras started and the device timestamp of the first frame of every
+    camera.
+    """
+    with open(os.path.join(seq_dir, 'start_time.txt'), 'w') as start_time_txt:
+        time_str = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S.%f')
+        start_time_txt.write("%s\n" % time_str)
+        # for cam_st in start_time_cam:
+        #     time_str = datetime.datetime.fromtimestamp(cam_st).strftime('%Y-%m-%d %H:%M:%S.%f')
+        #     start_time_txt.write("%s\n" % time_str)
+        time_str = datetime.datetime.fromtimestamp(start_time_cam).strftime('%Y-%m-%d %H:%M:%S.%f')
+        start_time_txt.write("%s\n" % time_str)
+        start_time_txt.write("\n")
+
+        for ff in first_ts_list:
+            start_time_txt.write("%d\n" % (ff or 0))
+
+        # TODO: transform time format to readable
+
+
+def acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval=0,
+                   concurrent=False, num_writers=0, max_queue=64, raw=False, num_encoders=0, quality=95, verbose=True, drop_alarm=0.01,
+                   configure=True, topology=None, pair_tolerance=0.001, consumers=None, radar_client=None):
+    """
+    This function acquires and saves 10 images from each device. The timing of
+    the capture stages and the frame counters of all cameras are written to
+    capture_stats.json in the sequence directory, the gaps in the frame IDs
+    and the frames not stored of camera N to frame_gaps_N.txt. The skew of
+    every slave camera to the trigger master is added to capture_stats.json. The frames of the left
+    (master) and right cameras are paired by chunk timestamp while capturing,
+    see StereoPairer for pairs.txt and unpaired.txt.
 
     :param cam_list: List of cameras
+    :param concurrent: If True, grab and save the images of each camera in a dedicated thread.
+    :param num_writers: Number of writer threads per camera, 0 to save frames in the grab loop.
+    :param max_queue: Maximum number of frames waiting to be written per camera.
+    :param raw: If True, write raw frames to a container per camera instead of image files.
+    :param num_encoders: Number of JPEG encoder processes per camera, 0 to use the writer threads or the SDK.
+    :param quality: JPEG quality of the encoder processes.
+    :param verbose: If True, print a line for every frame.
+    :param drop_alarm: Fraction of missing frames which triggers a warning, 0 to disable it.
+    :param configure: If False, skip setting acquisition mode and frame rate, e.g. when a
+        CaptureSession has configured the cameras already.
+    :param topology: Trigger topology of the cameras, default from their serial numbers.
+    :param pair_tolerance: Maximum timestamp difference of a stereo pair in seconds.
+    :param consumers: In-process frame consumers, which get a read-only view of every stored frame.
+    :param radar_client: Client of a running radar service, None to start a MATLAB engine for the radar.
     :type cam_list: CameraList
+    :type concurrent: bool
+    :type raw: bool
+    :type configure: bool
+    :type topology: CameraTopology
+    :type consumers: list
     :return: True if successful, False otherwise.
     :rtype: bool
     """
@@ -32,53 +231,72 @@ def acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval=0):
     print('*** IMAGE ACQUISITION ***\n')
     try:
         result = True
-        timestamp_txt = []
-
-        # set config for primary camera
-        cam = cam_list[0]
-        # Set acquisition mode to continuous
-        node_acquisition_mode = PySpin.CEnumerationPtr(cam.GetNodeMap().GetNode('AcquisitionMode'))
-        if not PySpin.IsAvailable(node_acquisition_mode) or not PySpin.IsWritable(node_acquisition_mode):
-            print('Unable to set acquisition mode to continuous (node retrieval). Aborting... \n')
-            return False
-        node_acquisition_mode_continuous = node_acquisition_mode.GetEntryByName('Continuous')
-        if not PySpin.IsAvailable(node_acquisition_mode_continuous) or not PySpin.IsReadable(
-                node_acquisition_mode_continuous):
-            print('Unable to set acquisition mode to continuous (entry \'continuous\' retrieval). \
-            Aborting... \n')
-            return False
-        acquisition_mode_continuous = node_acquisition_mode_continuous.GetValue()
-        node_acquisition_mode.SetIntValue(acquisition_mode_continuous)
-        print('Camera acquisition mode set to continuous...')
-        ####################
-        # Framerate
-        ####################
-        # Set acquisition frame rate enable to true
-        acquisition_frame_rate_active = PySpin.CBooleanPtr(cam.GetNodeMap().GetNode('AcquisitionFrameRateEnable'))
-        if PySpin.IsAvailable(acquisition_frame_rate_active) and PySpin.IsWritable(acquisition_frame_rate_active):
-            acquisition_frame_rate_active.SetValue(True)
-        print('Camera acquisition frame rate activated...')
-        # Set frame rate to the given value
-        node_acquisition_frame_rate = PySpin.CFloatPtr(cam.GetNodeMap().GetNode('AcquisitionFrameRate'))
-        if not PySpin.IsAvailable(node_acquisition_frame_rate) or not PySpin.IsWritable(
-                node_acquisition_frame_rate):
-            print('Unable to set frame rate (node retrieval). Aborting...')
-            return False
-        node_acquisition_frame_rate.SetValue(frame_rate)
-        print('Camera acquisition frame rate set to %d...\n' % frame_rate)
+        sinks = []
+        if topology is None:
+            topology = make_topology(cam_list)
+
+        if configure:
+            # set config for primary camera
+            cam = cam_list[topology.master]
+            # Set acquisition mode to continuous
+            node_acquisition_mode = PySpin.CEnumerationPtr(cam.GetNodeMap().GetNode('AcquisitionMode'))
+            if not PySpin.IsAvailable(node_acquisition_mode) or not PySpin.IsWritable(node_acquisition_mode):
+                print('Unable to set acquisition mode to continuous (node retrieval). Aborting... \n')
+                return False
+            node_acquisition_mode_continuous = node_acquisition_mode.GetEntryByName('Continuous')
+            if not PySpin.IsAvailable(node_acquisition_mode_continuous) or not PySpin.IsReadable(
+                    node_acquisition_mode_continuous):
+                print('Unable to set acquisition mode to continuous (entry \'continuous\' retrieval). \
+                Aborting... \n')
+                return False
+            acquisition_mode_continuous = node_acquisition_mode_continuous.GetValue()
+            node_acquisition_mode.SetIntValue(acquisition_mode_continuous)
+            print('Camera acquisition mode set to continuous...')
+            ####################
+            # Framerate
+            ####################
+            # Set acquisition frame rate enable to true
+            acquisition_frame_rate_active = PySpin.CBooleanPtr(cam.GetNodeMap().GetNode('AcquisitionFrameRateEnable'))
+            if PySpin.IsAvailable(acquisition_frame_rate_active) and PySpin.IsWritable(acquisition_frame_rate_active):
+                acquisition_frame_rate_active.SetValue(True)
+            print('Camera acquisition frame rate activated...')
+            # Set frame rate to the given value
+            node_acquisition_frame_rate = PySpin.CFloatPtr(cam.GetNodeMap().GetNode('AcquisitionFrameRate'))
+            if not PySpin.IsAvailable(node_acquisition_frame_rate) or not PySpin.IsWritable(
+                    node_acquisition_frame_rate):
+                print('Unable to set frame rate (node retrieval). Aborting...')
+                return False
+            node_acquisition_frame_rate.SetValue(frame_rate)
+            print('Camera acquisition frame rate set to %d...\n' % frame_rate)
 
-        for i in range(2):
-            f = open(os.path.join(seq_dir, 'timestamps_%d.txt' % i), 'w')
-            timestamp_txt.append(f)
+        # Output of the grabbed images of each camera: chunk data, frame log
+        # and image files or raw frame container
+        for i, cam in enumerate(cam_list):
+            sinks.append(FrameSink(cam.GetNodeMap(), seq_dir, num_img, frame_rate, cam_idx=i,
+                                   num_writers=num_writers, max_queue=max_queue, raw=raw,
+                                   num_encoders=num_encoders, quality=quality,
+                                   stream_nodemap=cam.GetTLStreamNodeMap(), drop_alarm=drop_alarm))
+
+        # Pair the frames of the left (master) and right cameras
+        pairer = None
+        if len(topology.slaves) > 0:
+            right = stereo_right(topology)
+            pairer = StereoPairer(topology.master, right, tolerance=pair_tolerance,
+                                  pairs_path=os.path.join(seq_dir, 'pairs.txt'),
+                                  unpaired_path=os.path.join(seq_dir, 'unpaired.txt'))
+            sinks[topology.master].pairer = pairer
+            sinks[right].pairer = pairer
+
+        # One dispatcher hands the frames of all cameras to the consumers
+        dispatcher = None
+        if consumers:
+            dispatcher = FrameDispatcher(consumers, seq_dir)
+            for sink in sinks:
+                sink.dispatcher = dispatcher
 
         if radar:
-            # Init radar
-            engine = init_radar()
-        if radar and interval != 0:
-            assert check_datetime(interval) is True
-        if radar:
-            # Run radar
-            run_radar(engine)
+            # Init and run radar, through the radar service if a client is given
+            start_radar(interval, radar_client)
 
         # record start time
         start_time = time.time()
@@ -92,8 +310,9 @@ def acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval=0):
         #     # print('begin acq %s' % (time.time() - ts_tmp))
         #     print('Camera %d started acquiring images...' % i)
 
-        cam_list[1].BeginAcquisition()
-        cam_list[0].BeginAcquisition()
+        # slave cameras first, so they are armed for the first trigger of the master
+        for i in topology.arm_order():
+            cam_list[i].BeginAcquisition()
         # record start time
         start_time_cam = time.time()
 
@@ -117,77 +336,85 @@ def acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval=0):
         # through the cameras; otherwise, all images will be grabbed from a
         # single camera before grabbing any images from another.
 
-        FIRST_TS_list = np.zeros((len(cam_list), ))
-        for n in range(num_img):
-            for i, cam in enumerate(cam_list):
-                try:
-                    # #  Retrieve the next image from the trigger
-                    # result &= grab_next_image_by_trigger(cam.GetNodeMap())
-                    # Retrieve next received image and ensure image completion
-                    image_result = cam.GetNextImage()
-
-                    if image_result.IsIncomplete():
-                        print('Image incomplete with image status %d ... \n' % image_result.GetImageStatus())
-                    else:
-                        # Print image information
-                        width = image_result.GetWidth()
-                        height = image_result.GetHeight()
-                        print('Camera %d grabbed image %d, width = %d, height = %d' % (i, n, width, height))
-
-                        # Convert image to mono 8
-                        # image_converted = image_result.Convert(PySpin.PixelFormat_Mono8, PySpin.HQ_LINEAR)
-
-                        # Create a unique filename
-                        filename = os.path.join(seq_dir, 'images_%d' % i, '%010d.jpg' % n)
-                        # TODO: check order of left/right cameras
-
-                        # if device_serial_number:
-                        #     filename = 'AcquisitionMultipleCamera-%s-%d.jpg' % (device_serial_number, n)
-                        # else:
-                        #     filename = 'AcquisitionMultipleCamera-%d-%d.jpg' % (i, n)
-
-                        # Save image
-                        image_result.Save(filename)
-                        print('Image saved at %s' % filename)
-
-                        # Display chunk data
-                        if CHOSEN_CHUNK_DATA_TYPE == ChunkDataTypes.IMAGE:
-                            result &= display_chunk_data_from_image(image_result)
-                        elif CHOSEN_CHUNK_DATA_TYPE == ChunkDataTypes.NODEMAP:
-                            result, ts_str = display_chunk_data_from_nodemap(cam.GetNodeMap())
-
-                            if n == 0:
-                                FIRST_TS_list[i] = int(ts_str)
-                            value_new = (int(ts_str) - FIRST_TS_list[i]) * 1e-9
-                            # timestamp_txt[i].write("%.10f\n" % value_new)
-                            f = open(os.path.join(seq_dir, 'timestamps_%d.txt' % i), 'a+')
-                            f.write("%.10f\n" % value_new)
-
-                    # Release image
-                    image_result.Release()
-                    print()
-
-                except PySpin.SpinnakerException as ex:
-                    print('Error: %s' % ex)
-                    result = False
-
-            for i, cam in enumerate(cam_list):
-                timestamp_txt[i].close()
-
-        with open(os.path.join(seq_dir, 'start_time.txt'), 'w') as start_time_txt:
-            time_str = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S.%f')
-            start_time_txt.write("%s\n" % time_str)
-            # for cam_st in start_time_cam:
-            #     time_str = datetime.datetime.fromtimestamp(cam_st).strftime('%Y-%m-%d %H:%M:%S.%f')
-            #     start_time_txt.write("%s\n" % time_str)
-            time_str = datetime.datetime.fromtimestamp(start_time_cam).strftime('%Y-%m-%d %H:%M:%S.%f')
-            start_time_txt.write("%s\n" % time_str)
-            start_time_txt.write("\n")
-            
-            for ff in FIRST_TS_list:
-                start_time_txt.write("%d\n" % ff)
-                
-            # TODO: transform time format to readable
+        FIRST_TS_list = [None] * len(cam_list)
+        if concurrent:
+            # One grab/save worker per camera, so a late frame from one camera
+            # does not delay the others.
+            states = acquire_images_concurrent(cam_list, num_img, sinks, verbose=verbose)
+            for i, state in enumerate(states):
+                FIRST_TS_list[i] = state['first_ts'] or 0
+                result &= state['result']
+        else:
+            for n in range(num_img):
+                for i, cam in enumerate(cam_list):
+                    try:
+                        # #  Retrieve the next image from the trigger
+                        # result &= grab_next_image_by_trigger(cam.GetNodeMap())
+                        # Retrieve next received image and ensure image completion
+                        grab_start = time.perf_counter()
+                        image_result = cam.GetNextImage()
+                        host_ts = time.perf_counter()
+                        sinks[i].grabbed(grab_start, host_ts, image_result.IsIncomplete())
+
+                        if image_result.IsIncomplete():
+                            print('Image incomplete with image status %d ... \n' % image_result.GetImageStatus())
+                        else:
+                            # Print image information
+                            width = image_result.GetWidth()
+                            height = image_result.GetHeight()
+                            if verbose:
+                                print('Camera %d grabbed image %d, width = %d, height = %d' % (i, n, width, height))
+
+                            # Convert image to mono 8
+                            # image_converted = image_result.Convert(PySpin.PixelFormat_Mono8, PySpin.HQ_LINEAR)
+
+                            # Read chunk data, log and save image to images_%d/%010d.jpg
+                            # TODO: check order of left/right cameras
+
+                            # if device_serial_number:
+                            #     filename = 'AcquisitionMultipleCamera-%s-%d.jpg' % (device_serial_number, n)
+                            # else:
+                            #     filename = 'AcquisitionMultipleCamera-%d-%d.jpg' % (i, n)
+                            sinks[i].put(image_result, n, host_ts)
+                            if verbose:
+                                print('Camera %d image %d stored' % (i, n))
+
+                        # Release image
+                        sinks[i].release(image_result)
+                        if verbose:
+                            print()
+
+                    except PySpin.SpinnakerException as ex:
+                        print('Error: %s' % ex)
+                        sinks[i].telemetry.count('sdk_exceptions')
+                        result = False
+            for i, sink in enumerate(sinks):
+                FIRST_TS_list[i] = sink.first_ts
+
+        # Wait for the queued images to be written, close the frame logs and
+        # export them to the timestamps text files
+        consumer_stats = None
+        if dispatcher is not None:
+            dispatcher.close()
+            dispatcher.report()
+            consumer_stats = dispatcher.summary()
+        for sink in sinks:
+            result &= sink.close()
+        pair_stats = None
+        if pairer is not None:
+            pairer.close()
+            pairer.report()
+            pair_stats = pairer.stats()
+
+        # Skew of the slave cameras to the master
+        skew = report_skew(topology, [sink.frame_log.path for sink in sinks])
+
+        write_capture_stats(os.path.join(seq_dir, 'capture_stats.json'), [sink.telemetry for sink in sinks],
+                            frame_rate=frame_rate, num_img=num_img, start_time=start_time, concurrent=concurrent,
+                            result=result, master=topology.master, serials=topology.serials, skew=skew,
+                            pairs=pair_stats, consumers=consumer_stats)
+
+        write_start_time(seq_dir, start_time, start_time_cam, FIRST_TS_list)
 
         # End acquisition for each camera
         #
@@ -211,12 +438,25 @@ def acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval=0):
     return result
 
 
-def run_multiple_cameras(cam_list, seq_dir, frame_rate, num_img, radar=True, interval=0):
+def run_multiple_cameras(cam_list, seq_dir, frame_rate, num_img, radar=True, interval=0,
+                         concurrent=False, num_writers=0, max_queue=64, raw=False, num_encoders=0, quality=95,
+                         verbose=True, drop_alarm=0.01, consumers=None, host_limit=None, link_policy='refuse'):
     """
     This function acts as the body of the example; please see NodeMapInfo example
     for more in-depth comments on setting up cameras.
 
     :param cam_list: List of cameras
+    :param concurrent: If True, grab and save the images of each camera in a dedicated thread.
+    :param num_writers: Number of writer threads per camera, 0 to save frames in the grab loop.
+    :param raw: If True, write raw frames to a container per camera instead of image files.
+    :param num_encoders: Number of JPEG encoder processes per camera, 0 to use the writer threads or the SDK.
+    :param quality: JPEG quality of the encoder processes.
+    :param verbose: If True, print a line for every frame.
+    :param drop_alarm: Fraction of missing frames which triggers a warning, 0 to disable it.
+    :param consumers: In-process frame consumers, see collector.frame_consumer.
+    :param host_limit: Bandwidth of the host controller in bytes/s, None for the lowest link speed.
+    :param link_policy: 'refuse' or 'warn' if the cameras need more bandwidth than the link budget, 'off' to
+        skip the bandwidth planning.
     :type cam_list: CameraList
     :return: True if successful, False otherwise.
     :rtype: bool
@@ -252,27 +492,34 @@ def run_multiple_cameras(cam_list, seq_dir, frame_rate, num_img, radar=True, int
         # *** LATER ***
         # Each camera needs to be deinitialized once all images have been
         # acquired.
+        topology = make_topology(cam_list)
+        topology.report()
+        profiles = topology.profiles(frame_rate)
         for i, cam in enumerate(cam_list):
 
             # Initialize camera
             cam.Init()
 
-            # Retrieve GenICam nodemap
-            nodemap = cam.GetNodeMap()
-            # Retrieve Stream Parameters device nodemap
-            s_node_map = cam.GetTLStreamNodeMap()
+        # Set the throughput limits so that all cameras fit into the link
+        if not check_bandwidth(cam_list, profiles, frame_rate, host_limit=host_limit, policy=link_policy):
+            for cam in cam_list:
+                cam.DeInit()
+            return False
 
-            # Configure chunk data
-            if configure_chunk_data(nodemap) is False:
-                return False
-            if configure_buffer(s_node_map) is False:
-                return False
+        appliers = []
+        for i, cam in enumerate(cam_list):
 
-        if configure_trigger_multi(cam_list, sync=True) is False:
-            return False
+            # Configure trigger, stream buffers, chunk data and frame rate
+            appliers.append(ProfileApplier(cam, i))
+            if appliers[i].apply(profiles[i]) is False:
+                return False
 
         # Acquire images on all cameras
-        result &= acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval)
+        result &= acquire_images(cam_list, seq_dir, frame_rate, num_img, radar, interval,
+                                 concurrent=concurrent, num_writers=num_writers, max_queue=max_queue, raw=raw,
+                                 num_encoders=num_encoders, quality=quality, verbose=verbose,
+                                 drop_alarm=drop_alarm, configure=False, topology=topology,
+                                 consumers=consumers)
 
         # Deinitialize each camera
         #
@@ -0,0 +1,327 @@
+try:
+    import PySpin
+except:
+    print("Warning: PySpin is not installed!")
+
+import os
+import time
+
+from .cam_config import disable_chunk_data
+from .cam_config import TriggerType, CameraProfile, ProfileApplier, make_topology
+from .cam_config import CAPTURE_MODES, read_image_format
+from .cam_config import print_device_info, print_device_info_multi
+from .bandwidth import check_bandwidth
+from . import cam_driver
+from . import cam_mul_driver
+from utils.calib import load_calib, adjust_calib, is_full_format, write_calib, write_image_formats
+
+
+class CaptureSession:
+    """
+    This class keeps the cameras initialized and configured across sequences.
+    The system instance, camera enumeration, Init and the camera profiles
+    (trigger, buffers, chunk entries, frame rate) are applied once in open(); each
+    run_sequence() only begins and ends the acquisition and writes the frames
+    to a new sequence directory. The time between the end of a sequence and
+    the start of the next one is reported as the inter-sequence gap.
+
+    Every sequence directory gets image_format.json with the binning and
+    region of interest of the cameras. If calibration files are given, they
+    are adjusted to the image format and written to the calib directory of
+    the sequence, so they stay valid for binned or cropped frames.
+
+    Usage:
+        session = CaptureSession(frame_rate)
+        if session.open():
+            for seq_dir in seq_dirs:
+                session.run_sequence(seq_dir, num_img)
+        session.close()
+    """
+
+    def __init__(self, frame_rate, sync=True, concurrent=False, num_writers=0, max_queue=64, raw=False,
+                 num_encoders=0, quality=95, verbose=True, drop_alarm=0.01, pixel_format=None,
+                 consumers=None, host_limit=None, link_policy='refuse', capture_mode=None, calib_yamls=None,
+                 radar_client=None):
+        """
+        :param frame_rate: Acquisition frame rate.
+        :param sync: If True, the cameras are hardware synchronized, otherwise each camera is
+            configured and captured on its own.
+        :param concurrent: If True, grab and save the images of each camera in a dedicated thread.
+        :param num_writers: Number of writer threads per camera, 0 to save frames in the grab loop.
+        :param max_queue: Maximum number of frames waiting to be written per camera.
+        :param raw: If True, write raw frames to a container per camera instead of image files.
+        :param num_encoders: Number of JPEG encoder processes per camera, 0 to use the writer threads or the SDK.
+        :param quality: JPEG quality of the encoder processes.
+        :param verbose: If True, print a line for every frame.
+        :param drop_alarm: Fraction of missing frames which triggers a warning, 0 to disable it.
+        :param pixel_format: Pixel format name of the cameras, None to keep the current one.
+        :param consumers: In-process frame consumers of every sequence, see collector.frame_consumer.
+        :param host_limit: Bandwidth of the host controller in bytes/s, None for the lowest link speed.
+        :param link_policy: 'refuse' or 'warn' if the cameras need more bandwidth than the link budget,
+            'off' to skip the bandwidth planning.
+        :param capture_mode: Binning and region of interest, a key of CAPTURE_MODES, None to keep them.
+        :param calib_yamls: Calibration files of the full sensor by camera index, to write the calibration
+            of the captured frames to every sequence.
+        :param radar_client: Client of a running radar service, which keeps the radar control warm across
+            sequences, None to start a MATLAB engine for every sequence.
+        :type calib_yamls: list
+        :type radar_client: RadarClient
+        """
+        self.frame_rate = frame_rate
+        self.sync = sync
+        self.options = {'num_writers': num_writers, 'max_queue': max_queue, 'raw': raw,
+                        'num_encoders': num_encoders, 'quality': quality, 'verbose': verbose,
+                        'drop_alarm': drop_alarm, 'consumers': consumers, 'radar_client': radar_client}
+        self.concurrent = concurrent
+        self.pixel_format = pixel_format
+        self.host_limit = host_limit
+        self.link_policy = link_policy
+        self.binning, self.roi_rows = CAPTURE_MODES[capture_mode] if capture_mode is not None else (None, None)
+        self.calib_yamls = calib_yamls
+        self.image_formats = []
+
+        self.system = None
+        self.cam_list = []
+        self.initialized = []
+        self.appliers = []
+        self.profiles = []
+        self.topology = None
+        self.single = False
+        self.setup_time = 0.0
+        self.last_end = None
+        self.gaps = []
+        self.n_sequences = 0
+
+    @property
+    def num_cameras(self):
+        return len(self.cam_list)
+
+    def open(self):
+        """
+        Get the cameras, initialize and configure them.
+
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        t_start = time.perf_counter()
+
+        # Retrieve singleton reference to system object
+        self.system = PySpin.System.GetInstance()
+
+        # Get current library version
+        version = self.system.GetLibraryVersion()
+        print('Library version: %d.%d.%d.%d' % (version.major, version.minor, version.type, version.build))
+
+        # Retrieve list of cameras from the system
+        cam_list = self.system.GetCameras()
+        num_cameras = cam_list.GetSize()
+        self.cam_list = sorted(cam_list, key=lambda x: x.GetUniqueID())
+        del cam_list
+
+        print('Number of cameras detected: %d' % num_cameras)
+
+        if num_cameras == 0:
+            print('Not enough cameras!')
+            return False
+
+        self.single = not self.sync or num_cameras == 1
+
+        try:
+            print('*** DEVICE INFORMATION ***\n')
+            for i, cam in enumerate(self.cam_list):
+                if self.single:
+                    print_device_info(cam.GetTLDeviceNodeMap())
+                else:
+                    print_device_info_multi(cam.GetTLDeviceNodeMap(), i)
+
+            if self.single:
+                self.profiles = [CameraProfile(TriggerType.SOFTWARE, frame_rate=self.frame_rate,
+                                               pixel_format=self.pixel_format, binning=self.binning,
+                                               roi_rows=self.roi_rows) for _ in self.cam_list]
+            else:
+                self.topology = make_topology(self.cam_list)
+                self.topology.report()
+                self.profiles = self.topology.profiles(self.frame_rate, pixel_format=self.pixel_format,
+                                                       binning=self.binning, roi_rows=self.roi_rows)
+
+            for cam in self.cam_list:
+                cam.Init()
+                self.initialized.append(cam)
+
+            if not self.check_bandwidth(self.profiles, self.frame_rate):
+                return False
+
+            for i, cam in enumerate(self.cam_list):
+                applier = ProfileApplier(cam, i)
+                self.appliers.append(applier)
+                if applier.apply(self.profiles[i]) is False:
+                    return False
+            self.read_image_formats()
+
+        except PySpin.SpinnakerException as ex:
+            print('Error: %s' % ex)
+            return False
+
+        self.setup_time = time.perf_counter() - t_start
+        print('Camera session ready in %.3f s.\n' % self.setup_time)
+        return True
+
+    def check_bandwidth(self, profiles, frame_rate):
+        """
+        Set the throughput limits of the profiles so that the cameras fit into
+        the link budget, see collector.bandwidth. In single mode the cameras
+        capture one after the other, so each camera is planned on its own.
+
+        :return: False if the configuration is refused, True otherwise.
+        :rtype: bool
+        """
+        if self.single:
+            groups = [[i] for i in range(self.num_cameras)]
+        else:
+            groups = [list(range(self.num_cameras))]
+        result = True
+        for group in groups:
+            result &= check_bandwidth([self.cam_list[i] for i in group], [profiles[i] for i in group], frame_rate,
+                                      host_limit=self.host_limit, policy=self.link_policy, cam_indices=group)
+        return result
+
+    def apply_profiles(self, profiles):
+        """
+        Apply new profiles between sequences, e.g. another frame rate. The
+        cached node handles are reused and only the changed nodes are written.
+
+        :param profiles: One profile per camera.
+        :type profiles: list
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        frame_rate = self.frame_rate
+        for profile in profiles:
+            if profile.frame_rate is not None:
+                frame_rate = profile.frame_rate
+                break
+        if not self.check_bandwidth(profiles, frame_rate):
+            return False
+
+        result = self.apply_cameras(profiles)
+        self.profiles = list(profiles)
+        self.read_image_formats()
+        for profile in self.profiles:
+            if profile.frame_rate is not None:
+                self.frame_rate = profile.frame_rate
+                break
+        return result
+
+    def apply_cameras(self, profiles):
+        result = True
+        for applier, profile in zip(self.appliers, profiles):
+            result &= applier.apply(profile)
+        return result
+
+    def read_image_formats(self):
+        self.image_formats = [read_image_format(cam) for cam in self.cam_list]
+        self.report_image_formats()
+
+    def report_image_formats(self):
+        for i, image_format in enumerate(self.image_formats):
+            if not is_full_format(image_format):
+                print('Camera %d: %dx%d frames, binning %dx%d, offset %d,%d'
+                      % (i, image_format['width'], image_format['height'], image_format['binning_x'],
+                         image_format['binning_y'], image_format['x_offset'], image_format['y_offset']))
+
+    def write_calibration(self, seq_dir):
+        """
+        Write image_format.json and the calibration files adjusted to the
+        image format to the sequence directory.
+        """
+        write_image_formats(seq_dir, self.image_formats)
+        if not self.calib_yamls:
+            return
+        calib_dir = os.path.join(seq_dir, 'calib')
+        if not os.path.exists(calib_dir):
+            os.makedirs(calib_dir)
+        for i, (calib_yaml, image_format) in enumerate(zip(self.calib_yamls, self.image_formats)):
+            try:
+                calib = adjust_calib(load_calib(calib_yaml), image_format)
+            except (IOError, ValueError) as ex:
+                print('WARNING!!! Camera %d: no calibration for the captured frames: %s' % (i, ex))
+                continue
+            name = os.path.splitext(os.path.basename(calib_yaml))[0]
+            write_calib(os.path.join(calib_dir, name + '.yaml'), calib, image_format, camera_name=name)
+
+    def run_sequence(self, seq_dir, num_img, radar=True, interval=0):
+        """
+        Capture one sequence with the configured cameras. The images
+        directories of seq_dir must exist.
+
+        :param seq_dir: Sequence directory.
+        :param num_img: Number of images per camera.
+        :param radar: If True, start the radar before the cameras.
+        :param interval: Start at the next integer multiple of interval minutes, 0 to start now.
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        self.begin_sequence(seq_dir)
+
+        result = True
+        if self.single:
+            for i, cam in enumerate(self.cam_list):
+                print('Running camera %d...' % i)
+                result &= cam_driver.acquire_images(cam, cam.GetNodeMap(), cam.GetTLDeviceNodeMap(), seq_dir,
+                                                    self.frame_rate, num_img, radar=radar and i == 0,
+                                                    interval=interval, configure=False, **self.options)
+        else:
+            result = cam_mul_driver.acquire_images(self.cam_list, seq_dir, self.frame_rate, num_img, radar, interval,
+                                                   concurrent=self.concurrent, configure=False,
+                                                   topology=self.topology, **self.options)
+
+        self.end_sequence()
+        return result
+
+    def begin_sequence(self, seq_dir):
+        t_start = time.perf_counter()
+        if self.last_end is not None:
+            gap = t_start - self.last_end
+            self.gaps.append(gap)
+            print('Inter-sequence gap: %.3f s' % gap)
+
+        self.write_calibration(seq_dir)
+
+    def end_sequence(self):
+        self.last_end = time.perf_counter()
+        self.n_sequences += 1
+
+    def close(self):
+        """
+        Disable chunk data, deinitialize the cameras and release the system.
+
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        result = True
+        for cam in self.initialized:
+            try:
+                if disable_chunk_data(cam.GetNodeMap()) is False:
+                    result = False
+                cam.DeInit()
+            except PySpin.SpinnakerException as ex:
+                print('Error: %s' % ex)
+                result = False
+            del cam
+        self.initialized = []
+        self.appliers = []
+
+        # Release reference to cameras before releasing system
+        self.cam_list = []
+        if self.system is not None:
+            self.system.ReleaseInstance()
+            self.system = None
+
+        self.report()
+        return result
+
+    def report(self):
+        print('Camera session: %d sequences, setup %.3f s' % (self.n_sequences, self.setup_time))
+        if len(self.gaps) > 0:
+            print('\tinter-sequence gap: mean %.3f s, min %.3f s, max %.3f s'
+                  % (sum(self.gaps) / len(self.gaps), min(self.gaps), max(self.gaps)))
@@ -0,0 +1,443 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import threading
+import numpy as np
+
+from .telemetry import LatencyHistogram
+
+# Raw data port of the DCA1000 on the host (192.168.33.30)
+DCA_DATA_PORT = 4098
+# Sequence number (4 bytes) and count of the bytes sent before the packet (6 bytes)
+HEADER_SIZE = 10
+MAX_PACKET_SIZE = 1472
+# format1 of archive/lua_datacapture: 128 complex samples, 4 receivers, 2 x 255 chirps
+FORMAT1_FRAME_SIZE = 128 * 4 * 2 * 255 * 4
+# Requested receive buffer of the socket, it covers more than 0.1 s at line rate
+RCVBUF_SIZE = 16 * 1024 * 1024
+# Packets are read from the socket in batches of up to RECV_BATCH packets or
+# BATCH_DELAY s, which are placed together
+RECV_BATCH = 256
+BATCH_DELAY = 0.002
+
+
+class _Frame:
+    def __init__(self, frame_size):
+        self.data = np.zeros(frame_size, dtype=np.uint8)
+        self.frame_id = 0
+        self.received = 0
+        self.first_ts = 0.0
+
+
+class FrameAssembler:
+    """
+    This class puts the packets of the DCA1000 raw data stream together into
+    frames, like Packet_Reorder_Zerofill.exe of mmWave Studio, but while
+    recording. Every packet carries the number of bytes sent before it, so
+    its payload is copied straight to its place in a preallocated frame
+    buffer, whatever order the packets arrive in. A frame is written when it
+    is complete, or when packets of window frames later arrive; the bytes of
+    lost packets stay zero. The frames are written in order by a writer
+    thread to a frame-aligned file (frame n at n * frame_size), and every
+    frame gets a line in the frame index:
+
+        frame_id received_bytes missing_bytes first_packet_time
+
+    Packets of a frame which has already been written are counted as late.
+    A byte count more than window frames before the window means that the
+    DCA1000 has started a new stream, e.g. the radar was armed again; the
+    recording then ends, as the frames of the new stream would overwrite
+    the recorded ones. A batch of packets in sequence is placed with one
+    copy, see add_batch.
+    """
+
+    def __init__(self, out_path, index_path, frame_size=FORMAT1_FRAME_SIZE, num_frames=0, window=4,
+                 num_buffers=16):
+        """
+        :param out_path: Path of the frame-aligned data file.
+        :param index_path: Path of the frame index.
+        :param frame_size: Bytes per frame.
+        :param num_frames: Number of frames to record, 0 for no limit.
+        :param window: Number of frames a frame waits for its missing packets.
+        :param num_buffers: Number of preallocated frame buffers, more than window.
+        """
+        self.frame_size = frame_size
+        self.num_frames = num_frames
+        self.window = window
+        self.free = queue.Queue()
+        for _ in range(max(num_buffers, window + 2)):
+            self.free.put(_Frame(frame_size))
+        self.frames = {}
+        self.base = None
+        self.first_frame = None
+        self.done = False
+        self.restarted = False
+
+        self.next_seq = None
+        self.n_packets = 0
+        self.n_bytes = 0
+        self.n_jumps = 0
+        self.n_out_of_order = 0
+        self.n_late = 0
+        self.n_buffer_waits = 0
+        self.n_frames = 0
+        self.n_complete = 0
+        self.missing_bytes = 0
+        self.first_seq = None
+        self.max_seq = 0
+        self.write_latency = LatencyHistogram()
+
+        self.out_file = open(out_path, 'wb')
+        self.index_file = open(index_path, 'w')
+        self.write_queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write, name='dca-writer')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def add(self, seq, byte_count, payload, ts):
+        """
+        Place the payload of a packet.
+
+        :param seq: Sequence number of the packet.
+        :param byte_count: Number of bytes sent before the packet.
+        :param payload: Payload of the packet.
+        :type payload: memoryview
+        :param ts: Receive time.
+        """
+        if self.done or self._restart(byte_count):
+            return
+        self.n_packets += 1
+        self.n_bytes += len(payload)
+        if self.next_seq is None:
+            self.first_seq = seq
+        elif seq > self.next_seq:
+            self.n_jumps += 1
+        elif seq < self.next_seq:
+            self.n_out_of_order += 1
+        if self.next_seq is None or seq >= self.next_seq:
+            self.next_seq = seq + 1
+            self.max_seq = seq
+        self._place(byte_count, payload, ts)
+
+    def add_batch(self, packets, lengths, ts):
+        """
+        Place a batch of packets. Packets which follow each other without a
+        gap and have the same size, as almost all packets do, are one piece
+        of the stream, and their payloads are copied at once; the others are
+        placed one by one.
+
+        :param packets: Received packets with header, one per row.
+        :type packets: np.ndarray
+        :param lengths: Size of every packet.
+        :type lengths: np.ndarray
+        :param ts: Receive time of the batch.
+        """
+        n = len(lengths)
+        seqs = packets[:, 0:4].copy().view('<u4').ravel()
+        counts = np.zeros((n, 8), dtype=np.uint8)
+        counts[:, 0:6] = packets[:, 4:HEADER_SIZE]
+        counts = counts.view('<u8').ravel()
+        # runs of packets in sequence
+        follows = ((np.diff(seqs) == 1) & (np.diff(counts) == lengths[:-1] - HEADER_SIZE)
+                   & (lengths[1:] == lengths[:-1]))
+        bounds = [0] + [int(k) + 1 for k in np.flatnonzero(~follows)] + [n]
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if self.done or self._restart(int(counts[a])):
+                return
+            first = int(seqs[a])
+            if b - a == 1 or (self.next_seq is not None and first < self.next_seq):
+                for k in range(a, b):
+                    self.add(int(seqs[k]), int(counts[k]), packets[k, HEADER_SIZE:lengths[k]], ts)
+                continue
+            size = int(lengths[a]) - HEADER_SIZE
+            if self.next_seq is None:
+                self.first_seq = first
+            elif first > self.next_seq:
+                self.n_jumps += 1
+            self.next_seq = int(seqs[b - 1]) + 1
+            self.max_seq = int(seqs[b - 1])
+            self.n_packets += b - a
+            self.n_bytes += (b - a) * size
+            self._place(int(counts[a]), packets[a:b, HEADER_SIZE:HEADER_SIZE + size].reshape(-1), ts)
+
+    def _restart(self, byte_count):
+        """
+        End the recording if the byte count has jumped back more than the window.
+
+        :return: True if the stream has restarted.
+        :rtype: bool
+        """
+        if self.base is None or byte_count // self.frame_size >= self.base - self.window:
+            return False
+        print('WARNING!!! DCA1000 stream restarted (byte count %d after frame %d), recording ended'
+              % (byte_count, self.base - self.first_frame))
+        # the frames of the old stream in the window are written as they are
+        last = max(self.frames.keys()) if self.frames else self.base - 1
+        while self.base <= last and not self.done:
+            self._flush()
+        self.restarted = True
+        self.done = True
+        return True
+
+    def _place(self, byte_count, payload, ts):
+        """
+        Copy a piece of the stream which starts byte_count bytes after the start to its frames.
+        """
+        if self.base is None:
+            self.base = self.first_frame = byte_count // self.frame_size
+
+        pos = 0
+        while pos < len(payload) and not self.done:
+            offset = byte_count + pos
+            frame_id = offset // self.frame_size
+            start = offset - frame_id * self.frame_size
+            n = min(len(payload) - pos, self.frame_size - start)
+            if frame_id < self.base:
+                self.n_late += 1
+            else:
+                frame = self.frames.get(frame_id)
+                if frame is None:
+                    frame = self._new_frame(frame_id, ts)
+                if frame is not None:
+                    frame.data[start:start + n] = payload[pos:pos + n]
+                    frame.received += n
+            pos += n
+
+        # write the complete frames at the start of the window in order
+        frame = self.frames.get(self.base)
+        while frame is not None and frame.received >= self.frame_size:
+            self._flush()
+            frame = self.frames.get(self.base)
+
+    def _new_frame(self, frame_id, ts):
+        # frames which waited for the whole window are written incomplete
+        while frame_id >= self.base + self.window and not self.done:
+            self._flush()
+        if self.done:
+            return None
+        try:
+            frame = self.free.get_nowait()
+        except queue.Empty:
+            # the writer is behind
+            self.n_buffer_waits += 1
+            frame = self.free.get()
+        frame.frame_id = frame_id
+        frame.received = 0
+        frame.first_ts = ts
+        self.frames[frame_id] = frame
+        return frame
+
+    def _flush(self):
+        """
+        Write the frame at the start of the window, zero-filled where packets are missing.
+        """
+        frame_id = self.base
+        frame = self.frames.pop(frame_id, None)
+        self.base += 1
+        self.n_frames += 1
+        received = frame.received if frame is not None else 0
+        if received >= self.frame_size:
+            self.n_complete += 1
+        self.missing_bytes += self.frame_size - received
+        self.write_queue.put((frame_id, frame, received))
+        if self.num_frames > 0 and self.base - self.first_frame >= self.num_frames:
+            self.done = True
+
+    def _write(self):
+        zeros = None
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            time_start = time.perf_counter()
+            frame_id, frame, received = item
+            if frame is None:
+                # no packet of this frame arrived
+                if zeros is None:
+                    zeros = np.zeros(self.frame_size, dtype=np.uint8)
+                self.out_file.write(zeros.data)
+                first_ts = 0.0
+            else:
+                self.out_file.write(frame.data.data)
+                first_ts = frame.first_ts
+                # the next frame in this buffer may be incomplete, its gaps must be zero
+                frame.data.fill(0)
+                self.free.put(frame)
+            self.index_file.write('%d %d %d %.6f\n' % (frame_id - self.first_frame, received,
+                                                       self.frame_size - received, first_ts))
+            self.write_latency.add(time.perf_counter() - time_start)
+
+    def close(self):
+        """
+        Write the frames left in the window and close the files.
+        """
+        if self.base is not None:
+            last = max(self.frames.keys()) if self.frames else self.base - 1
+            while self.base <= last and not self.done:
+                self._flush()
+        self.write_queue.put(None)
+        self.writer.join()
+        self.out_file.close()
+        self.index_file.close()
+
+    def summary(self):
+        expected = self.max_seq - self.first_seq + 1 if self.first_seq is not None else 0
+        return {'packets': self.n_packets, 'bytes': self.n_bytes, 'expected_packets': expected,
+                'lost_packets': max(0, expected - self.n_packets), 'seq_jumps': self.n_jumps,
+                'out_of_order': self.n_out_of_order, 'late_packets': self.n_late, 'frames': self.n_frames,
+                'complete_frames': self.n_complete, 'zero_filled_bytes': self.missing_bytes,
+                'buffer_waits': self.n_buffer_waits, 'stream_restarted': self.restarted, 'write': self.write_latency.summary()}
+
+
+class DCACapture:
+    """
+    This class records the raw data stream of a DCA1000 without mmWave
+    Studio: a receive thread reads the UDP packets from the raw data port
+    into a preallocated buffer and hands them to a FrameAssembler, which
+    reorders them, fills the gaps with zeros and writes adc_data.bin (frame
+    aligned) and adc_frames.txt (frame index) to the output directory.
+    The radar itself is still configured and started by mmWave Studio or the
+    DCA1000 CLI, with the recording of mmWave Studio not running.
+
+    The recording ends after num_frames frames, when no packet has arrived
+    for idle_timeout s after the first one, when the DCA1000 starts a new
+    stream, or with stop(). The packet loss
+    statistics are written to radar_capture_stats.json.
+
+    Usage:
+        capture = DCACapture(out_dir, num_frames=900)
+        capture.start()
+        capture.wait()
+        stats = capture.stop()
+    """
+
+    def __init__(self, out_dir, frame_size=FORMAT1_FRAME_SIZE, num_frames=0, host='', port=DCA_DATA_PORT,
+                 idle_timeout=2.0, rcvbuf=RCVBUF_SIZE, window=4, num_buffers=16):
+        """
+        :param out_dir: Output directory, it must exist.
+        :param frame_size: Bytes per frame, see the frame configuration of the radar.
+        :param num_frames: Number of frames to record, 0 for no limit.
+        :param host: Local address to listen on, '' for all, e.g. 192.168.33.30 of the DCA1000 link.
+        :param port: Raw data port.
+        :param idle_timeout: The recording ends when no packet has arrived for idle_timeout s, 0 to disable it.
+        :param rcvbuf: Requested receive buffer of the socket in bytes.
+        :param window: Number of frames a frame waits for its missing packets, see FrameAssembler.
+        :param num_buffers: Number of preallocated frame buffers.
+        """
+        self.out_dir = out_dir
+        self.idle_timeout = idle_timeout
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # beyond net.core.rmem_max, with CAP_NET_ADMIN on Linux
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUFFORCE, rcvbuf)
+        except (AttributeError, OSError):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.rcvbuf = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if sys.platform.startswith('linux'):
+            # Linux reports twice the usable size
+            self.rcvbuf //= 2
+        if self.rcvbuf < rcvbuf:
+            print('WARNING!!! UDP receive buffer is %d kB instead of %d kB, raise it with '
+                  'sysctl -w net.core.rmem_max=%d' % (self.rcvbuf // 1024, rcvbuf // 1024, rcvbuf))
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.assembler = FrameAssembler(os.path.join(out_dir, 'adc_data.bin'), os.path.join(out_dir, 'adc_frames.txt'),
+                                        frame_size=frame_size, num_frames=num_frames, window=window,
+                                        num_buffers=num_buffers)
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+        self.thread = None
+        self.time_first = None
+        self.time_last = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._receive, name='dca-receive')
+        self.thread.daemon = True
+        self.thread.start()
+        print('DCA1000 capture listening on port %d' % self.port)
+
+    def _receive(self):
+        # the packets are received into preallocated packet slots, then the batch is placed
+        packets = np.zeros((RECV_BATCH, MAX_PACKET_SIZE), dtype=np.uint8)
+        slots = [memoryview(packets[k]) for k in range(RECV_BATCH)]
+        lengths = np.zeros(RECV_BATCH, dtype=np.int64)
+        recv_into = self.sock.recv_into
+        add_batch = self.assembler.add_batch
+        clock = time.time
+        perf_counter = time.perf_counter
+        try:
+            while not self.stopped.is_set() and not self.assembler.done:
+                n = 0
+                batch_end = None
+                while n < RECV_BATCH:
+                    try:
+                        size = recv_into(slots[n])
+                    except socket.timeout:
+                        break
+                    if size > HEADER_SIZE:
+                        lengths[n] = size
+                        n += 1
+                    now = perf_counter()
+                    if batch_end is None:
+                        batch_end = now + BATCH_DELAY
+                    elif now > batch_end:
+                        break
+                if n == 0:
+                    if self.time_last is not None and 0 < self.idle_timeout < clock() - self.time_last:
+                        break
+                    continue
+                ts = clock()
+                if self.time_first is None:
+                    self.time_first = ts
+                self.time_last = ts
+                add_batch(packets[:n], lengths[:n], ts)
+        finally:
+            self.finished.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the recording has ended.
+
+        :return: True if it has ended, False after timeout.
+        :rtype: bool
+        """
+        return self.finished.wait(timeout)
+
+    def stop(self):
+        """
+        End the recording, write the rest of the frames and the statistics.
+
+        :return: Packet loss statistics, see FrameAssembler.summary.
+        :rtype: dict
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.sock.close()
+        self.assembler.close()
+
+        stats = self.assembler.summary()
+        elapsed = self.time_last - self.time_first if self.time_first is not None else 0.0
+        stats.update({'rcvbuf': self.rcvbuf, 'elapsed': elapsed,
+                      'mb_per_s': stats['bytes'] / elapsed / 1e6 if elapsed > 0 else 0.0})
+        with open(os.path.join(self.out_dir, 'radar_capture_stats.json'), 'w') as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+        self.report(stats)
+        return stats
+
+    def report(self, stats):
+        loss = stats['lost_packets'] / stats['expected_packets'] if stats['expected_packets'] > 0 else 0.0
+        print('DCA1000 capture: %d packets, %.1f MB in %.2f s (%.1f MB/s), socket buffer %d kB'
+              % (stats['packets'], stats['bytes'] / 1e6, stats['elapsed'], stats['mb_per_s'], stats['rcvbuf'] // 1024))
+        print('\tlost %d packets (%.3f%%), %d out of order, %d late'
+              % (stats['lost_packets'], loss * 100, stats['out_of_order'], stats['late_packets']))
+        print('\t%d frames, %d complete, %d bytes zero-filled, %d buffer waits, write p95 %.2f ms'
+              % (stats['frames'], stats['complete_frames'], stats['zero_filled_bytes'], stats['buffer_waits'],
+                 stats['write'].get('p95_ms', 0.0)))
+        if stats['lost_packets'] > 0:
+            print('WARNING!!! %d radar packets lost' % stats['lost_packets'])
@@ -0,0 +1,153 @@
+try:
+    import PySpin
+except:
+    print("Warning: PySpin is not installed!")
+
+import time
+
+# Transport layer stream counters polled by the monitor, with the telemetry
+# counter names they are reported as.
+STREAM_COUNTERS = [
+    ('StreamDroppedFrameCount', 'stream_dropped'),
+    ('StreamLostFrameCount', 'stream_lost'),
+    ('StreamBufferUnderrunCount', 'stream_underrun'),
+]
+
+
+class DropMonitor:
+    """
+    This class detects missing frames while capturing. Consecutive chunk
+    FrameIDs of the complete frames are compared, so a gap covers any frame
+    which did not reach the host complete: dropped by the camera or the
+    driver, lost in transport or incomplete (cause 'camera'). The stream
+    counters of the transport layer are polled every poll_interval seconds
+    to tell these causes apart. Complete frames which could not be stored
+    are reported with dropped() and kept as gaps of one frame with the
+    cause of the drop, e.g. 'writer_overflow'.
+
+    Gaps are kept as (frame_idx, frame_id, n_missing, cause). For a camera
+    gap, frame_idx and frame_id are the first complete frame after the gap;
+    for a dropped frame, they are the dropped frame. When more than
+    alarm_rate of the frames expected since the last poll are missing, a
+    warning is printed.
+    """
+
+    def __init__(self, stream_nodemap=None, cam_idx=None, alarm_rate=0.01, poll_interval=1.0, telemetry=None):
+        """
+        :param stream_nodemap: Transport layer stream nodemap, None to only check the FrameIDs.
+        :param cam_idx: Camera index, used in the warnings.
+        :param alarm_rate: Fraction of missing frames which triggers the alarm, 0 to disable it.
+        :param poll_interval: Interval of the stream counter polling and alarm check in seconds.
+        :param telemetry: CaptureTelemetry to store the counters in, optional.
+        :type stream_nodemap: INodeMap
+        """
+        self.cam_idx = cam_idx
+        self.alarm_rate = alarm_rate
+        self.poll_interval = poll_interval
+        self.telemetry = telemetry
+
+        # Resolve the stream counter nodes once, the counters are relative to
+        # their values when the monitor is created.
+        self.stream_nodes = []
+        if stream_nodemap is not None:
+            for node_name, counter_name in STREAM_COUNTERS:
+                node = PySpin.CIntegerPtr(stream_nodemap.GetNode(node_name))
+                if PySpin.IsAvailable(node) and PySpin.IsReadable(node):
+                    self.stream_nodes.append((node, counter_name, node.GetValue()))
+        self.stream_counts = dict((counter_name, 0) for _, counter_name in STREAM_COUNTERS)
+
+        self.gaps = []
+        self.first_frame_id = None
+        self.last_frame_id = None
+        self.n_missing = 0
+        self.n_dropped = 0
+        self.n_alarms = 0
+
+        self.last_poll = time.perf_counter()
+        self.window_first_id = None
+        self.window_missing = 0
+
+    def check(self, frame_idx, frame_id):
+        """
+        Check the FrameID of a complete frame for a gap.
+
+        :param frame_idx: Index of the frame in the sequence.
+        :param frame_id: Chunk FrameID of the frame.
+        :return: Number of frames missing before this frame.
+        :rtype: int
+        """
+        n_missing = 0
+        if self.last_frame_id is None:
+            self.first_frame_id = frame_id
+            self.window_first_id = frame_id
+        elif frame_id > self.last_frame_id + 1:
+            n_missing = frame_id - self.last_frame_id - 1
+            self.gaps.append((frame_idx, frame_id, n_missing, 'camera'))
+            self.n_missing += n_missing
+            self.window_missing += n_missing
+            if self.telemetry is not None:
+                self.telemetry.count('missing', n_missing)
+        self.last_frame_id = frame_id
+
+        now = time.perf_counter()
+        if now - self.last_poll >= self.poll_interval:
+            self.poll()
+            self.last_poll = now
+        return n_missing
+
+    def dropped(self, frame_idx, frame_id, cause):
+        """
+        Record a complete frame which could not be stored, after check().
+
+        :param frame_idx: Index of the frame in the sequence.
+        :param frame_id: Chunk FrameID of the frame.
+        :param cause: Cause of the drop, e.g. 'writer_overflow'.
+        """
+        self.gaps.append((frame_idx, frame_id, 1, cause))
+        self.n_missing += 1
+        self.n_dropped += 1
+        # counted as dropped, not missing, in the telemetry
+        self.window_missing += 1
+
+    def poll(self):
+        """
+        Read the stream counters and check the drop rate since the last poll.
+        """
+        for node, counter_name, base in self.stream_nodes:
+            self.stream_counts[counter_name] = node.GetValue() - base
+            if self.telemetry is not None:
+                self.telemetry.counters[counter_name] = self.stream_counts[counter_name]
+
+        if self.last_frame_id is None:
+            return
+        n_expected = self.last_frame_id - self.window_first_id + 1
+        if self.alarm_rate > 0 and n_expected > 0 and self.window_missing > self.alarm_rate * n_expected:
+            self.n_alarms += 1
+            name = 'Camera' if self.cam_idx is None else 'Camera %d' % self.cam_idx
+            print('WARNING!!! %s missed %d of the last %d frames (%.1f%%, alarm at %.1f%%): '
+                  'stream dropped %d, lost %d, underrun %d in total.'
+                  % (name, self.window_missing, n_expected, 100.0 * self.window_missing / n_expected,
+                     100.0 * self.alarm_rate, self.stream_counts['stream_dropped'],
+                     self.stream_counts['stream_lost'], self.stream_counts['stream_underrun']))
+        self.window_first_id = self.last_frame_id + 1
+        self.window_missing = 0
+
+    def write_gaps(self, path):
+        """
+        Write the gap list, one gap per line as "frame_idx frame_id n_missing cause".
+        """
+        with open(path, 'w') as f:
+            for frame_idx, frame_id, n_missing, cause in self.gaps:
+                f.write("%d %d %d %s\n" % (frame_idx, frame_id, n_missing, cause))
+
+    def report(self):
+        self.poll()
+        if self.first_frame_id is None:
+            return
+        n_expected = self.last_frame_id - self.first_frame_id + 1
+        name = 'Camera' if self.cam_idx is None else 'Camera %d' % self.cam_idx
+        print('%s: %d of %d frames missing in %d gaps, %d of them not stored '
+              '(stream dropped %d, lost %d, underrun %d)'
+              % (name, self.n_missing, n_expected, len(self.gaps), self.n_dropped,
+                 self.stream_counts['stream_dropped'], self.stream_counts['stream_lost'],
+                 self.stream_counts['stream_underrun']))
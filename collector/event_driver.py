@@ -0,0 +1,365 @@
+try:
+    import PySpin
+except:
+    print("Warning: PySpin is not installed!")
+
+import os
+import math
+import time
+import queue
+import socket
+import datetime
+import threading
+import numpy as np
+
+from .cam_config import ChunkReader
+from .cam_config import disable_chunk_data, ProfileApplier, make_topology
+from .cam_config import print_device_info_multi
+from .bandwidth import PIXEL_FORMAT_BITS, read_link_info
+from .ring_buffer import FrameRingBuffer
+from utils.frame_log import FrameLogWriter, export_timestamps_txt
+from utils.raw_container import RawFrameWriter
+
+
+class EventTrigger:
+    """
+    This class collects event triggers from several sources: the Enter key,
+    datagrams on a local UDP port and a periodic timer. Each trigger is queued
+    with its host time (time.perf_counter) and source. Typing q + Enter or
+    sending 'stop' to the UDP port ends the capture.
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def fire(self, source):
+        self.events.put((time.perf_counter(), source))
+
+    def stop(self):
+        self.stop_event.set()
+
+    def is_stopped(self):
+        return self.stop_event.is_set()
+
+    def wait(self, timeout):
+        """
+        Wait for the next trigger.
+
+        :return: Host time and source of the trigger, None on timeout.
+        :rtype: tuple
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _start(self, target, name, args=()):
+        thread = threading.Thread(target=target, name=name, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def start_keyboard(self):
+        def work():
+            while not self.stop_event.is_set():
+                try:
+                    line = input()
+                except EOFError:
+                    break
+                if line.strip().lower() == 'q':
+                    self.stop()
+                else:
+                    self.fire('key')
+        self._start(work, 'trigger-key')
+
+    def start_socket(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', port))
+        sock.settimeout(0.5)
+
+        def work():
+            while not self.stop_event.is_set():
+                try:
+                    data, _ = sock.recvfrom(1024)
+                except socket.timeout:
+                    continue
+                if data.strip().lower() == b'stop':
+                    self.stop()
+                else:
+                    self.fire('socket')
+            sock.close()
+        self._start(work, 'trigger-socket')
+
+    def start_timer(self, interval):
+        def work():
+            while not self.stop_event.wait(interval):
+                self.fire('timer')
+        self._start(work, 'trigger-timer')
+
+
+def ring_frame_format(width, height, pixel_format):
+    """
+    :return: Shape and data type of the frames (GetNDArray) of a pixel format in a ring buffer.
+    :rtype: tuple
+    """
+    bits = PIXEL_FORMAT_BITS.get(pixel_format)
+    if bits == 8:
+        return (height, width), np.uint8
+    if bits == 16 and pixel_format.endswith('16'):
+        return (height, width), np.uint16
+    if bits == 24:
+        return (height, width, 3), np.uint8
+    raise ValueError('Pixel format %s is not supported by the event capture.' % pixel_format)
+
+
+def grab_ring_worker(cam_idx, cam, ring, stop_event, state, grab_timeout=1000, max_errors=10):
+    """
+    This function grabs the images of one camera into its ring buffer until
+    stop_event is set. The ring is allocated by the caller, so grabbing a
+    frame is a copy into the ring only.
+
+    :param cam_idx: Camera index.
+    :param cam: Camera to acquire images from, acquisition must have begun.
+    :param ring: Ring buffer of the camera.
+    :type cam: CameraPtr
+    :type ring: FrameRingBuffer
+    """
+    state.update({'n_grabbed': 0, 'n_incomplete': 0, 'errors': []})
+    chunk_reader = ChunkReader(cam.GetNodeMap())
+    n_errors = 0
+    while not stop_event.is_set():
+        try:
+            image_result = cam.GetNextImage(grab_timeout)
+            try:
+                host_ts = time.perf_counter()
+                n_errors = 0
+                if image_result.IsIncomplete():
+                    state['n_incomplete'] += 1
+                else:
+                    ring.push(image_result.GetNDArray(), chunk_reader.read(image_result), host_ts)
+                    state['n_grabbed'] += 1
+            finally:
+                image_result.Release()
+
+        except PySpin.SpinnakerException as ex:
+            state['errors'].append(str(ex))
+            n_errors += 1
+            if n_errors >= max_errors:
+                print('Camera %d failed %d times in a row. Stopping...' % (cam_idx, n_errors))
+                stop_event.set()
+        except Exception as ex:
+            print('Camera %d error: %s. Stopping...' % (cam_idx, ex))
+            state['errors'].append(str(ex))
+            stop_event.set()
+
+
+def flush_event(rings, pixel_formats, event_dir, start_ts, end_ts, clock_offset):
+    """
+    Write the frames of all cameras grabbed between the host times start_ts and
+    end_ts to raw frame containers and frame logs in event_dir. The frames are
+    copied oldest first while the rings keep filling; a frame overwritten
+    before it was copied is counted as lost.
+
+    :param clock_offset: Offset from host time (time.perf_counter) to wall-clock time (time.time).
+    :return: Number of written and lost frames per camera.
+    :rtype: list
+    """
+    if not os.path.exists(event_dir):
+        os.makedirs(event_dir)
+    counts = []
+    first_host_ts = []
+    for i, ring in enumerate(rings):
+        suffix = '' if len(rings) == 1 else '_%d' % i
+        selected = ring.select(start_ts, end_ts)
+        raw_writer = RawFrameWriter(os.path.join(event_dir, 'raw_frames%s.bin' % suffix), ring.frames.shape[1:],
+                                    pixel_formats[i], max_frames=max(len(selected), 1))
+        frame_log = FrameLogWriter(os.path.join(event_dir, 'frame_log%s.bin' % suffix), flush_every=64)
+        scratch = np.empty(ring.frames.shape[1:], dtype=ring.frames.dtype)
+        n_lost = 0
+        first_ts = None
+        for slot, seq in selected:
+            # copy the frame out of the ring, then make sure the slot was not
+            # overwritten during the copy
+            meta = ring.meta[slot].copy()
+            np.copyto(scratch, ring.frames[slot])
+            if meta['seq'] != seq or not ring.is_valid(slot, seq):
+                n_lost += 1
+                continue
+            frame_idx = raw_writer.n_frames
+            raw_writer.append(scratch, frame_idx, meta['frame_id'], meta['device_ts'])
+            frame_log.append(frame_idx, meta['frame_id'], meta['device_ts'], meta['host_ts'], meta['exposure'],
+                             meta['gain'])
+            if first_ts is None:
+                first_ts = meta['host_ts']
+        raw_writer.close()
+        frame_log.close()
+        export_timestamps_txt(frame_log.path, os.path.join(event_dir, 'timestamps%s.txt' % suffix))
+        counts.append((raw_writer.n_frames, n_lost))
+        first_host_ts.append(first_ts)
+
+    with open(os.path.join(event_dir, 'start_time.txt'), 'w') as start_time_txt:
+        for ts in first_host_ts:
+            if ts is None:
+                start_time_txt.write("\n")
+                continue
+            time_str = datetime.datetime.fromtimestamp(ts + clock_offset).strftime('%Y-%m-%d %H:%M:%S.%f')
+            start_time_txt.write("%s\n" % time_str)
+    return counts
+
+
+def run_event_capture(cam_list, base_dir, seq_name, frame_rate, pre_seconds=10.0, post_seconds=5.0,
+                      flush_margin=3.0, keyboard=True, port=0, timer=0, max_events=0):
+    """
+    This function captures continuously into one ring buffer per camera and
+    writes an event sequence base_dir/seq_name_eventNNN for every trigger, with
+    the frames from pre_seconds before to post_seconds after the trigger. The
+    frames are written as raw frame containers, decode them with
+    preprocess/raw_decode.py.
+
+    The rings hold pre_seconds + post_seconds + flush_margin seconds of frames;
+    the margin is the time available to write an event before its oldest
+    frames are overwritten.
+
+    :param cam_list: List of cameras, sorted.
+    :param pre_seconds: Length of the window before the trigger in seconds.
+    :param post_seconds: Length of the window after the trigger in seconds.
+    :param flush_margin: Additional ring length in seconds for writing the event.
+    :param keyboard: If True, trigger with the Enter key.
+    :param port: Local UDP port to receive triggers on, 0 to disable.
+    :param timer: Trigger interval of the timer in seconds, 0 to disable.
+    :param max_events: Stop after this number of events, 0 for no limit.
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    result = True
+    capacity = int(math.ceil((pre_seconds + post_seconds + flush_margin) * frame_rate))
+
+    topology = make_topology(cam_list)
+    topology.report()
+    profiles = topology.profiles(frame_rate)
+    trigger = EventTrigger()
+    states = [{} for _ in cam_list]
+    workers = []
+    initialized = []
+    acquiring = []
+    appliers = []
+    # triggers which arrived while an event was written, after its window
+    pending = []
+    n_events = 0
+    try:
+        for i, cam in enumerate(cam_list):
+            result &= print_device_info_multi(cam.GetTLDeviceNodeMap(), i)
+            cam.Init()
+            initialized.append(i)
+            appliers.append(ProfileApplier(cam, i))
+            if appliers[i].apply(profiles[i]) is False:
+                return False
+
+        # the rings are allocated and touched before the acquisition, the grab loops only copy
+        rings = []
+        pixel_formats = []
+        for i, cam in enumerate(cam_list):
+            link = read_link_info(cam, i)
+            try:
+                shape, dtype = ring_frame_format(link.width, link.height, link.pixel_format)
+            except ValueError as ex:
+                print('WARNING!!! Camera %d: %s' % (i, ex))
+                return False
+            rings.append(FrameRingBuffer(capacity, shape, dtype))
+            pixel_formats.append(link.pixel_format)
+        ring_bytes = sum(ring.nbytes for ring in rings)
+        print('Ring buffers: %d frames (%.1f s) per camera, %.1f MB in total'
+              % (capacity, capacity / frame_rate, ring_bytes / 1e6))
+
+        # slave cameras first, so they are armed when the master starts
+        for i in topology.arm_order():
+            cam_list[i].BeginAcquisition()
+            acquiring.append(i)
+        clock_offset = time.time() - time.perf_counter()
+        for i, cam in enumerate(cam_list):
+            worker = threading.Thread(target=grab_ring_worker, name='ring-cam%d' % i,
+                                      args=(i, cam, rings[i], trigger.stop_event, states[i]))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        if keyboard:
+            trigger.start_keyboard()
+        if port > 0:
+            trigger.start_socket(port)
+        if timer > 0:
+            trigger.start_timer(timer)
+
+        print('Waiting for triggers (Enter%s%s), q + Enter to stop...'
+              % (', UDP port %d' % port if port > 0 else '', ', every %g s' % timer if timer > 0 else ''))
+
+        try:
+            while not trigger.is_stopped():
+                event = pending.pop(0) if pending else trigger.wait(0.5)
+                if event is None:
+                    continue
+                trigger_ts, source = event
+                event_name = '%s_event%03d' % (seq_name, n_events)
+                print('Event %s triggered by %s, recording %.1f s more...'
+                      % (event_name, source, max(0.0, trigger_ts + post_seconds - time.perf_counter())))
+
+                # keep capturing the post-event window
+                while time.perf_counter() < trigger_ts + post_seconds and not trigger.is_stopped():
+                    time.sleep(0.05)
+
+                time_start = time.perf_counter()
+                counts = flush_event(rings, pixel_formats, os.path.join(base_dir, event_name),
+                                     trigger_ts - pre_seconds, trigger_ts + post_seconds, clock_offset)
+                with open(os.path.join(base_dir, event_name, 'event.txt'), 'w') as event_txt:
+                    time_str = datetime.datetime.fromtimestamp(trigger_ts + clock_offset).strftime(
+                        '%Y-%m-%d %H:%M:%S.%f')
+                    event_txt.write("%s\n%s\n%.3f\n%.3f\n" % (time_str, source, pre_seconds, post_seconds))
+                for i, (n_written, n_lost) in enumerate(counts):
+                    print('Camera %d: %d frames written, %d lost' % (i, n_written, n_lost))
+                    if n_lost > 0:
+                        print('WARNING!!! Frames were overwritten while writing, increase the flush margin.')
+                        result = False
+                print('Event %s written in %.2f s' % (event_name, time.perf_counter() - time_start))
+                n_events += 1
+                if 0 < max_events <= n_events:
+                    break
+
+                # triggers during the post-event window belong to this event, later ones are new events
+                queued = trigger.wait(0)
+                while queued is not None:
+                    pending.append(queued)
+                    queued = trigger.wait(0)
+                n_merged = len(pending)
+                pending = [queued for queued in pending if queued[0] > trigger_ts + post_seconds]
+                n_merged -= len(pending)
+                if n_merged > 0:
+                    print('%d triggers during the window of event %s were merged into it.' % (n_merged, event_name))
+        except KeyboardInterrupt:
+            print('Interrupted.')
+    finally:
+        trigger.stop()
+        for worker in workers:
+            worker.join()
+        # tear down every camera which was initialized, also after a failed setup
+        for i in acquiring:
+            try:
+                cam_list[i].EndAcquisition()
+            except PySpin.SpinnakerException as ex:
+                print('Camera %d error: %s' % (i, ex))
+        for i in initialized:
+            try:
+                disable_chunk_data(cam_list[i].GetNodeMap())
+                cam_list[i].DeInit()
+            except PySpin.SpinnakerException as ex:
+                print('Camera %d error: %s' % (i, ex))
+        for i, state in enumerate(states):
+            if 'n_grabbed' in state:
+                print('Camera %d: %d frames grabbed, %d incomplete, %d errors'
+                      % (i, state['n_grabbed'], state['n_incomplete'], len(state['errors'])))
+
+    if pending:
+        print('WARNING!!! %d triggers were not recorded, the capture stopped before their events.' % len(pending))
+    print('%d events recorded.' % n_events)
+    return result
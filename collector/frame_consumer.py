@@ -0,0 +1,235 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from .telemetry import LatencyHistogram
+
+# Metadata handed to the consumers with every frame
+FrameInfo = namedtuple('FrameInfo', ['cam_idx', 'frame_idx', 'chunk', 'host_ts', 'pixel_format'])
+
+
+class FrameConsumer:
+    """
+    Base class of the in-process frame consumers of the acquisition loop.
+    Subclasses implement process(frame, info), which gets a read-only NumPy
+    view of the camera buffer and its FrameInfo.
+
+    The view is only valid during process(): the buffer is given back to the
+    camera afterwards. A consumer which keeps the frame must copy it.
+
+    If threaded is True, process() runs in a worker thread of the consumer,
+    fed by a queue of at most max_queue frames. Frames arriving while the
+    queue is full are skipped for this consumer, so a slow consumer never
+    blocks the acquisition; it holds at most max_queue camera buffers.
+    Otherwise process() is called in the grab loop and should be fast.
+    """
+    name = 'consumer'
+    threaded = False
+    max_queue = 2
+
+    def start(self, seq_dir):
+        """
+        Called once before the first frame of a sequence.
+
+        :param seq_dir: Sequence directory, None if not known.
+        """
+        pass
+
+    def process(self, frame, info):
+        """
+        :param frame: Read-only view of the frame, e.g. (height, width) for Bayer or mono formats.
+        :param info: Metadata of the frame.
+        :type frame: np.ndarray
+        :type info: FrameInfo
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Called once after the last frame.
+        """
+        pass
+
+    def stats(self):
+        """
+        :return: Statistics of the consumer for capture_stats.json, None if there are none.
+        :rtype: dict
+        """
+        return None
+
+
+class ImageRef:
+    """
+    Reference count of an unreleased camera image. The image is released
+    when the last holder calls release().
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.count = 1
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            self.count += 1
+
+    def release(self):
+        with self.lock:
+            self.count -= 1
+            done = self.count == 0
+        if done:
+            self.image.Release()
+            self.image = None
+
+
+class _ConsumerWorker:
+    def __init__(self, consumer, stats):
+        self.consumer = consumer
+        self.stats = stats
+        self.queue = queue.Queue(maxsize=max(1, consumer.max_queue))
+        self.thread = threading.Thread(target=self._work, name='consumer-%s' % consumer.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, info, ref, dispatcher = item
+            try:
+                dispatcher._process(self.stats, frame, info)
+            finally:
+                del frame
+                ref.release()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class FrameDispatcher:
+    """
+    This class hands every stored frame of the acquisition loop to the
+    registered consumers without copying it. One dispatcher can be shared by
+    the frame sinks of all cameras; the consumers tell the cameras apart by
+    FrameInfo.cam_idx.
+
+    dispatch() returns an ImageRef instead of releasing the image: the
+    acquisition loop releases its reference when it is done with the image,
+    and the image goes back to the camera when all consumers are finished.
+
+    The statistics are kept per registered consumer; consumers with the same
+    name are reported as name_N, N being their registration index.
+    """
+
+    def __init__(self, consumers=None, seq_dir=None):
+        """
+        :param consumers: Consumers to register.
+        :param seq_dir: Sequence directory, passed to the start() of the consumers.
+        """
+        self.seq_dir = seq_dir
+        # statistics of the consumers called in the grab loop, and the workers of the threaded ones
+        self.consumers = []
+        self.workers = []
+        self.stats = []
+        self.lock = threading.Lock()
+        self.closed = False
+        for consumer in (consumers or []):
+            self.register(consumer)
+
+    def register(self, consumer):
+        """
+        Register a consumer, before the acquisition starts.
+
+        :type consumer: FrameConsumer
+        """
+        name = consumer.name
+        if any(s['name'] == name for s in self.stats):
+            name = '%s_%d' % (name, len(self.stats))
+        stats = {'name': name, 'processed': 0, 'skipped': 0, 'errors': 0, 'time': LatencyHistogram(),
+                 'consumer': consumer}
+        self.stats.append(stats)
+        consumer.start(self.seq_dir)
+        if consumer.threaded:
+            self.workers.append(_ConsumerWorker(consumer, stats))
+        else:
+            self.consumers.append(stats)
+
+    def _process(self, stats, frame, info):
+        consumer = stats['consumer']
+        time_start = time.perf_counter()
+        try:
+            consumer.process(frame, info)
+        except Exception as ex:
+            with self.lock:
+                stats['errors'] += 1
+                if stats['errors'] == 1:
+                    print('Consumer %s error: %s' % (stats['name'], ex))
+            return
+        stats['time'].add(time.perf_counter() - time_start)
+        with self.lock:
+            stats['processed'] += 1
+
+    def dispatch(self, image, info):
+        """
+        Hand a complete, unreleased image to all consumers.
+
+        :param image: Grabbed image.
+        :param info: Metadata of the frame.
+        :type image: ImagePtr
+        :type info: FrameInfo
+        :return: Reference of the image, to be released by the caller instead of the image.
+        :rtype: ImageRef
+        """
+        ref = ImageRef(image)
+        if self.closed:
+            return ref
+        frame = image.GetNDArray().view()
+        frame.flags.writeable = False
+
+        for worker in self.workers:
+            ref.acquire()
+            try:
+                worker.queue.put_nowait((frame, info, ref, self))
+            except queue.Full:
+                ref.release()
+                with self.lock:
+                    worker.stats['skipped'] += 1
+        for stats in self.consumers:
+            self._process(stats, frame, info)
+        return ref
+
+    def close(self):
+        """
+        Wait for the queued frames, which releases their images, and close
+        the consumers. Call it before the acquisition ends.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self.workers:
+            worker.stop()
+        for stats in self.consumers + [worker.stats for worker in self.workers]:
+            try:
+                stats['consumer'].close()
+            except Exception as ex:
+                print('Consumer %s error: %s' % (stats['name'], ex))
+
+    def summary(self):
+        summary = {}
+        for s in self.stats:
+            name = s['name']
+            summary[name] = {'processed': s['processed'], 'skipped': s['skipped'], 'errors': s['errors'],
+                             'time': s['time'].summary()}
+            consumer_stats = s['consumer'].stats()
+            if consumer_stats is not None:
+                summary[name]['stats'] = consumer_stats
+        return summary
+
+    def report(self):
+        for s in self.stats:
+            t = s['time'].summary()
+            print('Consumer %s: %d frames processed, %d skipped, %d errors, p50 %.2f ms, max %.2f ms'
+                  % (s['name'], s['processed'], s['skipped'], s['errors'], t['p50_ms'], t['max_ms']))
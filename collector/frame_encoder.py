@@ -0,0 +1,180 @@
+import multiprocessing
+import threading
+
+from utils.image_codec import encode_task
+
+
+class FrameEncoderPool:
+    """
+    This class encodes and writes frames in a pool of processes, so JPEG
+    encoding is not limited to one core by the GIL. Frames are NumPy copies of
+    the raw sensor buffers (GetNDArray), debayered and encoded by OpenCV.
+
+    The number of frames waiting to be encoded is the queue depth. When it
+    reaches degrade_at * max_queue, the JPEG quality is lowered one step of the
+    quality ladder (quality, ..., min_quality); once the queue has drained to
+    restore_at * max_queue, the full quality is restored. The frames encoded at
+    reduced quality are kept in the reduced list as (frame_idx, quality).
+    """
+
+    def __init__(self, num_workers=2, max_queue=64, quality=95, min_quality=70, degrade_at=0.5, restore_at=0.1,
+                 block=False, name='encoder', telemetry=None):
+        """
+        :param num_workers: Number of encoder processes.
+        :param max_queue: Maximum number of frames waiting to be encoded.
+        :param quality: Nominal JPEG quality.
+        :param min_quality: Lowest JPEG quality used under backpressure.
+        :param degrade_at: Fraction of max_queue at which the quality is lowered.
+        :param restore_at: Fraction of max_queue at which the full quality is restored.
+        :param block: If True, block the grab loop when the queue is full; otherwise drop the frame.
+        :param name: Name of the pool in the report.
+        :param telemetry: CaptureTelemetry to record the encode and write times, optional.
+        """
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.quality = int(quality)
+        self.min_quality = min(int(min_quality), self.quality)
+        self.degrade_depth = max(1, int(degrade_at * self.max_queue))
+        self.restore_depth = max(1, int(restore_at * self.max_queue))
+        self.block = block
+        self.name = name
+        self.telemetry = telemetry
+
+        step = (self.quality - self.min_quality) / 2.0
+        self.ladder = sorted(set([self.quality, int(round(self.quality - step)), self.min_quality]), reverse=True)
+        self.level = 0
+        self.n_since_change = 0
+
+        self.pool = None
+        self.cond = threading.Condition()
+        self.pending = 0
+
+        self.high_water = 0
+        self.n_queued = 0
+        self.n_written = 0
+        self.n_overflow = 0
+        self.n_degrade = 0
+        self.bytes_written = 0
+        self.encode_times = []
+        self.reduced = []
+        self.errors = []
+
+    def start(self):
+        self.pool = multiprocessing.Pool(processes=self.num_workers)
+        return self
+
+    def _update_quality(self, depth):
+        """
+        Move along the quality ladder according to the queue depth. After a step
+        down, the queue gets degrade_depth frames to react before the next step.
+        """
+        self.n_since_change += 1
+        if depth >= self.degrade_depth and self.level < len(self.ladder) - 1 \
+                and (self.level == 0 or self.n_since_change >= self.degrade_depth):
+            self.level += 1
+            self.n_since_change = 0
+            self.n_degrade += 1
+        elif depth <= self.restore_depth and self.level > 0:
+            self.level = 0
+            self.n_since_change = 0
+        return self.ladder[self.level]
+
+    def put(self, frame, pixel_format, frame_idx, filename):
+        """
+        Submit a frame to the encoder processes.
+
+        :param frame: Raw frame, must not reference a camera buffer.
+        :param pixel_format: Pixel format name of the frame.
+        :param frame_idx: Index of the frame in the sequence.
+        :param filename: Output file name.
+        :type frame: np.ndarray
+        :return: True if the frame is queued, False if it is dropped due to overflow.
+        :rtype: bool
+        """
+        with self.cond:
+            if self.pending >= self.max_queue:
+                self.n_overflow += 1
+                if not self.block:
+                    return False
+                while self.pending >= self.max_queue:
+                    self.cond.wait()
+            self.pending += 1
+            depth = self.pending
+
+        if depth > self.high_water:
+            self.high_water = depth
+        quality = self._update_quality(depth)
+        if quality < self.quality:
+            self.reduced.append((frame_idx, quality))
+
+        self.pool.apply_async(encode_task, ((filename, frame, pixel_format, quality), ),
+                              callback=self._done, error_callback=self._failed(filename))
+        self.n_queued += 1
+        return True
+
+    def _done(self, result):
+        nbytes, encode_time, write_time = result
+        if self.telemetry is not None:
+            self.telemetry.record('encode', encode_time)
+            self.telemetry.record('write', write_time)
+        with self.cond:
+            self.pending -= 1
+            self.n_written += 1
+            self.bytes_written += nbytes
+            self.encode_times.append(encode_time)
+            self.cond.notify()
+
+    def _failed(self, filename):
+        def error_callback(ex):
+            with self.cond:
+                self.pending -= 1
+                self.errors.append('%s: %s' % (filename, ex))
+                self.cond.notify()
+        return error_callback
+
+    def close(self):
+        """
+        Wait for all queued frames to be written and stop the encoder processes.
+
+        :return: Statistics of this encoder pool.
+        :rtype: dict
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        return self.stats()
+
+    def stats(self):
+        return {
+            'num_workers': self.num_workers,
+            'max_queue': self.max_queue,
+            'queued': self.n_queued,
+            'written': self.n_written,
+            'overflow': self.n_overflow,
+            'high_water': self.high_water,
+            'errors': len(self.errors),
+            'quality': self.quality,
+            'reduced': len(self.reduced),
+            'min_quality_used': min([q for _, q in self.reduced] + [self.quality]),
+            'bytes_written': self.bytes_written,
+        }
+
+    def report(self):
+        stats = self.stats()
+        print('Encoder queue: %d/%d frames written by %d processes, high-water mark %d/%d, overflow %d, errors %d'
+              % (stats['written'], stats['queued'], stats['num_workers'], stats['high_water'],
+                 stats['max_queue'], stats['overflow'], stats['errors']))
+        if len(self.encode_times) > 0:
+            print('Encoder: %.2f ms per frame on average, %.1f MB written'
+                  % (sum(self.encode_times) / len(self.encode_times) * 1e3, self.bytes_written / 1e6))
+        for err in self.errors[:10]:
+            print('\tEncode error: %s' % err)
+        if len(self.reduced) > 0:
+            print('WARNING!!! %d frames encoded at reduced quality (down to %d, nominal %d).'
+                  % (stats['reduced'], stats['min_quality_used'], self.quality))
+        if self.n_overflow > 0:
+            if self.block:
+                print('WARNING!!! Encoder queue was full %d times, grabbing was stalled.' % self.n_overflow)
+            else:
+                print('WARNING!!! %d frames dropped because the encoder queue was full.' % self.n_overflow)
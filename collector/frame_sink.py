@@ -0,0 +1,269 @@
+try:
+    import PySpin
+except:
+    print("Warning: PySpin is not installed!")
+
+import os
+import time
+
+from .cam_config import ChunkReader
+from .drop_monitor import DropMonitor
+from .frame_consumer import FrameInfo
+from .frame_encoder import FrameEncoderPool
+from .frame_writer import FrameWriterPool
+from .telemetry import CaptureTelemetry
+from utils.frame_log import FrameLogWriter, export_timestamps_txt
+from utils.raw_container import RawFrameWriter
+
+
+class FrameSink:
+    """
+    This class is the per-camera output of the acquisition loop. For each
+    complete image it reads the chunk data, stores the image and, if it was
+    stored, appends a record to the frame log, so every record has its image.
+    The image is either
+
+    - saved directly by the SDK (default),
+    - deep-copied and queued to a writer pool (num_writers > 0),
+    - copied as NumPy frame and encoded by a pool of processes (num_encoders > 0),
+    - copied into a shared frame ring, written by the writer processes of a
+      process-per-camera capture (ring), or
+    - copied as raw sensor buffer into a raw frame container (raw=True).
+
+    With the encoder pool, the frames encoded at reduced JPEG quality under
+    backpressure are listed in reduced_quality.txt as "frame_idx quality".
+
+    Gaps in the chunk FrameIDs and the frames which could not be stored are
+    detected while capturing and listed in frame_gaps.txt as
+    "frame_idx frame_id n_missing cause", see DropMonitor.
+
+    If a StereoPairer is set as pairer, every stored frame is added to it.
+    If a FrameDispatcher is set as dispatcher, every stored frame is handed
+    to its consumers, and the acquisition loop must give the image back with
+    release() instead of image.Release().
+
+    A frame which cannot be stored, e.g. when the write queue is full, is
+    dropped: it gets no frame log record, it is listed with its cause in the
+    telemetry, and close() returns False.
+
+    The timing of the capture stages and the counters of the camera are
+    collected in the telemetry attribute (CaptureTelemetry).
+
+    Output names get the suffix _N for camera N, or no suffix if cam_idx is None.
+    """
+
+    def __init__(self, nodemap, seq_dir, num_img, frame_rate, cam_idx=None, num_writers=0, max_queue=64, raw=False,
+                 num_encoders=0, quality=95, stream_nodemap=None, drop_alarm=0.01, ring=None):
+        """
+        :param nodemap: Device nodemap of the camera.
+        :param seq_dir: Sequence directory.
+        :param num_img: Number of images of the sequence.
+        :param frame_rate: Acquisition frame rate, used as flush interval of the frame log.
+        :param cam_idx: Camera index, None for the single camera layout.
+        :param num_writers: Number of writer threads, 0 to save images in the grab loop.
+        :param max_queue: Maximum number of frames waiting to be written.
+        :param raw: If True, write raw frames to a container instead of image files.
+        :param num_encoders: Number of encoder processes, takes precedence over num_writers.
+        :param quality: Nominal JPEG quality of the encoder processes.
+        :param stream_nodemap: Transport layer stream nodemap to poll the stream counters, optional.
+        :param drop_alarm: Fraction of missing frames which triggers a warning, 0 to disable it.
+        :param ring: Shared frame ring of the camera, takes precedence over the encoder processes and writer threads.
+        :type nodemap: INodeMap
+        :type stream_nodemap: INodeMap
+        :type ring: SharedFrameRing
+        """
+        suffix = '' if cam_idx is None else '_%d' % cam_idx
+        self.cam_idx = cam_idx
+        self.num_img = num_img
+        self.image_dir = os.path.join(seq_dir, 'images' + suffix)
+        self.timestamps_path = os.path.join(seq_dir, 'timestamps%s.txt' % suffix)
+        self.reduced_quality_path = os.path.join(seq_dir, 'reduced_quality%s.txt' % suffix)
+        self.gaps_path = os.path.join(seq_dir, 'frame_gaps%s.txt' % suffix)
+
+        self.telemetry = CaptureTelemetry(cam_idx)
+
+        # Resolve chunk data nodes once for all frames
+        self.chunk_reader = ChunkReader(nodemap)
+        self.drop_monitor = DropMonitor(stream_nodemap, cam_idx=cam_idx, alarm_rate=drop_alarm,
+                                        telemetry=self.telemetry)
+        # Per-frame metadata is written to a binary log and exported to the
+        # timestamps text file at the end of the sequence.
+        self.frame_log = FrameLogWriter(os.path.join(seq_dir, 'frame_log%s.bin' % suffix),
+                                        flush_every=max(1, int(frame_rate)))
+
+        self.raw_path = os.path.join(seq_dir, 'raw_frames%s.bin' % suffix) if raw else None
+        self.raw_writer = None
+        self.writer = None
+        self.encoder = None
+        self.ring = None if raw else ring
+        if num_encoders > 0 and not raw and self.ring is None:
+            name = 'encoder' if cam_idx is None else 'encoder-cam%d' % cam_idx
+            self.encoder = FrameEncoderPool(num_workers=num_encoders, max_queue=max_queue, quality=quality,
+                                            name=name, telemetry=self.telemetry).start()
+        elif num_writers > 0 and not raw and self.ring is None:
+            name = 'writer' if cam_idx is None else 'writer-cam%d' % cam_idx
+            self.writer = FrameWriterPool(num_workers=num_writers, max_queue=max_queue, name=name,
+                                          telemetry=self.telemetry).start()
+
+        self.pairer = None
+        self.dispatcher = None
+        self.image_ref = None
+        self.pixel_format = None
+        self.first_ts = None
+        self.n_stored = 0
+        self.n_dropped = 0
+
+    def grabbed(self, grab_start, host_ts, incomplete=False):
+        """
+        Count a grabbed image, complete or not.
+
+        :param grab_start: Host time (time.perf_counter) when GetNextImage was called.
+        :param host_ts: Host time when GetNextImage returned.
+        :param incomplete: True if the image is incomplete.
+        """
+        self.telemetry.record('grab_wait', host_ts - grab_start)
+        self.telemetry.count('grabbed')
+        if incomplete:
+            self.telemetry.count('incomplete')
+
+    def put(self, image_result, frame_idx, host_ts):
+        """
+        Store and log a complete, unreleased image.
+
+        :param image_result: Grabbed image.
+        :param frame_idx: Index of the frame in the sequence.
+        :param host_ts: Host time (time.perf_counter) when the image was grabbed.
+        :return: Chunk data of the image.
+        :rtype: ChunkInfo
+        """
+        time_start = time.perf_counter()
+        chunk = self.chunk_reader.read(image_result)
+        time_chunk = time.perf_counter()
+        self.telemetry.record('chunk_read', time_chunk - time_start)
+        if self.first_ts is None:
+            self.first_ts = chunk.timestamp
+        self.drop_monitor.check(frame_idx, chunk.frame_id)
+        n_stored = self.n_stored
+        stored = True
+
+        if self.raw_path is not None:
+            # Copy the raw sensor buffer into the preallocated container
+            image_data = image_result.GetNDArray()
+            if self.raw_writer is None:
+                self.raw_writer = RawFrameWriter(self.raw_path, image_data.shape,
+                                                 image_result.GetPixelFormatName(), max_frames=self.num_img)
+            if self.raw_writer.append(image_data, frame_idx, chunk.frame_id, chunk.timestamp):
+                self.n_stored += 1
+            else:
+                stored = False
+                self._drop(frame_idx, chunk, 'raw_full')
+        else:
+            filename = os.path.join(self.image_dir, '%010d.jpg' % frame_idx)
+            if self.ring is not None:
+                # Copy the frame into the shared ring, it is encoded by the writer processes
+                if self.ring.push(image_result.GetNDArray(), frame_idx, chunk, host_ts):
+                    self.n_stored += 1
+                else:
+                    stored = False
+                    self._drop(frame_idx, chunk, 'ring_full')
+                self.telemetry.queue_depth.add(self.ring.depth())
+            elif self.encoder is not None:
+                # Copy the frame out of the camera buffer, it is encoded in another process
+                if self.encoder.put(image_result.GetNDArray().copy(), image_result.GetPixelFormatName(),
+                                    frame_idx, filename):
+                    self.n_stored += 1
+                else:
+                    stored = False
+                    self._drop(frame_idx, chunk, 'encoder_overflow')
+                self.telemetry.queue_depth.add(self.encoder.pending)
+            elif self.writer is not None:
+                # Deep copy the image so that the camera buffer can be released
+                # before the image is encoded and written by the writer pool.
+                if self.writer.put(PySpin.Image.Create(image_result), filename):
+                    self.n_stored += 1
+                else:
+                    stored = False
+                    self._drop(frame_idx, chunk, 'writer_overflow')
+                self.telemetry.queue_depth.add(self.writer.queue.qsize())
+            else:
+                image_result.Save(filename)
+                self.telemetry.record('save', time.perf_counter() - time_chunk)
+                self.n_stored += 1
+        self.telemetry.record('store', time.perf_counter() - time_chunk)
+        if stored:
+            self.frame_log.append_chunk(frame_idx, chunk, host_ts)
+        if self.pairer is not None and self.n_stored > n_stored:
+            self.pairer.add(self.cam_idx, frame_idx, chunk)
+        if self.dispatcher is not None:
+            if self.pixel_format is None:
+                self.pixel_format = image_result.GetPixelFormatName()
+            self.image_ref = self.dispatcher.dispatch(
+                image_result, FrameInfo(self.cam_idx, frame_idx, chunk, host_ts, self.pixel_format))
+
+        return chunk
+
+    def _drop(self, frame_idx, chunk, cause):
+        """
+        Account for a complete frame which could not be stored.
+        """
+        self.n_dropped += 1
+        self.telemetry.dropped_frames.append((frame_idx, cause))
+        self.drop_monitor.dropped(frame_idx, chunk.frame_id, cause)
+
+    def release(self, image_result):
+        """
+        Release a grabbed image. If it was handed to the consumers of the
+        dispatcher, it goes back to the camera when they are finished.
+        """
+        image_ref = self.image_ref
+        self.image_ref = None
+        if image_ref is not None:
+            image_ref.release()
+            if image_ref.image is None or image_ref.image is image_result:
+                return
+        image_result.Release()
+
+    def close(self):
+        """
+        Flush all outputs: wait for the queued images, close the raw container
+        and the frame log and export the timestamps text file.
+
+        :return: True if all images were stored and written, False otherwise.
+        :rtype: bool
+        """
+        result = True
+        if self.encoder is not None:
+            self.encoder.close()
+            if self.cam_idx is not None:
+                print('Camera %d:' % self.cam_idx)
+            self.encoder.report()
+            result &= len(self.encoder.errors) == 0
+            self.telemetry.pools['encoder'] = self.encoder.stats()
+            with open(self.reduced_quality_path, 'w') as f:
+                for frame_idx, quality in self.encoder.reduced:
+                    f.write("%010d %d\n" % (frame_idx, quality))
+        if self.writer is not None:
+            self.writer.close()
+            if self.cam_idx is not None:
+                print('Camera %d:' % self.cam_idx)
+            self.writer.report()
+            result &= len(self.writer.errors) == 0
+            self.telemetry.pools['writer'] = self.writer.stats()
+        if self.raw_writer is not None:
+            self.raw_writer.close()
+            print('%d raw frames stored in %s' % (self.raw_writer.n_frames, self.raw_path))
+        self.frame_log.close()
+        export_timestamps_txt(self.frame_log.path, self.timestamps_path)
+        self.drop_monitor.report()
+        self.drop_monitor.write_gaps(self.gaps_path)
+
+        self.telemetry.counters['stored'] = self.n_stored
+        self.telemetry.counters['dropped'] = self.n_dropped
+        self.telemetry.report()
+        if self.n_dropped > 0:
+            name = 'Camera' if self.cam_idx is None else 'Camera %d' % self.cam_idx
+            dropped = [frame_idx for frame_idx, _ in self.telemetry.dropped_frames]
+            print('WARNING!!! %s dropped %d frames: %s%s' % (name, self.n_dropped, ' '.join(map(str, dropped[:20])),
+                                                            ' ...' if len(dropped) > 20 else ''))
+            result = False
+        return result
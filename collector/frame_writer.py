@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+
+
+def save_image(image, filename):
+    """
+    Default save function of the writer pool: let the SDK encode and write the image.
+    """
+    image.Save(filename)
+
+
+class FrameWriterPool:
+    """
+    This class decouples frame grabbing from disk writes. The grab loop puts
+    frames into a bounded in-memory queue and a pool of writer threads encodes
+    and saves them. The high-water mark of the queue and the number of
+    overflowed frames are kept for the end-of-sequence report.
+
+    Frames put into the pool must not be tied to a camera buffer, i.e. they
+    should be deep copies (PySpin.Image.Create) of the grabbed images so that
+    the grabbed images can be released right away.
+    """
+
+    def __init__(self, num_workers=2, max_queue=64, block=False, save_fn=save_image, name='writer', telemetry=None):
+        """
+        :param num_workers: Number of writer threads.
+        :param max_queue: Maximum number of frames waiting in the queue.
+        :param block: If True, block the grab loop when the queue is full; otherwise drop the frame.
+        :param save_fn: Function called as save_fn(frame, filename) by the writers.
+        :param name: Name prefix of the writer threads.
+        :param telemetry: CaptureTelemetry to record the save times, optional.
+        """
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.block = block
+        self.save_fn = save_fn
+        self.name = name
+        self.telemetry = telemetry
+
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self.workers = []
+        self.lock = threading.Lock()
+
+        self.high_water = 0
+        self.n_queued = 0
+        self.n_written = 0
+        self.n_overflow = 0
+        self.errors = []
+
+    def start(self):
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name='%s-%d' % (self.name, i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        return self
+
+    def put(self, frame, filename):
+        """
+        Put a frame into the write queue.
+
+        :return: True if the frame is queued, False if it is dropped due to overflow.
+        :rtype: bool
+        """
+        try:
+            self.queue.put_nowait((frame, filename))
+        except queue.Full:
+            self.n_overflow += 1
+            if not self.block:
+                return False
+            self.queue.put((frame, filename))
+
+        self.n_queued += 1
+        depth = self.queue.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            frame, filename = item
+            try:
+                time_start = time.perf_counter()
+                self.save_fn(frame, filename)
+                if self.telemetry is not None:
+                    self.telemetry.record('save', time.perf_counter() - time_start)
+                with self.lock:
+                    self.n_written += 1
+            except Exception as ex:
+                with self.lock:
+                    self.errors.append('%s: %s' % (filename, ex))
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        """
+        Wait for all queued frames to be written and stop the writers.
+
+        :return: Statistics of this writer pool.
+        :rtype: dict
+        """
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        return self.stats()
+
+    def stats(self):
+        return {
+            'num_workers': self.num_workers,
+            'max_queue': self.max_queue,
+            'queued': self.n_queued,
+            'written': self.n_written,
+            'overflow': self.n_overflow,
+            'high_water': self.high_water,
+            'errors': len(self.errors),
+        }
+
+    def report(self):
+        stats = self.stats()
+        print('Writer queue: %d/%d frames written by %d workers, high-water mark %d/%d, overflow %d, errors %d'
+              % (stats['written'], stats['queued'], stats['num_workers'], stats['high_water'],
+                 stats['max_queue'], stats['overflow'], stats['errors']))
+        for err in self.errors[:10]:
+            print('\tWrite error: %s' % err)
+        if self.n_overflow > 0:
+            if self.block:
+                print('WARNING!!! Write queue was full %d times, grabbing was stalled.' % self.n_overflow)
+            else:
+                print('WARNING!!! %d frames dropped because the write queue was full.' % self.n_overflow)
@@ -0,0 +1,205 @@
+import os
+import time
+import tempfile
+import numpy as np
+
+from .frame_consumer import FrameConsumer
+
+# Preview file: a small memory-mapped file shared by the capture process
+# (PreviewConsumer) and the viewer process (PreviewReader, see run_preview.py).
+# Every camera has a slot with the latest downscaled BGR frame.
+#
+# Layout:
+#   header (PREVIEW_HEADER_SIZE bytes), see PREVIEW_HEADER_DTYPE
+#   slot headers (num_slots records), see PREVIEW_SLOT_DTYPE
+#   slot images (num_slots images of max_height x max_width x 3 bytes, page aligned)
+#
+# The slots are guarded by a sequence lock: the writer makes seq odd while it
+# writes a slot and even again when it is done. A reader copies the slot and
+# retries if seq was odd or changed meanwhile, so the writer never waits.
+PREVIEW_MAGIC = b'CRPRV001'
+PREVIEW_HEADER_SIZE = 4096
+PREVIEW_PAGE_SIZE = 4096
+PREVIEW_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('num_slots', '<u4'),
+    ('max_height', '<u4'),
+    ('max_width', '<u4'),
+    ('pid', '<u4'),
+    ('image_offset', '<u8'),
+])
+PREVIEW_SLOT_DTYPE = np.dtype([
+    ('seq', '<u8'),         # sequence lock, odd while the slot is written
+    ('frame_idx', '<u8'),   # index of the frame in the sequence
+    ('frame_id', '<u8'),    # chunk FrameID from the camera
+    ('wall_ts', '<f8'),     # wall-clock time (time.time) of the update in s
+    ('height', '<u4'),      # size of the preview image in the slot
+    ('width', '<u4'),
+    ('exposure', '<u4'),    # exposure time in us
+    ('gain', '<i4'),        # gain in 0.001 dB
+    ('mean', '<f4'),        # mean brightness of the preview image, 0..255
+    ('saturated', '<f4'),   # fraction of saturated pixels of the preview image
+])
+
+# Positions of the red, green and blue pixels in the 2x2 block of a Bayer pattern
+BAYER_OFFSETS = {
+    'BayerRG8': ((0, 0), (0, 1), (1, 1)),
+    'BayerBG8': ((1, 1), (0, 1), (0, 0)),
+    'BayerGR8': ((0, 1), (0, 0), (1, 0)),
+    'BayerGB8': ((1, 0), (0, 0), (0, 1)),
+}
+
+
+def default_preview_path():
+    return os.path.join(tempfile.gettempdir(), 'cr_preview.bin')
+
+
+def _align(size, alignment=PREVIEW_PAGE_SIZE):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def _layout(num_slots, max_height, max_width):
+    image_offset = _align(PREVIEW_HEADER_SIZE + num_slots * PREVIEW_SLOT_DTYPE.itemsize)
+    return image_offset, image_offset + num_slots * max_height * max_width * 3
+
+
+class PreviewConsumer(FrameConsumer):
+    """
+    This consumer publishes a downscaled copy of the latest frame of every
+    camera to the preview file at most rate times per second, for a viewer in
+    another process (run_preview.py). Frames between two updates return right
+    away. An update reads every step-th 2x2 Bayer block straight into the
+    shared BGR image, without debayering the frame, so it costs a few strided
+    copies of a few hundred kB in the grab loop. The capture process never
+    waits for the viewer.
+    """
+    name = 'preview'
+
+    def __init__(self, path=None, num_slots=4, rate=4.0, max_width=480, max_height=360):
+        """
+        :param path: Path of the preview file, default cr_preview.bin in the temporary directory.
+        :param num_slots: Number of cameras which can be previewed.
+        :param rate: Maximum number of updates per second and camera.
+        :param max_width: Maximum width of the preview images.
+        :param max_height: Maximum height of the preview images.
+        """
+        self.path = path if path is not None else default_preview_path()
+        self.num_slots = num_slots
+        self.interval = 1.0 / rate
+        self.max_height = max_height
+        self.max_width = max_width
+        self.last_update = [None] * num_slots
+        self.steps = [None] * num_slots
+        self.n_updates = 0
+
+        image_offset, total_size = _layout(num_slots, max_height, max_width)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != total_size:
+            with open(self.path, 'ab') as f:
+                f.truncate(total_size)
+        self.mm = np.memmap(self.path, dtype=np.uint8, mode='r+', shape=(total_size, ))
+        header = np.zeros((1, ), dtype=PREVIEW_HEADER_DTYPE)
+        header[0] = (PREVIEW_MAGIC, num_slots, max_height, max_width, os.getpid(), image_offset)
+        self.slots = self.mm[PREVIEW_HEADER_SIZE:PREVIEW_HEADER_SIZE + num_slots * PREVIEW_SLOT_DTYPE.itemsize] \
+            .view(PREVIEW_SLOT_DTYPE)
+        self.slots[:] = 0
+        self.images = self.mm[image_offset:].reshape(num_slots, max_height, max_width, 3)
+        self.mm[:PREVIEW_HEADER_DTYPE.itemsize] = header.view(np.uint8)
+        print('Preview: %s, %d slots of %dx%d, %.1f Hz' % (self.path, num_slots, max_width, max_height, rate))
+
+    def start(self, seq_dir):
+        # the frame size may change between sequences
+        self.steps = [None] * self.num_slots
+
+    def _step(self, frame, pixel_format):
+        # Bayer frames are sampled by whole 2x2 blocks
+        height, width = frame.shape[:2]
+        unit = 2 if pixel_format in BAYER_OFFSETS else 1
+        step = unit
+        while height // step > self.max_height or width // step > self.max_width:
+            step += unit
+        return step
+
+    def process(self, frame, info):
+        slot = 0 if info.cam_idx is None else info.cam_idx
+        if slot >= self.num_slots:
+            return
+        if self.last_update[slot] is not None and info.host_ts - self.last_update[slot] < self.interval:
+            return
+        self.last_update[slot] = info.host_ts
+
+        if self.steps[slot] is None:
+            self.steps[slot] = self._step(frame, info.pixel_format)
+        step = self.steps[slot]
+        offsets = BAYER_OFFSETS.get(info.pixel_format)
+        height, width = frame.shape[0] // step, frame.shape[1] // step
+
+        header = self.slots[slot]
+        seq = int(header['seq'])
+        self.slots['seq'][slot] = seq + 1
+        image = self.images[slot, :height, :width]
+        if offsets is not None:
+            for channel, (y, x) in zip((2, 1, 0), offsets):
+                image[..., channel] = frame[y:height * step:step, x:width * step:step]
+        elif frame.ndim == 3:
+            image[...] = frame[:height * step:step, :width * step:step, :3]
+            if info.pixel_format == 'RGB8':
+                image[...] = image[..., ::-1]
+        else:
+            image[...] = frame[:height * step:step, :width * step:step, np.newaxis]
+        chunk = info.chunk
+        self.slots[slot] = (seq + 1, info.frame_idx, chunk.frame_id, time.time(), height, width, chunk.exposure,
+                            chunk.gain, image.mean(), np.count_nonzero(image >= 250) / float(image.size))
+        self.slots['seq'][slot] = seq + 2
+        self.n_updates += 1
+
+    def stats(self):
+        return {'updates': self.n_updates}
+
+
+class PreviewReader:
+    """
+    Reader of the preview file in the viewer process.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: Path of the preview file, default cr_preview.bin in the temporary directory.
+        """
+        self.path = path if path is not None else default_preview_path()
+        header = np.fromfile(self.path, dtype=PREVIEW_HEADER_DTYPE, count=1)
+        if len(header) == 0 or header[0]['magic'] != PREVIEW_MAGIC:
+            raise ValueError('%s is not a preview file.' % self.path)
+        self.num_slots = int(header[0]['num_slots'])
+        self.max_height = int(header[0]['max_height'])
+        self.max_width = int(header[0]['max_width'])
+        image_offset, total_size = _layout(self.num_slots, self.max_height, self.max_width)
+        self.mm = np.memmap(self.path, dtype=np.uint8, mode='r', shape=(total_size, ))
+        self.slots = self.mm[PREVIEW_HEADER_SIZE:PREVIEW_HEADER_SIZE + self.num_slots * PREVIEW_SLOT_DTYPE.itemsize] \
+            .view(PREVIEW_SLOT_DTYPE)
+        self.images = self.mm[image_offset:].reshape(self.num_slots, self.max_height, self.max_width, 3)
+        self.n_retries = 0
+
+    def read(self, slot, last_seq=0, max_tries=10):
+        """
+        Copy the latest preview image of a camera.
+
+        :param slot: Camera index.
+        :param last_seq: Sequence number of the last image read, to skip unchanged slots.
+        :param max_tries: Number of attempts while the slot is being written.
+        :return: Slot header (np.void) and image, or None if there is no new image.
+        :rtype: tuple
+        """
+        for _ in range(max_tries):
+            seq = int(self.slots['seq'][slot])
+            if seq == 0 or seq == last_seq:
+                return None
+            if seq % 2 == 1:
+                self.n_retries += 1
+                time.sleep(0.001)
+                continue
+            header = self.slots[slot].copy()
+            image = self.images[slot, :header['height'], :header['width']].copy()
+            if int(self.slots['seq'][slot]) == seq:
+                return header, image
+            self.n_retries += 1
+        return None
@@ -0,0 +1,534 @@
+try:
+    import PySpin
+except:
+    print("Warning: PySpin is not installed!")
+
+import os
+import time
+import signal
+import tempfile
+import multiprocessing
+
+from .cam_config import ChunkInfo, ProfileApplier, disable_chunk_data, get_serial_number, make_topology
+from .cam_config import read_image_format, print_device_info_multi
+from .bandwidth import PIXEL_FORMAT_BITS, read_link_info, check_bandwidth
+from .cam_session import CaptureSession
+from .cam_mul_driver import acquire_camera_worker, stereo_right, report_skew, write_start_time
+from .frame_sink import FrameSink
+from .shared_ring import SharedFrameRing, remove_ring
+from .stereo_pairer import StereoPairer
+from .telemetry import write_capture_stats
+from .radar_driver import start_radar
+from utils.frame_log import load_frame_log
+from utils.image_codec import write_image
+
+
+def ring_frame_shape(width, height, pixel_format):
+    """
+    :return: Shape of the frames of a pixel format in a shared frame ring.
+    :rtype: tuple
+    """
+    bits = PIXEL_FORMAT_BITS.get(pixel_format, 8)
+    if bits == 8:
+        return height, width
+    if bits == 24:
+        return height, width, 3
+    raise ValueError('Pixel format %s is not supported by the process capture.' % pixel_format)
+
+
+def camera_process(cam_idx, serial, conn, semaphores, abort, ring_path, capacity):
+    """
+    Main function of the process of one camera. The process owns the camera:
+    it initializes it, applies the profiles it gets from the coordinator and
+    grabs the frames of every sequence into its shared frame ring. Commands
+    and replies go through conn:
+
+    - ('apply', profile) -> ('applied', ok, image_format, ring_path, link_info)
+    - ('start', seq_dir, num_img, frame_rate, options) -> ('armed', time) and ('done', state)
+    - ('quit', ) ends the process.
+
+    A new ring is created whenever the frame size or pixel format changes.
+
+    :param cam_idx: Camera index.
+    :param serial: Serial number of the camera.
+    :param conn: End of the pipe to the coordinator.
+    :param semaphores: One semaphore per writer process, released for every frame of the writer.
+    :param abort: Event which stops the grab loop.
+    :param ring_path: Path of the ring files, without the generation suffix, None for raw frame containers.
+    :param capacity: Number of frames in the ring.
+    """
+    # Ctrl+C is handled by the coordinator, which stops the cameras through abort
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    system = PySpin.System.GetInstance()
+    cam_list = system.GetCameras()
+    cams = [c for c in cam_list if get_serial_number(c) == serial]
+    cam = cams[0] if len(cams) > 0 else None
+    del cams
+    cam_list.Clear()
+    if cam is None:
+        conn.send(('error', 'Camera %s not found' % serial))
+        system.ReleaseInstance()
+        return
+
+    ring = None
+    generation = 0
+    try:
+        cam.Init()
+        applier = ProfileApplier(cam, cam_idx)
+        conn.send(('init', read_link_info(cam, cam_idx)))
+        while True:
+            msg = conn.recv()
+            if msg[0] == 'apply':
+                ok = applier.apply(msg[1])
+                link = read_link_info(cam, cam_idx)
+                if ring_path is not None:
+                    shape = ring_frame_shape(link.width, link.height, link.pixel_format)
+                    if ring is None or ring.shape != shape or ring.pixel_format != link.pixel_format:
+                        if ring is not None:
+                            ring.close()
+                        generation += 1
+                        ring = SharedFrameRing('%s_%d.bin' % (ring_path, generation), shape, link.pixel_format,
+                                               capacity, len(semaphores)).set_semaphores(semaphores)
+                conn.send(('applied', ok, read_image_format(cam), ring.path if ring is not None else None, link))
+            elif msg[0] == 'start':
+                _, seq_dir, num_img, frame_rate, options = msg
+                conn.send(('done', run_camera_sequence(cam_idx, cam, ring, conn, abort, seq_dir, num_img,
+                                                       frame_rate, **options)))
+            elif msg[0] == 'quit':
+                break
+    except (PySpin.SpinnakerException, ValueError) as ex:
+        print('Camera %d error: %s' % (cam_idx, ex))
+        conn.send(('error', str(ex)))
+    finally:
+        if ring is not None:
+            ring.close()
+        try:
+            if cam.IsStreaming():
+                cam.EndAcquisition()
+            disable_chunk_data(cam.GetNodeMap())
+            cam.DeInit()
+        except PySpin.SpinnakerException as ex:
+            print('Camera %d error: %s' % (cam_idx, ex))
+        del cam
+        system.ReleaseInstance()
+
+
+def run_camera_sequence(cam_idx, cam, ring, conn, abort, seq_dir, num_img, frame_rate, raw=False, verbose=True,
+                        drop_alarm=0.01):
+    """
+    Grab one sequence in the camera process, see camera_process.
+
+    :return: State of the grab loop, see acquire_camera_worker, with the
+        telemetry summary and the frame log of the camera.
+    :rtype: dict
+    """
+    if ring is not None:
+        ring.begin_sequence(seq_dir)
+    sink = FrameSink(cam.GetNodeMap(), seq_dir, num_img, frame_rate, cam_idx=cam_idx, raw=raw,
+                     stream_nodemap=cam.GetTLStreamNodeMap(), drop_alarm=drop_alarm, ring=ring)
+    state = {'result': False, 'first_ts': None, 'n_saved': 0, 'n_incomplete': 0, 'n_grabbed': 0, 'errors': []}
+    try:
+        cam.BeginAcquisition()
+        conn.send(('armed', time.time()))
+        acquire_camera_worker(cam_idx, cam, num_img, sink, abort, state, verbose=verbose)
+        cam.EndAcquisition()
+    except PySpin.SpinnakerException as ex:
+        print('Camera %d error: %s' % (cam_idx, ex))
+        state.update({'result': False, 'errors': state['errors'] + [str(ex)]})
+    state['result'] &= sink.close()
+    state['errors'] = state['errors'][:10]
+    state['telemetry'] = sink.telemetry.summary()
+    state['frame_log'] = sink.frame_log.path
+    return state
+
+
+def writer_process(cam_idx, ring_path, reader, semaphores, quality=95):
+    """
+    Main function of a writer process: debayer, encode and write the frames
+    of one reader of a shared frame ring to images_N of their sequence, until
+    the ring is stopped and all its frames are written.
+
+    :param cam_idx: Camera index.
+    :param ring_path: Path of the ring file.
+    :param reader: Index of the reader.
+    :param semaphores: Semaphores of the readers of the ring.
+    :param quality: JPEG quality.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = SharedFrameRing(ring_path).set_semaphores(semaphores)
+    sequence = None
+    image_dir = None
+    n_errors = 0
+    while True:
+        item = ring.next_frame(reader)
+        if item is None:
+            if ring.stopped():
+                break
+            continue
+        record, frame = item
+        if record['sequence'] != sequence:
+            sequence = record['sequence']
+            image_dir = os.path.join(ring.seq_dir(), 'images_%d' % cam_idx)
+        time_start = time.perf_counter()
+        try:
+            nbytes = write_image(os.path.join(image_dir, '%010d.jpg' % record['frame_idx']), frame,
+                                 ring.pixel_format, quality)
+            ring.done(reader, nbytes, time.perf_counter() - time_start)
+        except Exception as ex:
+            ring.done(reader, busy_time=time.perf_counter() - time_start, error=True)
+            n_errors += 1
+            if n_errors <= 10:
+                print('Camera %d writer %d error: %s' % (cam_idx, reader, ex))
+        del frame
+    ring.close()
+
+
+class ProcessCaptureSession(CaptureSession):
+    """
+    This class captures the hardware-synchronized cameras with one process
+    per camera, so the per-frame Python work of the cameras (grab loop, chunk
+    data, frame log) does not compete for one interpreter. Every camera
+    process owns its camera and copies the frames into a shared frame ring
+    (collector.shared_ring), which is emptied by num_writers writer processes
+    per camera that encode the JPEG files. This process is the coordinator:
+    it plans the link bandwidth, hands out the profiles, starts the radar,
+    arms the slaves before the master and collects the results; the stereo
+    pairs, the skew and capture_stats.json are computed from the frame logs
+    after each sequence. With raw=True the camera processes write the raw
+    frame containers themselves and no writer processes are used.
+
+    The camera processes are started once in open() and kept for all
+    sequences, like the cameras of a CaptureSession. In-process frame
+    consumers are not supported.
+    """
+
+    def __init__(self, frame_rate, num_writers=2, max_queue=64, raw=False, quality=95, verbose=True,
+                 drop_alarm=0.01, pixel_format=None, host_limit=None, link_policy='refuse', capture_mode=None,
+                 calib_yamls=None, pair_tolerance=0.001, radar_client=None):
+        """
+        :param frame_rate: Acquisition frame rate.
+        :param num_writers: Number of writer processes per camera.
+        :param max_queue: Number of frames in the ring of every camera.
+        :param raw: If True, write raw frames to a container per camera instead of image files.
+        :param quality: JPEG quality of the writer processes.
+        :param pair_tolerance: Maximum timestamp difference of a stereo pair in seconds.
+
+        See CaptureSession for the other parameters.
+        """
+        CaptureSession.__init__(self, frame_rate, sync=True, num_writers=num_writers, max_queue=max_queue, raw=raw,
+                                quality=quality, verbose=verbose, drop_alarm=drop_alarm, pixel_format=pixel_format,
+                                host_limit=host_limit, link_policy=link_policy, capture_mode=capture_mode,
+                                calib_yamls=calib_yamls, radar_client=radar_client)
+        self.num_writers = 0 if raw else max(1, num_writers)
+        self.pair_tolerance = pair_tolerance
+        self.cameras = []
+        self.links = []
+        self.abort = None
+
+    @property
+    def num_cameras(self):
+        return len(self.cameras)
+
+    def open(self):
+        """
+        Get the serial numbers of the cameras, start the camera processes and
+        configure the cameras.
+
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        t_start = time.perf_counter()
+
+        # The cameras are only enumerated here; each camera process opens its camera
+        system = PySpin.System.GetInstance()
+        version = system.GetLibraryVersion()
+        print('Library version: %d.%d.%d.%d' % (version.major, version.minor, version.type, version.build))
+        cam_list = system.GetCameras()
+        cams = sorted(cam_list, key=lambda x: x.GetUniqueID())
+        print('Number of cameras detected: %d' % len(cams))
+        print('*** DEVICE INFORMATION ***\n')
+        for i, cam in enumerate(cams):
+            print_device_info_multi(cam.GetTLDeviceNodeMap(), i)
+        self.topology = make_topology(cams)
+        del cam
+        del cams
+        cam_list.Clear()
+        system.ReleaseInstance()
+
+        if self.topology.num_cameras == 0:
+            print('Not enough cameras!')
+            return False
+        self.topology.report()
+        self.profiles = self.topology.profiles(self.frame_rate, pixel_format=self.pixel_format,
+                                               binning=self.binning, roi_rows=self.roi_rows)
+
+        self.abort = multiprocessing.Event()
+        ring_dir = tempfile.gettempdir()
+        for i, serial in enumerate(self.topology.serials):
+            conn, child_conn = multiprocessing.Pipe()
+            semaphores = [multiprocessing.Semaphore(0) for _ in range(self.num_writers)]
+            ring_path = None
+            if self.num_writers > 0:
+                ring_path = os.path.join(ring_dir, 'cr_ring_%d_cam%d' % (os.getpid(), i))
+            process = multiprocessing.Process(target=camera_process, name='camera-%d' % i,
+                                              args=(i, serial, child_conn, semaphores, self.abort, ring_path,
+                                                    self.options['max_queue']))
+            process.daemon = True
+            process.start()
+            self.cameras.append({'process': process, 'conn': conn, 'semaphores': semaphores, 'ring': None,
+                                 'ring_path': None, 'writers': [], 'last_stats': None})
+
+        self.links = []
+        for i in range(self.num_cameras):
+            msg = self._recv(i)
+            if msg is None or msg[0] != 'init':
+                return False
+            self.links.append(msg[1])
+
+        if not self.check_bandwidth(self.profiles, self.frame_rate):
+            return False
+        if not self.apply_cameras(self.profiles):
+            return False
+        self.read_image_formats()
+
+        self.setup_time = time.perf_counter() - t_start
+        print('Camera session ready in %.3f s (%d camera processes, %d writer processes per camera).\n'
+              % (self.setup_time, self.num_cameras, self.num_writers))
+        return True
+
+    def _recv(self, cam_idx, timeout=None):
+        """
+        Wait for the next message of a camera process.
+
+        :return: Message, None if the process failed or the timeout expired.
+        :rtype: tuple
+        """
+        cam = self.cameras[cam_idx]
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not cam['conn'].poll(0.1):
+            if not cam['process'].is_alive():
+                print('Camera %d: camera process ended unexpectedly.' % cam_idx)
+                return None
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+        msg = cam['conn'].recv()
+        if msg[0] == 'error':
+            print('Camera %d: %s' % (cam_idx, msg[1]))
+            return None
+        return msg
+
+    def check_bandwidth(self, profiles, frame_rate):
+        return check_bandwidth(None, profiles, frame_rate, host_limit=self.host_limit, policy=self.link_policy,
+                               links=self.links)
+
+    def apply_cameras(self, profiles):
+        for cam, profile in zip(self.cameras, profiles):
+            cam['conn'].send(('apply', profile))
+        result = True
+        self.image_formats = [None] * self.num_cameras
+        for i, cam in enumerate(self.cameras):
+            msg = self._recv(i)
+            if msg is None:
+                result = False
+                continue
+            _, ok, image_format, ring_path, link = msg
+            result &= ok
+            self.image_formats[i] = image_format
+            self.links[i] = link
+            if ring_path is not None and ring_path != cam['ring_path']:
+                self._start_writers(i, ring_path)
+        return result
+
+    def read_image_formats(self):
+        # the image formats are sent by the camera processes
+        self.report_image_formats()
+
+    def _start_writers(self, cam_idx, ring_path):
+        cam = self.cameras[cam_idx]
+        self._stop_writers(cam_idx)
+        cam['ring'] = SharedFrameRing(ring_path).set_semaphores(cam['semaphores'])
+        cam['ring_path'] = ring_path
+        cam['last_stats'] = cam['ring'].stats()
+        for reader in range(self.num_writers):
+            writer = multiprocessing.Process(target=writer_process, name='writer-cam%d-%d' % (cam_idx, reader),
+                                             args=(cam_idx, ring_path, reader, cam['semaphores'],
+                                                   self.options['quality']))
+            writer.daemon = True
+            writer.start()
+            cam['writers'].append(writer)
+
+    def _stop_writers(self, cam_idx):
+        cam = self.cameras[cam_idx]
+        if cam['ring'] is None:
+            return
+        cam['ring'].stop()
+        for writer in cam['writers']:
+            writer.join()
+        cam['ring'].close()
+        remove_ring(cam['ring_path'])
+        cam['ring'] = None
+        cam['ring_path'] = None
+        cam['writers'] = []
+
+    def _wait_written(self, cam_idx):
+        """
+        Wait until the writer processes of a camera have written all frames of its ring.
+
+        :return: Statistics of the ring for the frames since the last call.
+        :rtype: dict
+        """
+        cam = self.cameras[cam_idx]
+        while not cam['ring'].drained() and any(writer.is_alive() for writer in cam['writers']):
+            time.sleep(0.005)
+        stats = cam['ring'].stats()
+        last = cam['last_stats']
+        cam['last_stats'] = stats
+        for key in ('pushed', 'overflow', 'written', 'errors', 'bytes_written', 'busy_time'):
+            stats[key] -= last[key]
+        if not cam['ring'].drained():
+            print('WARNING!!! Camera %d: the writer processes ended with %d frames left in the ring.'
+                  % (cam_idx, cam['ring'].depth()))
+        print('Camera %d ring: %d frames written by %d writer processes (%.1f ms per frame), overflow %d, errors %d'
+              % (cam_idx, stats['written'], self.num_writers,
+                 stats['busy_time'] / max(1, stats['written'] + stats['errors']) * 1e3, stats['overflow'],
+                 stats['errors']))
+        if stats['overflow'] > 0:
+            print('WARNING!!! %d frames of camera %d dropped because the ring was full, use more writer processes.'
+                  % (stats['overflow'], cam_idx))
+        return stats
+
+    def run_sequence(self, seq_dir, num_img, radar=True, interval=0):
+        """
+        Capture one sequence with the camera processes. The images
+        directories of seq_dir must exist.
+
+        :param seq_dir: Sequence directory.
+        :param num_img: Number of images per camera.
+        :param radar: If True, start the radar before the cameras.
+        :param interval: Start at the next integer multiple of interval minutes, 0 to start now.
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        self.begin_sequence(seq_dir)
+        print('*** IMAGE ACQUISITION ***\n')
+        topology = self.topology
+
+        if radar:
+            # Init and run radar, through the radar service if a client is given
+            start_radar(interval, self.options['radar_client'])
+
+        # record start time
+        start_time = time.time()
+
+        # slave cameras first, so they are armed for the first trigger of the master
+        self.abort.clear()
+        options = {'raw': self.options['raw'], 'verbose': self.options['verbose'],
+                   'drop_alarm': self.options['drop_alarm']}
+        result = True
+        armed = []
+        for i in topology.arm_order():
+            self.cameras[i]['conn'].send(('start', seq_dir, num_img, self.frame_rate, options))
+            msg = self._recv(i)
+            if msg is None or msg[0] != 'armed':
+                print('Camera %d could not start acquiring. Aborting...' % i)
+                self.abort.set()
+                result = False
+                if msg is None:
+                    continue
+            armed.append(i)
+        # record start time
+        start_time_cam = time.time()
+        print('Camera started acquiring images...')
+
+        states = [None] * self.num_cameras
+        for i in armed:
+            while True:
+                try:
+                    msg = self._recv(i)
+                    break
+                except KeyboardInterrupt:
+                    print('Interrupted. Stopping all cameras...')
+                    self.abort.set()
+            if msg is not None and msg[0] == 'done':
+                states[i] = msg[1]
+                print('Camera %d: %d/%d images grabbed, %d saved, %d incomplete, %d errors'
+                      % (i, states[i]['n_grabbed'], num_img, states[i]['n_saved'], states[i]['n_incomplete'],
+                         len(states[i]['errors'])))
+        if any(state is None for state in states):
+            print('WARNING!!! Not all camera processes finished the sequence.')
+            self.end_sequence()
+            return False
+
+        # Wait for the writer processes
+        for i, state in enumerate(states):
+            result &= state['result']
+            if self.num_writers > 0:
+                ring_stats = self._wait_written(i)
+                state['telemetry']['ring'] = ring_stats
+                state['telemetry']['counters']['dropped'] += ring_stats['errors']
+                state['telemetry']['counters']['stored'] -= ring_stats['errors']
+                result &= ring_stats['errors'] == 0
+
+        # Pair the frames of the left (master) and right cameras
+        pair_stats = None
+        if len(topology.slaves) > 0 and not self.options['raw']:
+            pair_stats = self.pair_frames(seq_dir, [state['frame_log'] for state in states])
+
+        # Skew of the slave cameras to the master
+        skew = report_skew(topology, [state['frame_log'] for state in states])
+
+        write_capture_stats(os.path.join(seq_dir, 'capture_stats.json'),
+                            [state['telemetry'] for state in states], frame_rate=self.frame_rate, num_img=num_img,
+                            start_time=start_time, concurrent=True, processes=True, result=result,
+                            master=topology.master, serials=topology.serials, skew=skew, pairs=pair_stats)
+        write_start_time(seq_dir, start_time, start_time_cam, [state['first_ts'] for state in states])
+
+        self.end_sequence()
+        return result
+
+    def pair_frames(self, seq_dir, frame_log_paths):
+        """
+        Pair the written frames of the left (master) and right cameras from
+        their frame logs, in the order they were grabbed, see StereoPairer.
+
+        :return: Statistics of the pairs.
+        :rtype: dict
+        """
+        left, right = self.topology.master, stereo_right(self.topology)
+        pairer = StereoPairer(left, right, tolerance=self.pair_tolerance,
+                              pairs_path=os.path.join(seq_dir, 'pairs.txt'),
+                              unpaired_path=os.path.join(seq_dir, 'unpaired.txt'))
+        records = []
+        for cam_idx in (left, right):
+            for record in load_frame_log(frame_log_paths[cam_idx]):
+                records.append((float(record['host_ts']), cam_idx, record))
+        records.sort(key=lambda x: x[0])
+        for _, cam_idx, record in records:
+            pairer.add(cam_idx, int(record['frame_idx']),
+                       ChunkInfo(int(record['device_ts']), int(record['frame_id']), int(record['exposure']),
+                                 int(record['gain'])))
+        pairer.close()
+        pairer.report()
+        return pairer.stats()
+
+    def close(self):
+        """
+        Stop the camera and writer processes.
+
+        :return: True if successful, False otherwise.
+        :rtype: bool
+        """
+        result = True
+        for i, cam in enumerate(self.cameras):
+            if cam['process'].is_alive():
+                cam['conn'].send(('quit', ))
+            cam['process'].join(10)
+            if cam['process'].is_alive():
+                print('WARNING!!! Camera %d process did not end, terminating it.' % i)
+                cam['process'].terminate()
+                result = False
+            self._stop_writers(i)
+        self.cameras = []
+        self.report()
+        return result
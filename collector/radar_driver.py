@@ -1,25 +1,30 @@
 import os
-import shutil
+import math
 import time
-import matlab.engine
 import datetime
+from .start_scheduler import wait_interval, wait_until
+from .radar_transfer import RadarTransfer
+try:
+    import matlab.engine
+except:
+    print("Warning: MATLAB engine is not installed!")
 # from pymouse import PyMouse
 # from pykeyboard import PyKeyboard
 
+# Directory where mmWave Studio records the raw radar files
+RADAR_ROOT = "C:\\ti\\mmwave_studio_02_00_00_02\\mmWaveStudio\\PostProc"
+# Radar control backends, see make_radar_backend
+RADAR_BACKENDS = ['matlab', 'sim']
+
 
 def check_datetime(interval):
     """
-    This function checks the current compter time and if it is 
-    the integer multiples of desired interval, return True
-    """ 
-
-    while True:
-        cur_datetime = datetime.datetime.now()
-        cur_datetime_min = cur_datetime.minute
-        cur_datetime_sec = cur_datetime.second
-        if cur_datetime_min % interval == 0 and cur_datetime_sec == 0:
-            print(cur_datetime_min, cur_datetime_sec)
-            return True
+    This function waits until the computer time is the next integer
+    multiple of the desired interval in minutes and returns True.
+    The start error is printed, see start_scheduler.wait_until.
+    """
+    wait_interval(interval, 'Interval start')
+    return True
 
 
 def init_radar():
@@ -37,11 +42,14 @@ def init_radar():
     return eng
 
 
-def run_radar(eng):
+def run_radar(eng, delay=5):
     """
     This function start radar frame by use matlab command to
     communicate with mmwavestudio software
     Previously, we use virtual interface to control the mouse 
+
+    :param delay: The frames start at the full second delay seconds after the
+        second in which the initialization began.
     """
     # previous method
     # radar_m = PyMouse()
@@ -55,18 +63,14 @@ def run_radar(eng):
     # # record the click time and click trigger
     # radar_m.click(x_dim // 2 - 70, y_dim // 2 - 100, 1)
 
-    cur_datetime = datetime.datetime.now().second
+    init_start = math.floor(time.time())
     # matlab control method
     # Init radar
     eng.Init_DataCaptureDemo(nargout=0)
     print('Radar Initialization finished. Prepared to record data...')
     # avoid the two operation too close (result in data lack)
     # time.sleep(1)
-    
-    while True:
-       new_datetime = datetime.datetime.now().second
-       if new_datetime == cur_datetime + 5:
-            break
+    wait_until(init_start + delay, 'Radar start')
 
     eng.start_frame(nargout=0)
     print("Radar started.")
@@ -78,49 +82,135 @@ def run_radar(eng):
     return
 
 
-def copy_radar_data(base_dir, seq_name, vertical):
-    """
-    This function is to copy the raw radar file after the capturation
-    """
-    radar_root = "C:\\ti\\mmwave_studio_02_00_00_02\\mmWaveStudio\\PostProc"
-    original_files = sorted(os.listdir(os.path.join(radar_root)))
-    TIME_FLAG = 0
-    n_files = 0
-    size_min = 1000
-
-    for fname in original_files:
-        if fname.startswith("adc_data_Raw_") and fname.endswith(".bin"):
-            old_path = os.path.join(radar_root, fname)
-            time_new = os.path.getmtime(old_path)
-            size_old = os.path.getsize(old_path)
-
-            if size_old > size_min:
-                if time_new > TIME_FLAG:
-                    TIME_FLAG = time_new
-                    if vertical:
-                        new_path = os.path.join(base_dir, seq_name, 'radar_v', fname)
-                    else:
-                        new_path = os.path.join(base_dir, seq_name, 'radar_h', fname)
-                    
-                    shutil.copyfile(old_path, new_path)
-                    n_files += 1
-            else:
-                try:
-                    raise ValueError
-                except ValueError:
-                    print("ValueError Exception!")
-                
-                print("Error!!! The size of data file is less than 1000kB, \
-                    possiblely there is no radar data!!")
-                print("Please recapture this sequence and overwrite it")
-                break
+class MatlabRadar:
+    """
+    This class controls the radar through one MATLAB engine, which is
+    started once by init() and kept for all sequences, see
+    collector.radar_service. The commands are the steps of run_radar:
+
+    - init: start the engine and add the archive scripts to its path,
+    - arm: connect to mmWave Studio and start the DCA1000 recording (Init_DataCaptureDemo),
+    - start: start the radar frames (start_frame),
+    - stop: stop the radar frames (stop_frame), if they have not ended on their own.
+
+    The raw files are recorded to postproc_dir.
+    """
+
+    def __init__(self):
+        self.eng = None
+        self.postproc_dir = RADAR_ROOT
+
+    def init(self):
+        if self.eng is None:
+            self.eng = init_radar()
+
+    def arm(self):
+        self.eng.Init_DataCaptureDemo(nargout=0)
+
+    def start(self):
+        self.eng.start_frame(nargout=0)
+
+    def stop(self):
+        self.eng.stop_frame(nargout=0)
+
+    def close(self):
+        if self.eng is not None:
+            self.eng.quit()
+            self.eng = None
+
+
+def make_radar_backend(name='matlab', **kwargs):
+    """
+    :param name: Backend name, one of RADAR_BACKENDS: 'matlab' controls mmWave Studio through MATLAB,
+        'sim' records synthetic raw files without the TI tools, see simulator.fake_radar.
+    :param kwargs: Settings of the simulated radar, e.g. duration; ignored by the MATLAB backend, which
+        is configured by the Lua scripts.
+    :return: Radar control backend for RadarService or LocalRadarClient.
+    """
+    if name == 'matlab':
+        return MatlabRadar()
+    elif name == 'sim':
+        from simulator.fake_radar import SimulatedRadar
+        return SimulatedRadar(**kwargs)
+    raise ValueError('Unknown radar backend %s' % name)
+
+
+def start_radar(interval=0, client=None, delay=5):
+    """
+    Initialize and start the radar before the cameras: wait for the next
+    integer multiple of interval minutes (0 to start now), then arm the radar
+    and start its frames at the full second delay seconds later, as run_radar.
+
+    :param interval: Interval in minutes, 0 to start now.
+    :param client: Client of a running radar service, see collector.radar_service. If None, a MATLAB
+        engine is started for this sequence and stopped after the radar started.
+    :type client: RadarClient
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    if client is None:
+        # Init radar
+        engine = init_radar()
+        if interval != 0:
+            assert check_datetime(interval) is True
+        # Run radar
+        run_radar(engine, delay)
+        return True
+
+    if not client.init():
+        return False
+    if interval != 0:
+        assert check_datetime(interval) is True
+    arm_start = math.floor(time.time())
+    if not client.arm():
+        return False
+    return client.start(at=arm_start + delay)
+
+
+def radar_data_dir(base_dir, seq_name, vertical):
+    return os.path.join(base_dir, seq_name, 'radar_v' if vertical else 'radar_h')
+
+
+def start_radar_transfer(base_dir, seq_name, vertical, radar_root=None):
+    """
+    Start moving the raw radar files of a sequence to its radar directory
+    while recording, see collector.radar_transfer. Call it before the radar
+    starts and pass the transfer to copy_radar_data after the sequence.
+
+    :param radar_root: Directory of the raw radar files, default RADAR_ROOT of mmWave Studio.
+    :return: The started transfer.
+    :rtype: RadarTransfer
+    """
+    transfer = RadarTransfer(radar_root or RADAR_ROOT, radar_data_dir(base_dir, seq_name, vertical))
+    transfer.start()
+    return transfer
+
+
+def copy_radar_data(base_dir, seq_name, vertical, radar_root=None, transfer=None):
+    """
+    This function is to copy the raw radar file after the capturation.
+    Files on the same file system are moved, others are copied in the kernel
+    where possible, and every file is verified, see RadarTransfer.
+
+    :param radar_root: Directory of the raw radar files, default RADAR_ROOT of mmWave Studio.
+    :param transfer: Transfer of this sequence started by start_radar_transfer, which has moved the
+        files while recording; None to transfer all raw files of radar_root now.
+    :type transfer: RadarTransfer
+    :return: Transfer statistics, see RadarTransfer.finish.
+    :rtype: dict
+    """
+    if transfer is None:
+        transfer = RadarTransfer(radar_root or RADAR_ROOT, radar_data_dir(base_dir, seq_name, vertical))
+    stats = transfer.finish()
 
     time_cur = time.time()
-    if time_cur - time_new > 300:
+    if stats['files'] == 0:
+        print("WARNING!!! No radar data in %s" % transfer.radar_root)
+    elif time_cur - stats['newest_mtime'] > 300:
         print("WARNING!!! May copied old data, please check")
 
-    print("Copied %d radar data files to right place." % n_files)
-    return
+    print("Copied %d radar data files to right place." % stats['files'])
+    return stats
 
 
 if __name__ == '__main__':
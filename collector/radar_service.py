@@ -0,0 +1,280 @@
+import time
+import socket
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from .start_scheduler import wait_until
+from .telemetry import LatencyHistogram
+
+# Local address of the radar service; only processes which know the key can
+# connect.
+DEFAULT_RADAR_PORT = 5007
+RADAR_AUTHKEY = b'cr-radar-service'
+RADAR_COMMANDS = ['init', 'arm', 'start', 'stop', 'status']
+
+
+class RadarService:
+    """
+    This class is a long-lived radar control service (run_radar_service.py).
+    It keeps one radar control backend warm, e.g. a MatlabRadar with its
+    MATLAB engine, so the engine is started once instead of for every
+    sequence. Clients (RadarClient) send the commands
+
+    - init: initialize the backend, a no-op if it is already initialized,
+    - arm: prepare the recording of the next sequence,
+    - start: start the radar frames, at a wall-clock time if given,
+    - stop: stop the radar frames,
+    - status: state of the service and latency of every command,
+
+    over a local socket. Every client connection is served by its own thread,
+    and the commands of all clients are executed one at a time. The time the
+    backend takes for every command is collected in a LatencyHistogram.
+    """
+
+    def __init__(self, backend, port=DEFAULT_RADAR_PORT, verbose=True):
+        """
+        :param backend: Radar control backend with init(), arm(), start(), stop() and close(), e.g. MatlabRadar
+            or a SimulatedRadar, see collector.radar_driver.make_radar_backend.
+        :param port: Local TCP port of the service.
+        :param verbose: If True, print a line for every command.
+        """
+        self.backend = backend
+        self.port = port
+        self.verbose = verbose
+        self.state = 'idle'
+        self.lock = threading.Lock()
+        self.latency = dict((cmd, LatencyHistogram()) for cmd in RADAR_COMMANDS)
+        self.n_errors = 0
+        self.listener = None
+        self.stopped = threading.Event()
+
+    def execute(self, cmd, at=None):
+        """
+        Execute a command.
+
+        :param cmd: Command, one of RADAR_COMMANDS.
+        :param at: Wall-clock time (time.time) to start the radar frames, None to start them now.
+        :return: Reply with ok, error, state and the time the backend took in s.
+        :rtype: dict
+        """
+        if cmd not in RADAR_COMMANDS:
+            return {'ok': False, 'error': 'Unknown command %s' % cmd, 'state': self.state, 'latency': 0.0}
+        reply = {'ok': True, 'error': None}
+        with self.lock:
+            if cmd in ('arm', 'start', 'stop') and self.state == 'idle':
+                reply.update({'ok': False, 'error': 'Radar is not initialized'})
+            elif cmd == 'start' and at is not None:
+                reply['start_error'] = wait_until(at, 'Radar start')
+            time_start = time.perf_counter()
+            if reply['ok'] and cmd != 'status':
+                try:
+                    getattr(self.backend, cmd)()
+                    self.state = {'init': 'ready', 'arm': 'armed', 'start': 'running', 'stop': 'ready'}[cmd]
+                except Exception as ex:
+                    reply.update({'ok': False, 'error': '%s: %s' % (type(ex).__name__, ex)})
+            latency = time.perf_counter() - time_start
+            if reply['ok']:
+                self.latency[cmd].add(latency)
+            else:
+                self.n_errors += 1
+            reply['state'] = self.state
+            reply['latency'] = latency
+            if cmd == 'status':
+                reply['latency_ms'] = self.summary()
+                reply['postproc_dir'] = getattr(self.backend, 'postproc_dir', None)
+        if self.verbose:
+            print('Radar %s: %s in %.1f ms%s' % (cmd, 'ok' if reply['ok'] else 'failed', latency * 1e3,
+                                                 '' if reply['ok'] else ' (%s)' % reply['error']))
+        return reply
+
+    def summary(self):
+        return dict((cmd, self.latency[cmd].summary()) for cmd in RADAR_COMMANDS if self.latency[cmd].n > 0)
+
+    def _serve(self, conn):
+        try:
+            while not self.stopped.is_set():
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    break
+                if msg.get('cmd') == 'shutdown':
+                    conn.send({'ok': True, 'error': None, 'state': self.state, 'latency': 0.0})
+                    self.shutdown()
+                    break
+                conn.send(self.execute(msg.get('cmd'), at=msg.get('at')))
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        """
+        Serve clients until shutdown() or Ctrl+C, then close the backend.
+        """
+        self.listener = Listener(('127.0.0.1', self.port), authkey=RADAR_AUTHKEY)
+        print('Radar service listening on 127.0.0.1:%d' % self.port)
+        try:
+            while not self.stopped.is_set():
+                try:
+                    conn = self.listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    # listener closed by shutdown(), or a client failed the authentication
+                    continue
+                thread = threading.Thread(target=self._serve, args=(conn, ), name='radar-client')
+                thread.daemon = True
+                thread.start()
+        except KeyboardInterrupt:
+            print('Interrupted.')
+        finally:
+            self.shutdown()
+            self.backend.close()
+            self.report()
+
+    def shutdown(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        try:
+            # wake up accept() with a connection which fails the authentication
+            socket.create_connection(('127.0.0.1', self.port), timeout=1.0).close()
+        except OSError:
+            pass
+        if self.listener is not None:
+            self.listener.close()
+
+    def report(self):
+        print('Radar service: %d errors' % self.n_errors)
+        for cmd, s in sorted(self.summary().items()):
+            print('\t%-6s n=%-4d p50 %9.1f ms, p95 %9.1f ms, max %9.1f ms'
+                  % (cmd, s['count'], s['p50_ms'], s['p95_ms'], s['max_ms']))
+
+
+class RadarClient:
+    """
+    Client of a RadarService. It connects on the first command and keeps the
+    connection for all sequences. Every command returns True if the service
+    executed it; the round-trip time of the commands is collected per command
+    and printed with the time the service took.
+    """
+
+    def __init__(self, port=DEFAULT_RADAR_PORT, timeout=120.0):
+        """
+        :param port: Local TCP port of the service.
+        :param timeout: Maximum time to wait for a reply in s, e.g. for starting the MATLAB engine.
+        """
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+        self.latency = dict((cmd, LatencyHistogram()) for cmd in RADAR_COMMANDS)
+        self.last_reply = None
+
+    def command(self, cmd, **kwargs):
+        """
+        Send a command and wait for the reply, see RadarService.execute.
+
+        :return: Reply of the service, None if the service is not reachable.
+        :rtype: dict
+        """
+        time_start = time.perf_counter()
+        # a scheduled start is timed from its start time
+        at = kwargs.get('at')
+        delay = max(0.0, at - time.time()) if at is not None else 0.0
+        try:
+            reply = self._request(cmd, kwargs, delay)
+        except (OSError, EOFError, AuthenticationError) as ex:
+            print('WARNING!!! Radar service on port %d: %s' % (self.port, ex))
+            self.close()
+            self.last_reply = None
+            return None
+        round_trip = time.perf_counter() - time_start - delay
+        if cmd in self.latency:
+            self.latency[cmd].add(round_trip)
+        print('Radar %s: %s, %.1f ms (service %.1f ms)%s'
+              % (cmd, reply['state'], round_trip * 1e3, reply['latency'] * 1e3,
+                 '' if reply['ok'] else ', error: %s' % reply['error']))
+        self.last_reply = reply
+        return reply
+
+    def _request(self, cmd, kwargs, delay):
+        if self.conn is None:
+            self.conn = Client(('127.0.0.1', self.port), authkey=RADAR_AUTHKEY)
+        msg = dict(kwargs)
+        msg['cmd'] = cmd
+        self.conn.send(msg)
+        if not self.conn.poll(self.timeout + delay):
+            raise OSError('no reply within %.0f s' % self.timeout)
+        return self.conn.recv()
+
+    def _ok(self, reply):
+        return reply is not None and reply['ok']
+
+    def init(self):
+        return self._ok(self.command('init'))
+
+    def arm(self):
+        return self._ok(self.command('arm'))
+
+    def start(self, at=None):
+        """
+        :param at: Wall-clock time (time.time) to start the radar frames, None to start them now.
+        """
+        return self._ok(self.command('start', at=at))
+
+    def stop(self):
+        return self._ok(self.command('stop'))
+
+    def status(self):
+        """
+        :return: State of the service and latency of every command, None if it is not reachable.
+        :rtype: dict
+        """
+        return self.command('status')
+
+    def postproc_dir(self):
+        """
+        :return: Directory in which the backend records the raw radar files, None if it is not known.
+        :rtype: str
+        """
+        reply = self.status()
+        return reply.get('postproc_dir') if reply is not None else None
+
+    def shutdown(self):
+        return self._ok(self.command('shutdown'))
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def report(self):
+        print('Radar client round trips:')
+        for cmd in RADAR_COMMANDS:
+            if self.latency[cmd].n > 0:
+                s = self.latency[cmd].summary()
+                print('\t%-6s n=%-4d p50 %9.1f ms, p95 %9.1f ms, max %9.1f ms'
+                      % (cmd, s['count'], s['p50_ms'], s['p95_ms'], s['max_ms']))
+
+
+class LocalRadarClient(RadarClient):
+    """
+    Radar control in the capture process, with the interface of RadarClient.
+    The commands are executed by a RadarService without a socket, so the
+    backend, e.g. a SimulatedRadar, is kept initialized across the sequences
+    of one run without starting run_radar_service.py.
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: Radar control backend, see RadarService.
+        """
+        RadarClient.__init__(self, port=None)
+        self.service = RadarService(backend, port=None, verbose=False)
+
+    def _request(self, cmd, kwargs, delay):
+        if cmd == 'shutdown':
+            self.close()
+            return {'ok': True, 'error': None, 'state': self.service.state, 'latency': 0.0}
+        return self.service.execute(cmd, at=kwargs.get('at'))
+
+    def close(self):
+        self.service.backend.close()
+        self.service.state = 'idle'
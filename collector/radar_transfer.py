@@ -0,0 +1,364 @@
+import os
+import sys
+import time
+import zlib
+import threading
+
+RAW_PREFIX = 'adc_data_Raw_'
+RAW_SUFFIX = '.bin'
+# Raw files up to this size hold no radar data
+SIZE_MIN = 1000
+COPY_CHUNK = 16 * 1024 * 1024
+OPEN_FLAGS = getattr(os, 'O_BINARY', 0)
+
+# Kernel copy methods which work on this system, removed when they fail
+_offload = set(m for m in ['copy_file_range', 'sendfile']
+               if hasattr(os, m) and (m != 'sendfile' or sys.platform.startswith('linux')))
+
+
+def copy_range(src_fd, dst_fd, offset, count):
+    """
+    Copy count bytes at offset of the source file to the same offset of the
+    destination file, in the kernel (copy_file_range, sendfile) if possible.
+
+    :return: Number of bytes copied, 0 at the end of the source file, and the copy method.
+    :rtype: tuple
+    """
+    count = min(count, COPY_CHUNK)
+    if 'copy_file_range' in _offload:
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset, offset), 'copy_file_range'
+        except OSError:
+            # e.g. not supported across file systems by older kernels
+            _offload.discard('copy_file_range')
+    if 'sendfile' in _offload:
+        try:
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            return os.sendfile(dst_fd, src_fd, offset, count), 'sendfile'
+        except OSError:
+            _offload.discard('sendfile')
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    data = os.read(src_fd, count)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    os.write(dst_fd, data)
+    return len(data), 'read'
+
+
+def crc_range(fd, offset, count, crc=0):
+    """
+    :return: CRC-32 of count bytes at offset of the file, continuing crc.
+    :rtype: int
+    """
+    os.lseek(fd, offset, os.SEEK_SET)
+    while count > 0:
+        data = os.read(fd, min(count, COPY_CHUNK))
+        if len(data) == 0:
+            break
+        crc = zlib.crc32(data, crc)
+        count -= len(data)
+    return crc
+
+
+def file_released(path):
+    """
+    Check that no process has the file open any more, by opening it without
+    sharing. This works on Windows only, elsewhere the file is assumed to be
+    released.
+
+    :return: True if the file could be opened exclusively.
+    :rtype: bool
+    """
+    if sys.platform != 'win32':
+        return True
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.windll.kernel32
+    kernel32.CreateFileW.restype = wintypes.HANDLE
+    # GENERIC_READ, no sharing, OPEN_EXISTING
+    handle = kernel32.CreateFileW(path, 0x80000000, 0, None, 3, 0, None)
+    if handle is None or handle == ctypes.c_void_p(-1).value:
+        return False
+    kernel32.CloseHandle(wintypes.HANDLE(handle))
+    return True
+
+
+def raw_file_index(fname):
+    """
+    :return: Index N of adc_data_Raw_N.bin, None for other files.
+    """
+    if not (fname.startswith(RAW_PREFIX) and fname.endswith(RAW_SUFFIX)):
+        return None
+    try:
+        return int(fname[len(RAW_PREFIX):-len(RAW_SUFFIX)])
+    except ValueError:
+        return None
+
+
+class _RawFile:
+    def __init__(self, name, src, dst):
+        self.name = name
+        self.src = src
+        self.dst = dst
+        self.dst_fd = None
+        self.offset = 0
+        self.crc_src = 0
+        self.crc_dst = 0
+        self.size = 0
+        self.mtime = 0.0
+        self.method = None
+        self.done = False
+
+
+class RadarTransfer:
+    """
+    This class moves the raw radar files (adc_data_Raw_N.bin) of one sequence
+    from the directory where mmWave Studio records them to the radar
+    directory of the sequence while the radar is still recording, so little
+    is left to do after the sequence.
+
+    A raw file is closed once the next split file appears, or when the
+    sequence is finished. A closed file is renamed to the sequence directory
+    if both directories are on the same file system (or hard-linked with
+    move=False, which keeps the recorded file in place), which takes no copy
+    at all. Otherwise the growing file is tailed: the bytes appended since
+    the last poll are copied in the kernel (copy_file_range or sendfile,
+    where the system supports it), and the CRC-32 of the source and the copy
+    is updated for the new bytes. Every file is verified when it is closed:
+    its size, and for copies the checksum.
+
+    The sizes are read with os.stat and os.fstat, as the sizes of a directory
+    listing on Windows are not updated while a file is open. On Windows, a
+    file is only closed when the radar has released it (see file_released);
+    finish() waits for that until timeout.
+
+    Usage:
+        transfer = RadarTransfer(radar_root, radar_dir)
+        transfer.start()
+        ... record the sequence ...
+        stats = transfer.finish()
+    """
+
+    def __init__(self, radar_root, dest_dir, move=True, verify=True, poll=0.05, settle=0.25, timeout=120.0,
+                 size_min=SIZE_MIN):
+        """
+        :param radar_root: Directory of the raw files written by the radar.
+        :param dest_dir: Radar directory of the sequence, it must exist.
+        :param move: If True, rename closed files on the same file system, otherwise hard-link them.
+        :param verify: If True, compare the checksums of copied files, otherwise only their sizes.
+        :param poll: Time between two polls of the raw files in s.
+        :param settle: The recording is finished when no raw file has grown for settle s.
+        :param timeout: Maximum time finish() waits for the recording to finish in s.
+        :param size_min: Raw files up to this size are not transferred.
+        """
+        self.radar_root = radar_root
+        self.dest_dir = dest_dir
+        self.move = move
+        self.verify = verify
+        self.poll = poll
+        self.settle = settle
+        self.timeout = timeout
+        self.size_min = size_min
+        try:
+            self.same_fs = os.stat(radar_root).st_dev == os.stat(dest_dir).st_dev
+        except OSError:
+            self.same_fs = False
+        self.since = None
+        self.files = {}
+        self.sizes = {}
+        self.last_change = time.perf_counter()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.n_failed = 0
+        self.n_skipped = 0
+
+    def start(self):
+        """
+        Transfer the raw files which are written from now on.
+        """
+        self.since = time.time()
+        self.thread = threading.Thread(target=self._run, name='radar-transfer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.poll):
+            try:
+                self._poll()
+            except OSError as ex:
+                print('WARNING!!! Radar transfer: %s' % ex)
+
+    def _scan(self):
+        """
+        :return: Index, name, size and modification time of the raw files of this sequence, by index.
+        :rtype: list
+        """
+        try:
+            entries = list(os.scandir(self.radar_root))
+        except OSError:
+            return []
+        files = []
+        for entry in entries:
+            index = raw_file_index(entry.name)
+            if index is None:
+                continue
+            try:
+                # not entry.stat(), which is cached from the listing on Windows
+                stat = os.stat(entry.path)
+            except OSError:
+                # renamed or removed since the listing
+                continue
+            if self.since is None or stat.st_mtime > self.since:
+                files.append((index, entry.name, stat.st_size, stat.st_mtime))
+        return sorted(files)
+
+    def _poll(self, final=False, force=False):
+        """
+        Transfer the closed raw files and tail the growing one.
+
+        :param final: If True, the recording is finished and all files are closed.
+        :param force: If True, close the files even if they are still open.
+        :return: True if all files are closed.
+        :rtype: bool
+        """
+        listing = self._scan()
+        if any(self.sizes.get(name) != size for _, name, size, _ in listing):
+            self.last_change = time.perf_counter()
+        for k, (index, name, size, mtime) in enumerate(listing):
+            self.sizes[name] = size
+            raw_file = self.files.get(name)
+            if raw_file is None:
+                raw_file = self.files[name] = _RawFile(name, os.path.join(self.radar_root, name),
+                                                       os.path.join(self.dest_dir, name))
+            elif raw_file.done:
+                continue
+            elif size < raw_file.offset:
+                # the file was rewritten from the start
+                self._reset(raw_file)
+            raw_file.size = size
+            raw_file.mtime = mtime
+            if (final or k < len(listing) - 1) and self._close(raw_file, force):
+                continue
+            if not self.same_fs:
+                self._tail(raw_file)
+        return all(f.done for f in self.files.values())
+
+    def _reset(self, raw_file):
+        if raw_file.dst_fd is not None:
+            os.close(raw_file.dst_fd)
+            raw_file.dst_fd = None
+        raw_file.offset = raw_file.crc_src = raw_file.crc_dst = 0
+
+    def _tail(self, raw_file):
+        if raw_file.dst_fd is None:
+            raw_file.dst_fd = os.open(raw_file.dst, os.O_RDWR | os.O_CREAT | os.O_TRUNC | OPEN_FLAGS)
+        src_fd = os.open(raw_file.src, os.O_RDONLY | OPEN_FLAGS)
+        try:
+            raw_file.size = max(raw_file.size, os.fstat(src_fd).st_size)
+            while raw_file.offset < raw_file.size:
+                n, raw_file.method = copy_range(src_fd, raw_file.dst_fd, raw_file.offset,
+                                                raw_file.size - raw_file.offset)
+                if n == 0:
+                    break
+                if self.verify:
+                    raw_file.crc_src = crc_range(src_fd, raw_file.offset, n, raw_file.crc_src)
+                    raw_file.crc_dst = crc_range(raw_file.dst_fd, raw_file.offset, n, raw_file.crc_dst)
+                raw_file.offset += n
+        finally:
+            os.close(src_fd)
+
+    def _close(self, raw_file, force=False):
+        """
+        Transfer the rest of a raw file and verify it.
+
+        :param force: If True, close the file even if the radar has not released it.
+        :return: True if the file is closed, False if it is still open.
+        :rtype: bool
+        """
+        if not force and not file_released(raw_file.src):
+            return False
+        raw_file.done = True
+        if raw_file.size <= self.size_min:
+            print("Error!!! The size of %s is less than %d bytes, possiblely there is no radar data!!"
+                  % (raw_file.name, self.size_min))
+            print("Please recapture this sequence and overwrite it")
+            self._reset(raw_file)
+            if os.path.exists(raw_file.dst):
+                os.remove(raw_file.dst)
+            self.n_skipped += 1
+            raw_file.method = None
+            return True
+
+        if self.same_fs and raw_file.offset == 0:
+            try:
+                if self.move:
+                    os.replace(raw_file.src, raw_file.dst)
+                    raw_file.method = 'rename'
+                else:
+                    if os.path.exists(raw_file.dst):
+                        os.remove(raw_file.dst)
+                    os.link(raw_file.src, raw_file.dst)
+                    raw_file.method = 'link'
+                raw_file.offset = raw_file.size
+            except OSError:
+                # e.g. still opened by the radar on Windows, or no hard links on the file system
+                pass
+
+        if raw_file.method not in ('rename', 'link'):
+            self._tail(raw_file)
+            os.close(raw_file.dst_fd)
+            raw_file.dst_fd = None
+
+        # verify the transferred file
+        error = None
+        size_dst = os.path.getsize(raw_file.dst)
+        if raw_file.offset != raw_file.size or size_dst != raw_file.size:
+            error = 'size %d of %d bytes' % (size_dst, raw_file.size)
+        elif self.verify and raw_file.crc_src != raw_file.crc_dst:
+            error = 'checksum %08x of %08x' % (raw_file.crc_dst, raw_file.crc_src)
+        if error is not None:
+            print('WARNING!!! Radar transfer of %s failed: %s' % (raw_file.name, error))
+            self.n_failed += 1
+            raw_file.method = 'failed'
+        return True
+
+    def finish(self):
+        """
+        Wait until the radar has finished writing, then transfer the rest of
+        the raw files. It may be called without start(), to transfer all raw
+        files of the directory at once.
+
+        :return: Number of files, bytes, files per transfer method, failed and
+            skipped files, modification time of the newest file and the
+            post-sequence wait in s.
+        :rtype: dict
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        time_start = time.perf_counter()
+        while True:
+            self._poll()
+            now = time.perf_counter()
+            if now - self.last_change >= self.settle and self._poll(final=True):
+                break
+            if now - time_start > self.timeout:
+                print('WARNING!!! Radar files still written after %g s' % self.timeout)
+                self._poll(final=True, force=True)
+                break
+            time.sleep(self.poll)
+        wait = time.perf_counter() - time_start
+
+        transferred = [f for f in self.files.values() if f.method not in (None, 'failed')]
+        methods = {}
+        for f in transferred:
+            methods[f.method] = methods.get(f.method, 0) + 1
+        stats = {'files': len(transferred), 'bytes': sum(f.size for f in transferred), 'methods': methods,
+                 'failed': self.n_failed, 'skipped': self.n_skipped,
+                 'newest_mtime': max([f.mtime for f in transferred] or [0.0]), 'wait': wait}
+        print('Radar transfer: %d files, %.1f MB (%s), %d failed, %d skipped, post-sequence wait %.3f s'
+              % (stats['files'], stats['bytes'] / 1e6,
+                 ', '.join('%s %d' % item for item in sorted(methods.items())) or 'none', stats['failed'],
+                 stats['skipped'], wait))
+        return stats
@@ -0,0 +1,192 @@
+try:
+    import cv2
+except ImportError:
+    print("Warning: OpenCV is not installed!")
+
+import os
+import time
+import numpy as np
+
+from .frame_consumer import FrameConsumer
+from .frame_writer import FrameWriterPool
+from utils.image_codec import to_bgr
+from utils.calib import load_calib, adjust_calib, full_format, is_full_format, kept_rows, load_image_formats
+
+
+def stereo_calib_yamls(calib_dir):
+    """
+    :param calib_dir: Stereo calibration directory with left.yaml and right.yaml,
+        e.g. D:\\RawData\\calib\\2019_09_29_18384019-19325055.
+    :return: Calibration files of camera 0 (left) and camera 1 (right).
+    :rtype: list
+    """
+    return [os.path.join(calib_dir, 'left.yaml'), os.path.join(calib_dir, 'right.yaml')]
+
+
+class RectifyMap:
+    """
+    Undistortion and rectification map of one camera. The map is computed
+    once from the calibration file in the fixed-point format of cv2.remap and
+    cut to the rows kept by the crop, so remap() only computes the output
+    pixels. For binned or cropped frames, the calibration of the full sensor
+    is adjusted to the image format (see utils.calib.adjust_calib).
+    """
+
+    def __init__(self, calib_yaml, crop=0.8, image_format=None):
+        """
+        :param calib_yaml: Calibration file of the camera, for the full sensor.
+        :param crop: Fraction of the full frame height kept from the top, as in preprocess/cam_stereo_rectify.py.
+        :param image_format: Binning and region of interest of the frames, None for the full sensor.
+        :type image_format: dict
+        """
+        calib = load_calib(calib_yaml)
+        if image_format is None:
+            image_format = full_format(calib[0], calib[1])
+        elif not is_full_format(image_format):
+            calib = adjust_calib(calib, image_format)
+        width, height, K, D, R, P = calib
+        self.calib_yaml = calib_yaml
+        self.image_format = image_format
+        self.shape = (height, width)
+        map1, map2 = cv2.initUndistortRectifyMap(K, D, R, P, (width, height), cv2.CV_16SC2)
+        rows = kept_rows(crop, image_format)
+        self.map1 = np.ascontiguousarray(map1[:rows])
+        self.map2 = np.ascontiguousarray(map2[:rows])
+
+    def remap(self, image):
+        """
+        :param image: Image of the calibrated size.
+        :type image: np.ndarray
+        :return: Rectified and cropped image.
+        :rtype: np.ndarray
+        """
+        return cv2.remap(image, self.map1, self.map2, cv2.INTER_LINEAR)
+
+
+class RectifyConsumer(FrameConsumer):
+    """
+    This consumer undistorts, rectifies and crops the frames while capturing
+    and writes them as JPEG files to images_rect_N next to the raw frames,
+    which replaces the offline pass of preprocess/cam_stereo_rectify.py
+    (except the color transfer). The calibration files are loaded and the
+    maps computed once, when the consumer is created, so one consumer can be
+    used for all sequences of a CaptureSession. If the sequence was captured
+    with binning or a region of interest (image_format.json, written by the
+    CaptureSession), the maps are computed for that image format instead.
+
+    The grab loop only copies the frame; debayering, remapping and encoding
+    run in a pool of writer threads (OpenCV releases the GIL). Frames are
+    dropped from the rectified output when the queue is full. To skip the
+    JPEG encoding of the raw frames, capture with raw=True.
+    """
+    name = 'rectify'
+
+    def __init__(self, calib_yamls, crop=0.8, num_workers=2, max_queue=16, quality=95, dir_name='images_rect'):
+        """
+        :param calib_yamls: Calibration files by camera index, see stereo_calib_yamls().
+        :param crop: Fraction of the image height kept from the top.
+        :param num_workers: Number of rectification threads.
+        :param max_queue: Maximum number of frames waiting to be rectified.
+        :param quality: JPEG quality of the rectified frames.
+        :param dir_name: Name of the output directories, with the suffix _N for camera N.
+        :type calib_yamls: list
+        """
+        time_start = time.perf_counter()
+        self.calib_yamls = list(calib_yamls)
+        self.crop = crop
+        self.full_maps = [RectifyMap(calib_yaml, crop) for calib_yaml in calib_yamls]
+        self.maps = list(self.full_maps)
+        print('Rectification maps of %d cameras computed in %.1f ms'
+              % (len(self.maps), (time.perf_counter() - time_start) * 1e3))
+        self.num_workers = num_workers
+        self.queue_size = max_queue
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        self.dir_name = dir_name
+        self.seq_dir = None
+        self.pool = None
+        self.out_dirs = {}
+        self.last_stats = None
+
+    def start(self, seq_dir):
+        self.seq_dir = seq_dir
+        self.out_dirs = {}
+        image_formats = load_image_formats(seq_dir) if seq_dir is not None else None
+        if image_formats is not None:
+            self.update_maps(image_formats)
+        self.pool = FrameWriterPool(num_workers=self.num_workers, max_queue=self.queue_size,
+                                    save_fn=self._save, name='rectify').start()
+
+    def update_maps(self, image_formats):
+        """
+        Compute the maps of the cameras whose image format changed.
+
+        :param image_formats: Image format of every camera, by camera index.
+        :type image_formats: list
+        """
+        for i, image_format in enumerate(image_formats[:len(self.maps)]):
+            if image_format == self.maps[i].image_format:
+                continue
+            if image_format == self.full_maps[i].image_format:
+                self.maps[i] = self.full_maps[i]
+                continue
+            try:
+                self.maps[i] = RectifyMap(self.calib_yamls[i], self.crop, image_format)
+                print('Camera %d: rectification map for %dx%d frames, binning %dx%d, offset %d,%d'
+                      % (i, image_format['width'], image_format['height'], image_format['binning_x'],
+                         image_format['binning_y'], image_format['x_offset'], image_format['y_offset']))
+            except ValueError as ex:
+                print('WARNING!!! Camera %d: %s' % (i, ex))
+
+    def _out_dir(self, cam_idx, frame):
+        """
+        Output directory of a camera, None if the camera is not rectified.
+        """
+        if cam_idx in self.out_dirs:
+            return self.out_dirs[cam_idx]
+        out_dir = None
+        map_idx = 0 if cam_idx is None else cam_idx
+        if map_idx >= len(self.maps):
+            print('WARNING!!! No calibration for camera %d, it is not rectified.' % map_idx)
+        elif frame.shape[:2] != self.maps[map_idx].shape:
+            print('WARNING!!! Camera %d frames are %dx%d, but %s is calibrated for %dx%d. Not rectified.'
+                  % (map_idx, frame.shape[1], frame.shape[0], self.maps[map_idx].calib_yaml,
+                     self.maps[map_idx].shape[1], self.maps[map_idx].shape[0]))
+        else:
+            suffix = '' if cam_idx is None else '_%d' % cam_idx
+            out_dir = os.path.join(self.seq_dir, self.dir_name + suffix)
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+        self.out_dirs[cam_idx] = out_dir
+        return out_dir
+
+    def process(self, frame, info):
+        out_dir = self._out_dir(info.cam_idx, frame)
+        if out_dir is None:
+            return
+        rmap = self.maps[0 if info.cam_idx is None else info.cam_idx]
+        self.pool.put((frame.copy(), info.pixel_format, rmap), os.path.join(out_dir, '%010d.jpg' % info.frame_idx))
+
+    def _save(self, item, filename):
+        frame, pixel_format, rmap = item
+        if not cv2.imwrite(filename, rmap.remap(to_bgr(frame, pixel_format)), self.params):
+            raise IOError('Unable to write %s' % filename)
+
+    def close(self):
+        if self.pool is None:
+            return
+        self.last_stats = self.pool.close()
+        errors = self.pool.errors
+        self.pool = None
+        print('Rectified %d of %d frames by %d threads, overflow %d, errors %d'
+              % (self.last_stats['written'], self.last_stats['queued'] + self.last_stats['overflow'],
+                 self.last_stats['num_workers'], self.last_stats['overflow'], self.last_stats['errors']))
+        for err in errors[:10]:
+            print('\tRectify error: %s' % err)
+        if self.last_stats['overflow'] > 0:
+            print('WARNING!!! %d frames were not rectified because the queue was full, '
+                  'use more rectification threads.' % self.last_stats['overflow'])
+
+    def stats(self):
+        if self.pool is not None:
+            return self.pool.stats()
+        return self.last_stats
@@ -0,0 +1,81 @@
+import threading
+import numpy as np
+
+RING_META_DTYPE = np.dtype([
+    ('seq', '<i8'),         # number of the frame pushed into the ring, -1 for an empty slot
+    ('frame_id', '<u8'),    # chunk FrameID from the camera
+    ('device_ts', '<u8'),   # chunk timestamp from the camera in ns
+    ('host_ts', '<f8'),     # host monotonic time (time.perf_counter) in s
+    ('exposure', '<u4'),    # exposure time in us
+    ('gain', '<i4'),        # gain in 0.001 dB
+])
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size in-memory ring of the last capacity frames of one camera. The
+    frame memory is allocated and touched once, pushing a frame is a copy into
+    the oldest slot and does not allocate.
+
+    Every slot carries the number of the frame it holds (seq), so a reader can
+    copy a slot without holding the lock and check afterwards that it was not
+    overwritten in the meantime.
+    """
+
+    def __init__(self, capacity, shape, dtype=np.uint8):
+        """
+        :param capacity: Number of frames in the ring.
+        :param shape: Shape of the frames, e.g. (height, width).
+        :param dtype: Data type of the frames.
+        """
+        self.capacity = int(capacity)
+        self.frames = np.empty((self.capacity, ) + tuple(shape), dtype=dtype)
+        # touch all pages now, not while capturing
+        self.frames.fill(0)
+        self.meta = np.zeros((self.capacity, ), dtype=RING_META_DTYPE)
+        self.meta['seq'] = -1
+        self.n_pushed = 0
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes + self.meta.nbytes
+
+    def push(self, frame, chunk, host_ts):
+        """
+        Copy a frame into the ring, overwriting the oldest frame.
+
+        :param frame: Frame, e.g. the GetNDArray() of an unreleased image.
+        :param chunk: Chunk data of the frame.
+        :param host_ts: Host time (time.perf_counter) when the frame was grabbed.
+        :type chunk: ChunkInfo
+        """
+        slot = self.n_pushed % self.capacity
+        with self.lock:
+            # invalidate the slot while it is written
+            self.meta['seq'][slot] = -1
+        np.copyto(self.frames[slot], frame)
+        with self.lock:
+            self.meta[slot] = (self.n_pushed, chunk.frame_id, chunk.timestamp, host_ts, chunk.exposure, chunk.gain)
+            self.n_pushed += 1
+
+    def select(self, start_ts, end_ts):
+        """
+        Find the frames grabbed between the host times start_ts and end_ts.
+
+        :return: Slots and frame numbers of the frames, oldest first.
+        :rtype: list
+        """
+        with self.lock:
+            meta = self.meta.copy()
+        valid = (meta['seq'] >= 0) & (meta['host_ts'] >= start_ts) & (meta['host_ts'] <= end_ts)
+        slots = np.nonzero(valid)[0]
+        order = np.argsort(meta['seq'][slots])
+        return [(int(slot), int(meta['seq'][slot])) for slot in slots[order]]
+
+    def is_valid(self, slot, seq):
+        """
+        Check that a slot still holds frame seq, e.g. after copying it.
+        """
+        with self.lock:
+            return self.meta['seq'][slot] == seq
@@ -0,0 +1,257 @@
+import os
+import numpy as np
+
+# Shared frame ring: a memory-mapped file through which the process of one
+# camera hands its frames to the writer processes of the camera, see
+# collector.process_capture.
+#
+# Layout:
+#   header (RING_HEADER_SIZE bytes), see RING_HEADER_DTYPE
+#   slot records (capacity records), see RING_SLOT_DTYPE
+#   frame slots (capacity slots of slot_size bytes, page aligned)
+#
+# The camera process is the only producer. Frame seq goes to slot
+# seq % capacity and is written by reader seq % num_readers, so every reader
+# takes its frames in order without locks. done[r] counts the frames written
+# by reader r; a slot is free again when the reader of its frame is past it.
+# The producer publishes a frame by incrementing n_pushed after the frame
+# and its record are written.
+RING_MAGIC = b'CRRING01'
+RING_HEADER_SIZE = 4096
+RING_PAGE_SIZE = 4096
+RING_MAX_READERS = 16
+RING_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('capacity', '<u4'),
+    ('num_readers', '<u4'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('stop', '<u4'),
+    ('frame_size', '<u8'),
+    ('slot_size', '<u8'),
+    ('data_offset', '<u8'),
+    ('pixel_format', 'S16'),
+    ('sequence', '<u4'),                            # number of the current sequence
+    ('seq_dir', 'S1024'),                           # directory of the current sequence, utf-8
+    ('n_pushed', '<u8'),                            # frames pushed by the producer
+    ('n_overflow', '<u8'),                          # frames not pushed because the ring was full
+    ('done', '<u8', (RING_MAX_READERS, )),          # frames taken by each reader
+    ('written', '<u8', (RING_MAX_READERS, )),       # frames written by each reader
+    ('errors', '<u8', (RING_MAX_READERS, )),        # frames each reader failed to write
+    ('bytes', '<u8', (RING_MAX_READERS, )),         # bytes written by each reader
+    ('busy_time', '<f8', (RING_MAX_READERS, )),     # time each reader spent writing in s
+])
+RING_SLOT_DTYPE = np.dtype([
+    ('seq', '<i8'),         # number of the frame pushed into the ring
+    ('sequence', '<u4'),    # number of the sequence of the frame
+    ('frame_idx', '<u8'),   # index of the frame in the sequence
+    ('frame_id', '<u8'),    # chunk FrameID from the camera
+    ('device_ts', '<u8'),   # chunk timestamp from the camera in ns
+    ('host_ts', '<f8'),     # host monotonic time (time.perf_counter) in s
+])
+
+
+def _align(size, alignment=RING_PAGE_SIZE):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def _layout(capacity, frame_size):
+    slot_size = _align(frame_size)
+    data_offset = _align(RING_HEADER_SIZE + capacity * RING_SLOT_DTYPE.itemsize)
+    return slot_size, data_offset, data_offset + capacity * slot_size
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of 8-bit frames in a memory-mapped file shared by the
+    processes of one camera. The camera process creates it and pushes its
+    frames with push(), the writer processes open it by path and take their
+    frames with next_frame() and done(). Pushing a frame is one copy of the
+    sensor buffer and does not allocate; the writers read the frames in
+    place.
+    """
+
+    def __init__(self, path, shape=None, pixel_format=None, capacity=None, num_readers=1):
+        """
+        Create a ring, or open an existing one if shape is None.
+
+        :param path: Path of the ring file.
+        :param shape: Shape of the frames, (height, width) or (height, width, channels).
+        :param pixel_format: Pixel format name of the frames, e.g. 'BayerRG8'.
+        :param capacity: Number of frame slots.
+        :param num_readers: Number of writer processes.
+        """
+        self.path = path
+        if shape is not None:
+            if num_readers > RING_MAX_READERS:
+                raise ValueError('At most %d readers per ring' % RING_MAX_READERS)
+            height, width = shape[:2]
+            channels = shape[2] if len(shape) == 3 else 1
+            frame_size = height * width * channels
+            slot_size, data_offset, total_size = _layout(capacity, frame_size)
+            with open(path, 'wb') as f:
+                f.truncate(total_size)
+            self.mm = np.memmap(path, dtype=np.uint8, mode='r+', shape=(total_size, ))
+            header = np.zeros((1, ), dtype=RING_HEADER_DTYPE)
+            header[0]['magic'] = RING_MAGIC
+            header[0]['capacity'] = capacity
+            header[0]['num_readers'] = num_readers
+            header[0]['height'] = height
+            header[0]['width'] = width
+            header[0]['channels'] = channels
+            header[0]['frame_size'] = frame_size
+            header[0]['slot_size'] = slot_size
+            header[0]['data_offset'] = data_offset
+            header[0]['pixel_format'] = pixel_format.encode()
+            self.mm[:RING_HEADER_DTYPE.itemsize] = header.view(np.uint8)
+        else:
+            header = np.fromfile(path, dtype=RING_HEADER_DTYPE, count=1)
+            if len(header) == 0 or header[0]['magic'] != RING_MAGIC:
+                raise ValueError('%s is not a frame ring.' % path)
+            _, _, total_size = _layout(int(header[0]['capacity']), int(header[0]['frame_size']))
+            self.mm = np.memmap(path, dtype=np.uint8, mode='r+', shape=(total_size, ))
+
+        self.header = self.mm[:RING_HEADER_DTYPE.itemsize].view(RING_HEADER_DTYPE)
+        h = self.header[0]
+        self.capacity = int(h['capacity'])
+        self.num_readers = int(h['num_readers'])
+        self.pixel_format = h['pixel_format'].decode()
+        channels = int(h['channels'])
+        self.shape = (int(h['height']), int(h['width'])) + ((channels, ) if channels > 1 else ())
+        frame_size = int(h['frame_size'])
+        data_offset = int(h['data_offset'])
+        self.slots = self.mm[RING_HEADER_SIZE:RING_HEADER_SIZE + self.capacity * RING_SLOT_DTYPE.itemsize] \
+            .view(RING_SLOT_DTYPE)
+        self.frames = self.mm[data_offset:].reshape(self.capacity, int(h['slot_size']))[:, :frame_size] \
+            .reshape((self.capacity, ) + self.shape)
+        self.semaphores = None
+
+    def set_semaphores(self, semaphores):
+        """
+        :param semaphores: One multiprocessing.Semaphore per reader, released for every frame of the reader.
+        :type semaphores: list
+        """
+        self.semaphores = semaphores
+        return self
+
+    # producer
+
+    def begin_sequence(self, seq_dir):
+        self.header['seq_dir'][0] = seq_dir.encode('utf-8')
+        self.header['sequence'][0] += 1
+
+    def push(self, frame, frame_idx, chunk, host_ts):
+        """
+        Copy a frame into the ring.
+
+        :param frame: Frame, e.g. the GetNDArray() of an unreleased image.
+        :param frame_idx: Index of the frame in the sequence.
+        :param chunk: Chunk data of the frame.
+        :param host_ts: Host time (time.perf_counter) when the frame was grabbed.
+        :type chunk: ChunkInfo
+        :return: True if the frame is pushed, False if the ring is full.
+        :rtype: bool
+        """
+        seq = int(self.header['n_pushed'][0])
+        if seq >= self.capacity and not self.is_done(seq - self.capacity):
+            self.header['n_overflow'][0] += 1
+            return False
+        if frame.shape != self.shape:
+            raise ValueError('Frame of shape %s does not fit the ring of %s' % (frame.shape, self.shape))
+        slot = seq % self.capacity
+        np.copyto(self.frames[slot], frame)
+        self.slots[slot] = (seq, self.header['sequence'][0], frame_idx, chunk.frame_id, chunk.timestamp, host_ts)
+        self.header['n_pushed'][0] = seq + 1
+        if self.semaphores is not None:
+            self.semaphores[seq % self.num_readers].release()
+        return True
+
+    def is_done(self, seq):
+        reader = seq % self.num_readers
+        return int(self.header['done'][0][reader]) > seq // self.num_readers
+
+    def depth(self):
+        """
+        :return: Number of frames pushed and not yet written.
+        :rtype: int
+        """
+        return int(self.header['n_pushed'][0]) - int(self.header['done'][0].sum())
+
+    def drained(self):
+        return self.depth() == 0
+
+    def stop(self):
+        self.header['stop'][0] = 1
+        if self.semaphores is not None:
+            for semaphore in self.semaphores:
+                semaphore.release()
+
+    # reader
+
+    def next_frame(self, reader, timeout=0.1):
+        """
+        Wait for the next frame of a reader.
+
+        :param reader: Index of the reader.
+        :param timeout: Maximum time to wait in s.
+        :return: Slot record and read-only view of the frame, None if there is no frame yet.
+        :rtype: tuple
+        """
+        seq = reader + int(self.header['done'][0][reader]) * self.num_readers
+        if seq >= int(self.header['n_pushed'][0]):
+            if self.semaphores is None:
+                return None
+            self.semaphores[reader].acquire(timeout=timeout)
+            if seq >= int(self.header['n_pushed'][0]):
+                return None
+        slot = seq % self.capacity
+        frame = self.frames[slot].view()
+        frame.flags.writeable = False
+        return self.slots[slot].copy(), frame
+
+    def done(self, reader, nbytes=0, busy_time=0.0, error=False):
+        """
+        Give the slot of the frame from next_frame() back to the producer.
+        """
+        h = self.header[0]
+        if error:
+            h['errors'][reader] += 1
+        else:
+            h['written'][reader] += 1
+            h['bytes'][reader] += nbytes
+        h['busy_time'][reader] += busy_time
+        h['done'][reader] += 1
+
+    def stopped(self):
+        return self.header['stop'][0] != 0
+
+    def seq_dir(self):
+        return self.header['seq_dir'][0].decode('utf-8')
+
+    def stats(self):
+        h = self.header[0]
+        n = self.num_readers
+        return {
+            'capacity': self.capacity,
+            'num_readers': n,
+            'pushed': int(h['n_pushed']),
+            'overflow': int(h['n_overflow']),
+            'written': int(h['written'][:n].sum()),
+            'errors': int(h['errors'][:n].sum()),
+            'bytes_written': int(h['bytes'][:n].sum()),
+            'busy_time': float(h['busy_time'][:n].sum()),
+        }
+
+    def close(self):
+        self.slots = None
+        self.frames = None
+        self.header = None
+        self.mm = None
+
+
+def remove_ring(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
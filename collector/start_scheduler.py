@@ -0,0 +1,81 @@
+import sys
+import math
+import time
+import datetime
+
+# Time before the target which is spun instead of slept. time.sleep wakes up
+# late by up to one timer tick, about 15.6 ms on Windows, and by a few ms on
+# a loaded system elsewhere.
+SPIN_WINDOW = 0.02 if sys.platform == 'win32' else 0.005
+# Longest single sleep, so a long wait follows adjustments of the wall clock
+MAX_SLEEP = 1.0
+
+
+def next_interval_start(interval, now=None):
+    """
+    :param interval: Interval in minutes.
+    :param now: Wall-clock time (time.time), default now.
+    :return: Wall-clock time of the next full minute which is an integer
+        multiple of interval, or now if now is such a full minute.
+    :rtype: float
+    """
+    if now is None:
+        now = time.time()
+    start = datetime.datetime.fromtimestamp(math.ceil(now)).replace(second=0, microsecond=0)
+    if start.timestamp() < now:
+        start += datetime.timedelta(minutes=1)
+    while start.minute % interval != 0:
+        start += datetime.timedelta(minutes=1)
+    return start.timestamp()
+
+
+def wait_until(target, name='Start', spin_window=SPIN_WINDOW):
+    """
+    Wait until a wall-clock time. The wait sleeps on the monotonic clock
+    until spin_window before the target and spins for the rest, so it does
+    not keep a core busy and does not miss the target by a timer tick. The
+    achieved start error is printed in microseconds.
+
+    :param target: Wall-clock time (time.time) to wait for.
+    :param name: Name of the event in the report.
+    :param spin_window: Time before the target which is spun, in s.
+    :return: Start error (achieved start minus target) in s, positive if late,
+        e.g. if the target had already passed.
+    :rtype: float
+    """
+    remaining = target - time.time()
+    while remaining > spin_window:
+        time.sleep(min(remaining - spin_window, MAX_SLEEP))
+        remaining = target - time.time()
+
+    # bounded spin on the monotonic clock
+    deadline = time.perf_counter() + remaining
+    while time.perf_counter() < deadline:
+        pass
+    error = time.time() - target
+    print('%s at %s, start error %+.1f us'
+          % (name, datetime.datetime.fromtimestamp(target).strftime('%H:%M:%S.%f'), error * 1e6))
+    return error
+
+
+def wait_interval(interval, name='Start'):
+    """
+    Wait until the next full minute which is an integer multiple of interval
+    minutes, see wait_until.
+
+    :return: Start error in s.
+    :rtype: float
+    """
+    return wait_until(next_interval_start(interval), name)
+
+
+def wait_seconds(seconds, name='Start', align=False):
+    """
+    Wait for a number of seconds, see wait_until.
+
+    :param align: If True, start at a full second of the wall clock, seconds after the current full second.
+    :return: Start error in s.
+    :rtype: float
+    """
+    now = time.time()
+    return wait_until((math.floor(now) if align else now) + seconds, name)
@@ -0,0 +1,135 @@
+import threading
+from collections import deque
+
+
+class StereoPairer:
+    """
+    This class pairs the frames of the left (master) and right (slave)
+    cameras while capturing. Frames are matched by chunk timestamp: a left
+    and a right frame form a pair when their timestamps agree within
+    tolerance seconds. The device clocks of the two cameras run independently,
+    so the clock offset is taken from the first frames with the same FrameID
+    and then follows the drift of the matched pairs.
+
+    Both frame streams are in capture order, so pending frames are merged
+    like two sorted lists: a frame is unpaired once the other camera has
+    delivered a later frame outside the tolerance. Frames can be added from
+    the grab threads of both cameras.
+
+    Pairs are written to pairs.txt as
+    "pair_id left_idx right_idx left_frame_id right_frame_id skew_us", where
+    left_idx and right_idx are the frame indices (image file names) and skew
+    is the right timestamp minus the left timestamp, after the clock offset.
+    Unpaired frames are listed in unpaired.txt as "cam_idx frame_idx frame_id".
+    """
+    # weight of a new pair in the clock offset estimate
+    DRIFT_GAIN = 0.05
+    # frames per camera after which the first frames are paired if no FrameID matches
+    MAX_CALIBRATION_FRAMES = 8
+
+    def __init__(self, left, right, tolerance=0.001, pairs_path=None, unpaired_path=None):
+        """
+        :param left: Camera index of the left (master) camera.
+        :param right: Camera index of the right (slave) camera.
+        :param tolerance: Maximum timestamp difference of a pair in seconds.
+        :param pairs_path: Path of the pair index, None to keep the pairs in memory only.
+        :param unpaired_path: Path of the list of unpaired frames, optional.
+        """
+        self.left = left
+        self.right = right
+        self.tolerance_ns = int(tolerance * 1e9)
+        self.pending = {left: deque(), right: deque()}
+        self.offset = None
+        self.pairs = []
+        self.unpaired = []
+        self.lock = threading.Lock()
+
+        self.pairs_file = open(pairs_path, 'w') if pairs_path is not None else None
+        self.unpaired_path = unpaired_path
+
+    def add(self, cam_idx, frame_idx, chunk):
+        """
+        Add a stored frame of one of the cameras and pair it if possible.
+
+        :param cam_idx: Camera index.
+        :param frame_idx: Index of the frame in the sequence.
+        :param chunk: Chunk data of the frame.
+        :type chunk: ChunkInfo
+        """
+        if cam_idx not in self.pending:
+            return
+        with self.lock:
+            self.pending[cam_idx].append((frame_idx, chunk.frame_id, chunk.timestamp))
+            if self.offset is None and not self._calibrate():
+                return
+            self._match()
+
+    def _calibrate(self):
+        # Clock offset from the first frames of the same trigger, found by FrameID
+        left, right = self.pending[self.left], self.pending[self.right]
+        right_ids = dict((frame_id, ts) for _, frame_id, ts in right)
+        for _, frame_id, ts in left:
+            if frame_id in right_ids:
+                self.offset = right_ids[frame_id] - ts
+                return True
+        if len(left) >= self.MAX_CALIBRATION_FRAMES and len(right) >= self.MAX_CALIBRATION_FRAMES:
+            print('WARNING!!! No common FrameID of camera %d and camera %d, pairing from the first frames.'
+                  % (self.left, self.right))
+            self.offset = right[0][2] - left[0][2]
+            return True
+        return False
+
+    def _match(self):
+        left, right = self.pending[self.left], self.pending[self.right]
+        while len(left) > 0 and len(right) > 0:
+            skew = right[0][2] - self.offset - left[0][2]
+            if skew < -self.tolerance_ns:
+                self.unpaired.append((self.right, right[0][0], right[0][1]))
+                right.popleft()
+            elif skew > self.tolerance_ns:
+                self.unpaired.append((self.left, left[0][0], left[0][1]))
+                left.popleft()
+            else:
+                l_idx, l_id, _ = left.popleft()
+                r_idx, r_id, _ = right.popleft()
+                self.offset += int(skew * self.DRIFT_GAIN)
+                pair = (len(self.pairs), l_idx, r_idx, l_id, r_id, skew * 1e-3)
+                self.pairs.append(pair)
+                if self.pairs_file is not None:
+                    self.pairs_file.write("%d %d %d %d %d %.3f\n" % pair)
+
+    def close(self):
+        """
+        Mark the frames still pending as unpaired and close the outputs.
+        """
+        with self.lock:
+            for cam_idx in (self.left, self.right):
+                for frame_idx, frame_id, _ in self.pending[cam_idx]:
+                    self.unpaired.append((cam_idx, frame_idx, frame_id))
+                self.pending[cam_idx].clear()
+            if self.pairs_file is not None:
+                self.pairs_file.close()
+            if self.unpaired_path is not None:
+                with open(self.unpaired_path, 'w') as f:
+                    for cam_idx, frame_idx, frame_id in sorted(self.unpaired):
+                        f.write("%d %d %d\n" % (cam_idx, frame_idx, frame_id))
+
+    def stats(self):
+        skews = sorted(abs(pair[5]) for pair in self.pairs)
+        return {
+            'left': self.left,
+            'right': self.right,
+            'n_pairs': len(self.pairs),
+            'n_unpaired_left': sum(1 for cam_idx, _, _ in self.unpaired if cam_idx == self.left),
+            'n_unpaired_right': sum(1 for cam_idx, _, _ in self.unpaired if cam_idx == self.right),
+            'max_skew_us': round(skews[-1], 3) if len(skews) > 0 else 0.0,
+        }
+
+    def report(self):
+        s = self.stats()
+        print('Stereo pairs (camera %d, camera %d): %d pairs, max skew %.1f us, unpaired %d left, %d right'
+              % (self.left, self.right, s['n_pairs'], s['max_skew_us'], s['n_unpaired_left'],
+                 s['n_unpaired_right']))
+        if s['n_unpaired_left'] + s['n_unpaired_right'] > 0:
+            print('WARNING!!! %d frames could not be paired, see unpaired.txt.'
+                  % (s['n_unpaired_left'] + s['n_unpaired_right']))
@@ -0,0 +1,218 @@
+import json
+import math
+import threading
+import numpy as np
+
+# Stages of the capture path, in the order of the report. Stages without
+# samples (e.g. encode when the SDK saves the images) are left out.
+CAPTURE_STAGES = ['grab_wait', 'chunk_read', 'store', 'save', 'encode', 'write']
+CAPTURE_COUNTERS = ['grabbed', 'stored', 'incomplete', 'dropped', 'sdk_exceptions', 'missing', 'stream_dropped',
+                    'stream_lost', 'stream_underrun']
+
+
+class LatencyHistogram:
+    """
+    Histogram of durations in seconds with log-spaced buckets (1 us to 100 s,
+    BUCKETS_PER_DECADE buckets per decade, about 12% resolution). Adding a
+    sample is O(1) and the memory is fixed, so it can be used on every frame.
+    Percentiles are the upper edges of the buckets, the maximum is exact.
+    """
+    MIN_VALUE = 1e-6
+    BUCKETS_PER_DECADE = 20
+    N_DECADES = 8
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS_PER_DECADE * self.N_DECADES + 2)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        if value <= self.MIN_VALUE:
+            idx = 0
+        else:
+            idx = min(int(math.log10(value / self.MIN_VALUE) * self.BUCKETS_PER_DECADE) + 1, len(self.counts) - 1)
+        with self.lock:
+            self.counts[idx] += 1
+            self.n += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q):
+        if self.n == 0:
+            return 0.0
+        rank = q / 100.0 * self.n
+        cumulative = 0
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                upper = self.MIN_VALUE * 10 ** (float(idx) / self.BUCKETS_PER_DECADE)
+                return min(upper, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :return: Count, mean, p50, p95, p99 and max in milliseconds.
+        :rtype: dict
+        """
+        return {
+            'count': self.n,
+            'mean_ms': round(self.total / self.n * 1e3, 3) if self.n > 0 else 0.0,
+            'p50_ms': round(self.percentile(50) * 1e3, 3),
+            'p95_ms': round(self.percentile(95) * 1e3, 3),
+            'p99_ms': round(self.percentile(99) * 1e3, 3),
+            'max_ms': round(self.max * 1e3, 3),
+        }
+
+
+class DepthHistogram:
+    """
+    Histogram of queue depths sampled when frames are queued, one bucket per depth.
+    """
+
+    def __init__(self):
+        self.counts = []
+        self.n = 0
+
+    def add(self, depth):
+        depth = max(0, int(depth))
+        if depth >= len(self.counts):
+            self.counts.extend([0] * (depth + 1 - len(self.counts)))
+        self.counts[depth] += 1
+        self.n += 1
+
+    def percentile(self, q):
+        rank = q / 100.0 * self.n
+        cumulative = 0
+        for depth, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                return depth
+        return len(self.counts) - 1 if self.n > 0 else 0
+
+    def summary(self):
+        return {
+            'count': self.n,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': len(self.counts) - 1 if self.n > 0 else 0,
+        }
+
+
+class CaptureTelemetry:
+    """
+    This class collects the per-stage timing and the counters of the capture
+    path of one camera:
+
+    - grab_wait: time blocked in GetNextImage,
+    - chunk_read: reading the chunk data of the image,
+    - store: time the grab loop spends storing the image (save, copy and queue),
+    - save: SDK Image.Save (encode and write) in the grab loop or writer threads,
+    - encode / write: OpenCV encoding and file write in the encoder processes,
+    - queue_depth: depth of the write queue when a frame is queued.
+
+    The frames which could not be stored are listed in dropped_frames as
+    (frame_idx, cause).
+    """
+
+    def __init__(self, cam_idx=None):
+        self.cam_idx = cam_idx
+        self.stages = dict((name, LatencyHistogram()) for name in CAPTURE_STAGES)
+        self.queue_depth = DepthHistogram()
+        self.counters = dict((name, 0) for name in CAPTURE_COUNTERS)
+        self.dropped_frames = []
+        self.pools = {}
+
+    def record(self, stage, seconds):
+        self.stages[stage].add(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        stats = {
+            'cam_idx': self.cam_idx,
+            'stages': dict((name, self.stages[name].summary()) for name in CAPTURE_STAGES
+                           if self.stages[name].n > 0),
+            'queue_depth': self.queue_depth.summary(),
+            'counters': dict(self.counters),
+        }
+        if self.dropped_frames:
+            stats['dropped_frames'] = [[frame_idx, cause] for frame_idx, cause in self.dropped_frames]
+        stats.update(self.pools)
+        return stats
+
+    def report(self):
+        if self.cam_idx is not None:
+            print('Camera %d capture stages:' % self.cam_idx)
+        else:
+            print('Capture stages:')
+        for name in CAPTURE_STAGES:
+            hist = self.stages[name]
+            if hist.n == 0:
+                continue
+            s = hist.summary()
+            print('\t%-10s n=%-6d p50 %7.2f ms, p95 %7.2f ms, p99 %7.2f ms, max %7.2f ms'
+                  % (name, s['count'], s['p50_ms'], s['p95_ms'], s['p99_ms'], s['max_ms']))
+        if self.queue_depth.n > 0:
+            s = self.queue_depth.summary()
+            print('\tqueue      p50 %d, p95 %d, p99 %d, max %d' % (s['p50'], s['p95'], s['p99'], s['max']))
+        print('\t' + ', '.join('%s %d' % (name, self.counters[name]) for name in CAPTURE_COUNTERS))
+
+
+def sync_skew(master_log, slave_log):
+    """
+    Skew of a hardware-triggered slave camera to its master, from the frame
+    logs of both. Frames are matched by their FrameID chunk, which both
+    cameras reset at the start of the acquisition and count per trigger, so
+    frames dropped by one camera, also its first ones, do not shift the
+    pairs. The device clocks of the cameras are not synchronized, so the
+    device skew is the deviation of the timestamp difference from its median.
+
+    :param master_log: Frame log records of the master camera.
+    :param slave_log: Frame log records of the slave camera.
+    :return: Number of matched frames, host grab skew in ms (slave - master)
+        and device timestamp skew in us.
+    :rtype: dict
+    """
+    if len(master_log) == 0 or len(slave_log) == 0:
+        return {'n_pairs': 0}
+    _, idx_master, idx_slave = np.intersect1d(master_log['frame_id'], slave_log['frame_id'], return_indices=True)
+    if len(idx_master) == 0:
+        return {'n_pairs': 0}
+
+    host_skew = (slave_log['host_ts'][idx_slave] - master_log['host_ts'][idx_master]) * 1e3
+    device_diff = (slave_log['device_ts'][idx_slave].astype(np.int64)
+                   - master_log['device_ts'][idx_master].astype(np.int64))
+    device_skew = np.abs(device_diff - np.median(device_diff)) * 1e-3
+    return {
+        'n_pairs': int(len(idx_master)),
+        'host_skew_ms': {
+            'p50': round(float(np.percentile(host_skew, 50)), 3),
+            'p95': round(float(np.percentile(np.abs(host_skew), 95)), 3),
+            'max': round(float(np.abs(host_skew).max()), 3),
+        },
+        'device_skew_us': {
+            'p50': round(float(np.percentile(device_skew, 50)), 3),
+            'p95': round(float(np.percentile(device_skew, 95)), 3),
+            'max': round(float(device_skew.max()), 3),
+        },
+    }
+
+
+def write_capture_stats(path, telemetries, **info):
+    """
+    Write the capture telemetry of a sequence to a JSON file.
+
+    :param path: Path of the JSON file, usually seq_dir/capture_stats.json.
+    :param telemetries: List of CaptureTelemetry or their summaries, one per camera.
+    :param info: Additional sequence information, e.g. frame rate and number of images.
+    """
+    stats = dict(info)
+    stats['cameras'] = [telemetry if isinstance(telemetry, dict) else telemetry.summary()
+                        for telemetry in telemetries]
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2, sort_keys=True)
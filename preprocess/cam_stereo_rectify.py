@@ -12,7 +12,8 @@ from skimage import exposure
 
 sys.path.append(os.path.abspath('..'))
 from color_transfer import color_transfer
-from utils.dataset_tools import calculate_frame_offset
+from utils.dataset_tools import calculate_frame_offset, load_stereo_pairs
+from utils.calib import load_calib_format, kept_rows
 
 
 def parse_args():
@@ -68,13 +69,24 @@ def hist_equal(img):
 
 
 def rectify_for_seq(folder_dir_l, folder_dir_r, folder_dir_l_new, folder_dir_r_new, calib_yaml_l, calib_yaml_r,
-                    startid, nframes, overwrite=False):
-
-    im_names_l = sorted(os.listdir(folder_dir_l))[startid:startid+nframes]
+                    startid, nframes, overwrite=False, pairs=None):
+    """
+    Rectify the stereo images of a sequence. If the pair index of the
+    sequence is given (see utils.dataset_tools.load_stereo_pairs), the images
+    are paired by it, otherwise the sorted file lists are zipped. The crop
+    keeps the top 80% of the full frame height, also for binned or cropped
+    frames with the calibration written by the capture session.
+    """
+    if pairs is not None:
+        pairs = pairs[startid:startid+nframes]
+        im_names_l = ['%010d.jpg' % idx_l for idx_l, _ in pairs]
+        im_names_r = ['%010d.jpg' % idx_r for _, idx_r in pairs]
+    else:
+        im_names_l = sorted(os.listdir(folder_dir_l))[startid:startid+nframes]
+        im_names_r = sorted(os.listdir(folder_dir_r))[startid:startid+nframes]
     w_l, h_l, K_l, D_l, R_l, P_l = load_calib(calib_yaml_l)
     # folder_out_dir_l = folder_dir_l.replace('images_raw', 'images')
     folder_out_dir_l = folder_dir_l_new
-    im_names_r = sorted(os.listdir(folder_dir_r))[startid:startid+nframes]
     w_r, h_r, K_r, D_r, R_r, P_r = load_calib(calib_yaml_r)
     # folder_out_dir_r = folder_dir_r.replace('images_raw', 'images')
     folder_out_dir_r = folder_dir_r_new
@@ -82,6 +94,8 @@ def rectify_for_seq(folder_dir_l, folder_dir_r, folder_dir_l_new, folder_dir_r_n
     assert len(im_names_l) == len(im_names_r)
     assert w_l == w_r
     assert h_l == h_r
+    rows_l = kept_rows(0.8, load_calib_format(calib_yaml_l))
+    rows_r = kept_rows(0.8, load_calib_format(calib_yaml_r))
 
     if overwrite and os.path.exists(folder_out_dir_l):
         shutil.rmtree(folder_out_dir_l)
@@ -106,8 +120,8 @@ def rectify_for_seq(folder_dir_l, folder_dir_r, folder_dir_l_new, folder_dir_r_n
         rFrame = cv2.imread(im_dir_r)
         dstL = cv2.remap(lFrame, mapxL, mapyL,cv2.INTER_LINEAR)
         dstR = cv2.remap(rFrame, mapxR, mapyR,cv2.INTER_LINEAR)
-        dstL = dstL[:int(0.8*h_l), :, :]
-        dstR = dstR[:int(0.8*h_r), :, :]
+        dstL = dstL[:rows_l, :, :]
+        dstR = dstR[:rows_r, :, :]
 
         # dstL = hist_equal(dstL)
         # dstR = hist_equal(dstR)
@@ -147,6 +161,16 @@ def rectify_for_date(date, data_dir='D:\\RawData', data_dir_new='D:\\RawData', o
         folder_dir_l_new = os.path.join(base_dir_new, seq, 'images_0')
         folder_dir_r_new = os.path.join(base_dir_new, seq, 'images_1')
 
+        pairs = load_stereo_pairs(os.path.join(base_dir, seq))
+
+        # calibration of binned or cropped frames, written by the capture session
+        seq_calib_yaml_l = os.path.join(base_dir, seq, 'calib', 'left.yaml')
+        seq_calib_yaml_r = os.path.join(base_dir, seq, 'calib', 'right.yaml')
+        if os.path.exists(seq_calib_yaml_l) and os.path.exists(seq_calib_yaml_r):
+            seq_calib_yamls = (seq_calib_yaml_l, seq_calib_yaml_r)
+        else:
+            seq_calib_yamls = (calib_yaml_l, calib_yaml_r)
+
         if trim:
             if 'onrd' in seq:
                 frame_exp = 40
@@ -154,16 +178,16 @@ def rectify_for_date(date, data_dir='D:\\RawData', data_dir_new='D:\\RawData', o
                 frame_exp = 0
             start_time_txt = os.path.join(base_dir, seq, 'start_time_h.txt')
             offsetrc, _, _ = calculate_frame_offset(start_time_txt)
-            nframes_raw = len(os.listdir(folder_dir_r))
+            nframes_raw = len(pairs) if pairs is not None else len(os.listdir(folder_dir_r))
             nframes = nframes_raw - frame_exp - offsetrc
             startid_cam = frame_exp
         else:
             startid_cam = 0
-            nframes = len(os.listdir(folder_dir_r))
+            nframes = len(pairs) if pairs is not None else len(os.listdir(folder_dir_r))
 
         print("StartID: %d | FrameNum: %d" % (startid_cam, nframes))
-        rectify_for_seq(folder_dir_l, folder_dir_r, folder_dir_l_new, folder_dir_r_new, calib_yaml_l, calib_yaml_r,
-                        startid_cam, nframes, overwrite)
+        rectify_for_seq(folder_dir_l, folder_dir_r, folder_dir_l_new, folder_dir_r_new, seq_calib_yamls[0],
+                        seq_calib_yamls[1], startid_cam, nframes, overwrite, pairs=pairs)
 
 
 if __name__ == '__main__':
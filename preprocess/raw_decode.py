@@ -0,0 +1,82 @@
+import os
+import sys
+import argparse
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.abspath('..'))
+from utils.image_codec import write_image
+from utils.raw_container import load_raw_container
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Debayer and encode raw frame containers')
+    parser.add_argument('--seq_dir', type=str, help='sequence directory with raw_frames*.bin')
+    parser.add_argument('--ext', type=str, default='jpg', help='output image format (jpg or png)')
+    parser.add_argument('--quality', type=int, default=95, help='JPEG quality')
+    parser.add_argument('--workers', type=int, default=0, help='number of processes (default: all cores)')
+    parser.add_argument('--remove', action="store_true", help='remove the raw containers after decoding')
+    args = parser.parse_args()
+    return args
+
+
+def decode_frames(task):
+    """
+    Debayer and encode a batch of frames of a raw container. Run in a worker
+    process; the container is memory-mapped again by every task.
+    """
+    container_path, out_dir, slots, ext, quality = task
+    header, index, frames = load_raw_container(container_path)
+    for slot in slots:
+        filename = os.path.join(out_dir, '%010d.%s' % (index[slot]['frame_idx'], ext))
+        write_image(filename, np.asarray(frames[slot]), header['pixel_format'], quality)
+    return len(slots)
+
+
+def decode_container(container_path, out_dir, ext='jpg', quality=95, num_workers=0, batch_size=32):
+    """
+    Decode all frames of a raw container to image files named by frame index,
+    in parallel over num_workers processes.
+    """
+    header, _, _ = load_raw_container(container_path)
+    n_frames = int(header['n_frames'])
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    tasks = [(container_path, out_dir, list(range(start, min(start + batch_size, n_frames))), ext, quality)
+             for start in range(0, n_frames, batch_size)]
+    if num_workers <= 0:
+        num_workers = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes=num_workers)
+    try:
+        n_done = sum(pool.imap_unordered(decode_frames, tasks))
+    finally:
+        pool.close()
+        pool.join()
+    return n_done
+
+
+def decode_for_seq(seq_dir, ext='jpg', quality=95, num_workers=0, remove=False):
+    """
+    Decode the raw containers of a sequence: raw_frames.bin to images/ and
+    raw_frames_N.bin to images_N/.
+    """
+    for fname in sorted(os.listdir(seq_dir)):
+        if not (fname.startswith('raw_frames') and fname.endswith('.bin')):
+            continue
+        container_path = os.path.join(seq_dir, fname)
+        out_name = fname.replace('raw_frames', 'images')[:-len('.bin')]
+        print("Decoding %s to %s ..." % (fname, out_name))
+        n_done = decode_container(container_path, os.path.join(seq_dir, out_name), ext, quality, num_workers)
+        print("Decoded %d frames." % n_done)
+        if remove:
+            os.remove(container_path)
+
+
+if __name__ == '__main__':
+    """
+    Example:
+        python raw_decode.py --seq_dir D:\\RawData\\2019_09_29\\2019_09_29_onrd000 --ext jpg --quality 95
+    """
+    args = parse_args()
+    decode_for_seq(args.seq_dir, ext=args.ext, quality=args.quality, num_workers=args.workers, remove=args.remove)
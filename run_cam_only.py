@@ -5,81 +5,84 @@ import time
 import datetime
 from argparse import ArgumentParser
 
-from collector import run_single_camera, run_multiple_cameras, sort_cams
+from collector import CaptureSession, ProcessCaptureSession
+from collector.cam_config import CAPTURE_MODES
+from collector.rectifier import RectifyConsumer, stereo_calib_yamls
+from collector.preview import PreviewConsumer
 
 
-def main(base_dir, seq_name, frame_rate, num_img, syn=True):
+def main(base_dir, seq_names, frame_rate, num_img, syn=True, num_writers=0, concurrent=False, raw=False,
+         num_encoders=0, quality=95, verbose=True, drop_alarm=0.01, rectify=None, rectify_workers=2,
+         preview=False, preview_rate=4.0, link_budget=0, link_policy='refuse', capture_mode=None, calib=None,
+         processes=False):
     """
-    Example entry point; please see Enumeration example for more in-depth
-    comments on preparing and cleaning up the system.
-
+    Capture the given sequences back to back without radar. The cameras are
+    initialized and configured once in a CaptureSession, which is kept open
+    for all sequences.
+
+    :param seq_names: Names of the sequences, the directories must exist.
+    :param rectify: Stereo calibration directory with left.yaml and right.yaml to rectify the frames
+        while capturing, None to disable it.
+    :param rectify_workers: Number of rectification threads.
+    :param preview: If True, publish a live preview for run_preview.py.
+    :param preview_rate: Preview updates per second and camera.
+    :param link_budget: Bandwidth of the host controller in MB/s, 0 for the lowest link speed of the cameras.
+    :param link_policy: 'refuse' or 'warn' if the cameras need more bandwidth than the link budget, 'off' to
+        skip the bandwidth planning.
+    :param capture_mode: Binning and region of interest of the cameras, a key of CAPTURE_MODES, None to keep them.
+    :param calib: Stereo calibration directory with left.yaml and right.yaml of the full sensor, to write the
+        calibration of the captured frames to every sequence, default the rectify directory.
+    :param processes: If True, capture every camera in its own process, see ProcessCaptureSession. The
+        images are written by num_writers writer processes per camera (default 2).
+    :type seq_names: list
     :return: True if successful, False otherwise.
     :rtype: bool
     """
     result = True
-    seq_dir = os.path.join(base_dir, seq_name)
-
-    # Retrieve singleton reference to system object
-    system = PySpin.System.GetInstance()
-
-    # Get current library version
-    version = system.GetLibraryVersion()
-    print('Library version: %d.%d.%d.%d' % (version.major, version.minor, version.type, version.build))
-
-    # Retrieve list of cameras from the system
-    cam_list = system.GetCameras()
-    num_cameras = cam_list.GetSize()
-    cam_list = sort_cams(cam_list)
-
-    print('Number of cameras detected: %d' % num_cameras)
-
-    # Finish if there are no cameras
-    if num_cameras == 0:
-
-        # Clear camera list before releasing system
-        cam_list.Clear()
 
-        # Release system instance
-        system.ReleaseInstance()
-
-        print('Not enough cameras!')
+    consumers = []
+    if rectify:
+        consumers.append(RectifyConsumer(stereo_calib_yamls(rectify), num_workers=rectify_workers, quality=quality))
+    if preview:
+        consumers.append(PreviewConsumer(rate=preview_rate))
+
+    host_limit = link_budget * 1e6 if link_budget > 0 else None
+    calib_yamls = stereo_calib_yamls(calib or rectify) if calib or rectify else None
+    if processes:
+        if consumers:
+            print('WARNING!!! Rectification and preview are not available with --processes.')
+        session = ProcessCaptureSession(frame_rate, num_writers=num_writers or 2, raw=raw, quality=quality,
+                                        verbose=verbose, drop_alarm=drop_alarm, host_limit=host_limit,
+                                        link_policy=link_policy, capture_mode=capture_mode, calib_yamls=calib_yamls)
+    else:
+        session = CaptureSession(frame_rate, sync=syn, concurrent=concurrent, num_writers=num_writers, raw=raw,
+                                 num_encoders=num_encoders, quality=quality, verbose=verbose, drop_alarm=drop_alarm,
+                                 consumers=consumers, host_limit=host_limit, link_policy=link_policy,
+                                 capture_mode=capture_mode, calib_yamls=calib_yamls)
+    if not session.open():
+        session.close()
         input('Done! Press Enter to exit...')
         return False
 
-    if not syn or num_cameras == 1:
-        # Run example on each camera
-        for i, cam in enumerate(cam_list):
-
-            if not os.path.exists(os.path.join(seq_dir, 'images_%d' % i)):
-                os.makedirs(os.path.join(seq_dir, 'images_%d' % i))
-            if not os.path.exists(os.path.join(seq_dir, 'radar_h')):
-                os.makedirs(os.path.join(seq_dir, 'radar_h'))
-
-            print('Running example for camera %d...' % i)
-
-            result &= run_single_camera(cam, seq_dir, frame_rate, num_img, radar=False)
-            print('Camera %d example complete... \n' % i)
-
-    else:
+    if not session.single:
         print("***** Runnng under syn mode...")
-        for i in range(num_cameras):
 
+    for seq_name in seq_names:
+        time_global = time.time()
+        seq_dir = os.path.join(base_dir, seq_name)
+
+        for i in range(session.num_cameras):
             if not os.path.exists(os.path.join(seq_dir, 'images_%d' % i)):
                 os.makedirs(os.path.join(seq_dir, 'images_%d' % i))
             if not os.path.exists(os.path.join(seq_dir, 'radar_h')):
                 os.makedirs(os.path.join(seq_dir, 'radar_h'))
 
-        # Run example on all cameras
-        print('Running example for all cameras...')
-
-        result = run_multiple_cameras(cam_list, seq_dir, frame_rate, num_img, radar=False)
+        print('Running sequence %s...' % seq_name)
+        result &= session.run_sequence(seq_dir, num_img, radar=False)
 
-    # Clear camera list before releasing system
-    # cam_list.Clear()
-    del cam_list
+        print("Time consumption: %s" % (time.time() - time_global))
 
-    # Release system instance
-    system.ReleaseInstance()
+    result &= session.close()
 
     return result
 
@@ -92,6 +95,42 @@ if __name__ == '__main__':
     parser.add_argument('-fr', '--framerate', dest='frame_rate', help='set acquisition framerate')
     parser.add_argument('-n', '--numimg', dest='number_of_images', help='set acquisition image number')
     parser.add_argument('-ns', '--numseq', dest='number_of_seqs', help='set acquisition sequence number')
+    parser.add_argument('-w', '--writers', dest='num_writers', type=int, default=0,
+                        help='number of image writer threads (0: save images in the grab loop)')
+    parser.add_argument('-c', '--concurrent', dest='concurrent', action='store_true',
+                        help='grab images of each camera in a dedicated thread')
+    parser.add_argument('-r', '--raw', dest='raw', action='store_true',
+                        help='write raw frames to a container, decode later with preprocess/raw_decode.py')
+    parser.add_argument('-e', '--encoders', dest='num_encoders', type=int, default=0,
+                        help='number of JPEG encoder processes per camera (0: use writer threads or the SDK)')
+    parser.add_argument('-q', '--quality', dest='quality', type=int, default=95,
+                        help='JPEG quality of the encoder processes, lowered automatically under backpressure')
+    parser.add_argument('--quiet', dest='verbose', action='store_false',
+                        help='do not print a line for every frame, see capture_stats.json for the summary')
+    parser.add_argument('--drop_alarm', dest='drop_alarm', type=float, default=0.01,
+                        help='warn when more than this fraction of frames is missing (0: disable)')
+    parser.add_argument('--rectify', dest='rectify', default=None,
+                        help='stereo calibration directory (left.yaml, right.yaml) to write rectified frames '
+                             'to images_rect_N while capturing')
+    parser.add_argument('--rectify_workers', dest='rectify_workers', type=int, default=2,
+                        help='number of rectification threads')
+    parser.add_argument('--preview', dest='preview', action='store_true',
+                        help='publish a live preview, show it with run_preview.py')
+    parser.add_argument('--preview_rate', dest='preview_rate', type=float, default=4.0,
+                        help='preview updates per second and camera')
+    parser.add_argument('--link_budget', dest='link_budget', type=float, default=0,
+                        help='bandwidth of the host controller in MB/s (0: lowest link speed of the cameras)')
+    parser.add_argument('--link_policy', dest='link_policy', default='refuse', choices=['refuse', 'warn', 'off'],
+                        help='refuse or warn if the cameras need more bandwidth than the link budget '
+                             '(off: keep the throughput limits)')
+    parser.add_argument('--capture_mode', dest='capture_mode', default=None, choices=sorted(CAPTURE_MODES.keys()),
+                        help='binning and sensor rows read out (top: rows kept by the rectification crop)')
+    parser.add_argument('--calib', dest='calib', default=None,
+                        help='stereo calibration directory (left.yaml, right.yaml) to write the calibration of the '
+                             'captured frames to each sequence (default: the --rectify directory)')
+    parser.add_argument('-p', '--processes', dest='processes', action='store_true',
+                        help='capture each camera in its own process, images written by --writers writer '
+                             'processes per camera (default 2)')
     args = parser.parse_args()
 
     now = datetime.datetime.now()
@@ -182,18 +221,13 @@ if __name__ == '__main__':
             pass
 
     for name in args.sequence_name:
-        time_global = time.time()
         data_dir = os.path.join(args.base_dir, name)
         os.makedirs(data_dir)
 
-    #     if not os.path.exists(os.path.join(data_dir, 'images')):
-    #         os.makedirs(os.path.join(data_dir, 'images'))
-    #     if not os.path.exists(os.path.join(data_dir, 'radar')):
-    #         os.makedirs(os.path.join(data_dir, 'radar'))
-
-        main(args.base_dir, name, float(args.frame_rate), int(float(args.number_of_images)))
-
-        print('Waiting for data processing ...')
-        time.sleep(1)
-
-        print("Time consumption: %s" % (time.time() - time_global))
+    main(args.base_dir, args.sequence_name, float(args.frame_rate), int(float(args.number_of_images)),
+         num_writers=args.num_writers, concurrent=args.concurrent, raw=args.raw,
+         num_encoders=args.num_encoders, quality=args.quality, verbose=args.verbose,
+         drop_alarm=args.drop_alarm, rectify=args.rectify, rectify_workers=args.rectify_workers,
+         preview=args.preview, preview_rate=args.preview_rate, link_budget=args.link_budget,
+         link_policy=args.link_policy, capture_mode=args.capture_mode, calib=args.calib,
+         processes=args.processes)
@@ -5,96 +5,112 @@ import time
 import datetime
 from argparse import ArgumentParser
 
-from collector import run_single_camera, run_multiple_cameras, sort_cams
+from collector import CaptureSession, ProcessCaptureSession
+from collector.cam_config import CAPTURE_MODES
+from collector.rectifier import RectifyConsumer, stereo_calib_yamls
+from collector.preview import PreviewConsumer
 from collector import copy_radar_data
+from collector.radar_driver import make_radar_backend, start_radar_transfer, RADAR_BACKENDS
+from collector.radar_service import RadarClient, LocalRadarClient, DEFAULT_RADAR_PORT
 
 
-def main(base_dir, seq_name, frame_rate, num_img, syn=False, interval=0):
+def main(base_dir, seq_names, frame_rate, num_img, syn=False, interval=0, num_writers=0, concurrent=False, raw=False,
+         num_encoders=0, quality=95, verbose=True, drop_alarm=0.01, rectify=None, rectify_workers=2,
+         preview=False, preview_rate=4.0, link_budget=0, link_policy='refuse', capture_mode=None, calib=None,
+         processes=False, radar_service=0, radar_backend='matlab'):
     """
-    Example entry point; please see Enumeration example for more in-depth
-    comments on preparing and cleaning up the system.
-
+    Capture the given sequences back to back. The cameras are initialized
+    and configured once in a CaptureSession, which is kept open for all
+    sequences; the radar data is moved to each sequence while it is recorded.
+
+    :param seq_names: Names of the sequences, the directories must exist.
+    :param rectify: Stereo calibration directory with left.yaml and right.yaml to rectify the frames
+        while capturing, None to disable it.
+    :param rectify_workers: Number of rectification threads.
+    :param preview: If True, publish a live preview for run_preview.py.
+    :param preview_rate: Preview updates per second and camera.
+    :param link_budget: Bandwidth of the host controller in MB/s, 0 for the lowest link speed of the cameras.
+    :param link_policy: 'refuse' or 'warn' if the cameras need more bandwidth than the link budget, 'off' to
+        skip the bandwidth planning.
+    :param capture_mode: Binning and region of interest of the cameras, a key of CAPTURE_MODES, None to keep them.
+    :param calib: Stereo calibration directory with left.yaml and right.yaml of the full sensor, to write the
+        calibration of the captured frames to every sequence, default the rectify directory.
+    :param processes: If True, capture every camera in its own process, see ProcessCaptureSession. The
+        images are written by num_writers writer processes per camera (default 2).
+    :param radar_service: Port of a running radar service (run_radar_service.py), which keeps the MATLAB
+        engine warm, 0 to start a MATLAB engine for every sequence.
+    :param radar_backend: Radar control backend without a radar service, one of RADAR_BACKENDS. 'sim' records
+        synthetic raw radar files as long as the sequences, so the whole flow runs without the TI tools.
+    :type seq_names: list
     :return: True if successful, False otherwise.
     :rtype: bool
     """
     result = True
     vertical = False
 
-    seq_dir = os.path.join(base_dir, seq_name)
-
-    # Retrieve singleton reference to system object
-    system = PySpin.System.GetInstance()
-
-    # Get current library version
-    version = system.GetLibraryVersion()
-    print('Library version: %d.%d.%d.%d' % (version.major, version.minor, version.type, version.build))
-
-    # Retrieve list of cameras from the system
-    cam_list = system.GetCameras()
-    num_cameras = cam_list.GetSize()
-    cam_list = sort_cams(cam_list)
-
-    print('Number of cameras detected: %d' % num_cameras)
-
-    # Finish if there are no cameras
-    if num_cameras == 0:
-
-        # Clear camera list before releasing system
-        cam_list.Clear()
-
-        # Release system instance
-        system.ReleaseInstance()
-
-        print('Not enough cameras!')
+    consumers = []
+    if rectify:
+        consumers.append(RectifyConsumer(stereo_calib_yamls(rectify), num_workers=rectify_workers, quality=quality))
+    if preview:
+        consumers.append(PreviewConsumer(rate=preview_rate))
+
+    radar_client = None
+    if radar_service:
+        radar_client = RadarClient(radar_service)
+        if radar_client.status() is None:
+            print('Radar service is not running, start run_radar_service.py first.')
+            return False
+    elif radar_backend != 'matlab':
+        radar_client = LocalRadarClient(make_radar_backend(radar_backend, duration=num_img / frame_rate))
+    radar_root = radar_client.postproc_dir() if radar_client is not None else None
+
+    host_limit = link_budget * 1e6 if link_budget > 0 else None
+    calib_yamls = stereo_calib_yamls(calib or rectify) if calib or rectify else None
+    if processes:
+        if consumers:
+            print('WARNING!!! Rectification and preview are not available with --processes.')
+        session = ProcessCaptureSession(frame_rate, num_writers=num_writers or 2, raw=raw, quality=quality,
+                                        verbose=verbose, drop_alarm=drop_alarm, host_limit=host_limit,
+                                        link_policy=link_policy, capture_mode=capture_mode, calib_yamls=calib_yamls,
+                                        radar_client=radar_client)
+    else:
+        session = CaptureSession(frame_rate, sync=not syn, concurrent=concurrent, num_writers=num_writers, raw=raw,
+                                 num_encoders=num_encoders, quality=quality, verbose=verbose, drop_alarm=drop_alarm,
+                                 consumers=consumers, host_limit=host_limit, link_policy=link_policy,
+                                 capture_mode=capture_mode, calib_yamls=calib_yamls, radar_client=radar_client)
+    if not session.open():
+        session.close()
         input('Done! Press Enter to exit...')
         return False
 
-    if syn or num_cameras == 1:
-        # Run example on each camera
-        for i, cam in enumerate(cam_list):
-            if not os.path.exists(os.path.join(seq_dir, 'images_%d' % i)):
-                os.makedirs(os.path.join(seq_dir, 'images_%d' % i))
-
-        if not os.path.exists(os.path.join(seq_dir, 'radar_h')):
-            os.makedirs(os.path.join(seq_dir, 'radar_h'))
-
-            print('Running example for camera %d...' % i)
-
-            result &= run_single_camera(cam, seq_dir, frame_rate, num_img, radar=True, interval=interval)
-            print('Camera %d example complete... \n' % i)
+    for seq_name in seq_names:
+        time_global = time.time()
+        seq_dir = os.path.join(base_dir, seq_name)
 
-        # Release reference to camera
-        # NOTE: Unlike the C++ examples, we cannot rely on pointer objects being automatically
-        # cleaned up when going out of scope.
-        # The usage of del is preferred to assigning the variable to None.
-        del cam
-
-    else:
-
-        for i in range(num_cameras):
+        for i in range(session.num_cameras):
             if not os.path.exists(os.path.join(seq_dir, 'images_%d' % i)):
                 os.makedirs(os.path.join(seq_dir, 'images_%d' % i))
 
         if not os.path.exists(os.path.join(seq_dir, 'radar_h')):
             os.makedirs(os.path.join(seq_dir, 'radar_h'))
 
-        # Run example on all cameras
-        print('Running example for all cameras...')
+        # the radar files are moved to the sequence while recording
+        transfer = start_radar_transfer(base_dir, seq_name, vertical, radar_root)
 
-        result = run_multiple_cameras(cam_list, seq_dir, frame_rate, num_img, radar=True, interval=interval)
+        print('Running sequence %s...' % seq_name)
+        result &= session.run_sequence(seq_dir, num_img, radar=True, interval=interval)
 
-    # Clear camera list before releasing system
-    # cam_list.Clear()
-    del cam_list
+        print('Done! Copy radar data...')
 
-    # Release system instance
-    system.ReleaseInstance()
+        # move the rest of the radar data files to right place
+        copy_radar_data(base_dir, seq_name, vertical, radar_root, transfer=transfer)
 
-    print('Done! Copy radar data...')
+        print("Time consumption: %s" % (time.time() - time_global))
 
-    # move radar data files to right place
-    time.sleep(1)
-    copy_radar_data(base_dir, seq_name, vertical)
+    result &= session.close()
+    if radar_client is not None:
+        radar_client.report()
+        radar_client.close()
 
     return result
 
@@ -108,6 +124,48 @@ if __name__ == '__main__':
     parser.add_argument('-n', '--numimg', dest='number_of_images', help='set acquisition image number')
     parser.add_argument('-ns', '--numseq', dest='number_of_seqs', help='set acquisition sequence number')
     parser.add_argument('-i', '--interval', dest='interval', help='set time interval')
+    parser.add_argument('-w', '--writers', dest='num_writers', type=int, default=0,
+                        help='number of image writer threads (0: save images in the grab loop)')
+    parser.add_argument('-c', '--concurrent', dest='concurrent', action='store_true',
+                        help='grab images of each camera in a dedicated thread')
+    parser.add_argument('-r', '--raw', dest='raw', action='store_true',
+                        help='write raw frames to a container, decode later with preprocess/raw_decode.py')
+    parser.add_argument('-e', '--encoders', dest='num_encoders', type=int, default=0,
+                        help='number of JPEG encoder processes per camera (0: use writer threads or the SDK)')
+    parser.add_argument('-q', '--quality', dest='quality', type=int, default=95,
+                        help='JPEG quality of the encoder processes, lowered automatically under backpressure')
+    parser.add_argument('--quiet', dest='verbose', action='store_false',
+                        help='do not print a line for every frame, see capture_stats.json for the summary')
+    parser.add_argument('--drop_alarm', dest='drop_alarm', type=float, default=0.01,
+                        help='warn when more than this fraction of frames is missing (0: disable)')
+    parser.add_argument('--rectify', dest='rectify', default=None,
+                        help='stereo calibration directory (left.yaml, right.yaml) to write rectified frames '
+                             'to images_rect_N while capturing')
+    parser.add_argument('--rectify_workers', dest='rectify_workers', type=int, default=2,
+                        help='number of rectification threads')
+    parser.add_argument('--preview', dest='preview', action='store_true',
+                        help='publish a live preview, show it with run_preview.py')
+    parser.add_argument('--preview_rate', dest='preview_rate', type=float, default=4.0,
+                        help='preview updates per second and camera')
+    parser.add_argument('--link_budget', dest='link_budget', type=float, default=0,
+                        help='bandwidth of the host controller in MB/s (0: lowest link speed of the cameras)')
+    parser.add_argument('--link_policy', dest='link_policy', default='refuse', choices=['refuse', 'warn', 'off'],
+                        help='refuse or warn if the cameras need more bandwidth than the link budget '
+                             '(off: keep the throughput limits)')
+    parser.add_argument('--capture_mode', dest='capture_mode', default=None, choices=sorted(CAPTURE_MODES.keys()),
+                        help='binning and sensor rows read out (top: rows kept by the rectification crop)')
+    parser.add_argument('--calib', dest='calib', default=None,
+                        help='stereo calibration directory (left.yaml, right.yaml) to write the calibration of the '
+                             'captured frames to each sequence (default: the --rectify directory)')
+    parser.add_argument('-p', '--processes', dest='processes', action='store_true',
+                        help='capture each camera in its own process, images written by --writers writer '
+                             'processes per camera (default 2)')
+    parser.add_argument('--radar_service', dest='radar_service', type=int, nargs='?', const=DEFAULT_RADAR_PORT,
+                        default=0, help='control the radar through the radar service on this port (default %d), see '
+                             'run_radar_service.py, instead of starting MATLAB for each sequence'
+                             % DEFAULT_RADAR_PORT)
+    parser.add_argument('--radar_backend', dest='radar_backend', default='matlab', choices=RADAR_BACKENDS,
+                        help='radar control without a radar service (sim: synthetic raw radar files, no TI tools)')
     args = parser.parse_args()
 
     now = datetime.datetime.now()
@@ -212,12 +270,10 @@ if __name__ == '__main__':
         data_dir = os.path.join(args.base_dir, name)
         os.makedirs(data_dir)
 
-    #     if not os.path.exists(os.path.join(data_dir, 'images')):
-    #         os.makedirs(os.path.join(data_dir, 'images'))
-    #     if not os.path.exists(os.path.join(data_dir, 'radar_h')):
-    #         os.makedirs(os.path.join(data_dir, 'radar_h'))
-
-        main(args.base_dir, name, float(args.frame_rate), int(float(args.number_of_images)), interval=int(float(args.interval)))
-
-        print('Waiting for data processing ...')
-        time.sleep(1)
+    main(args.base_dir, args.sequence_name, float(args.frame_rate), int(float(args.number_of_images)),
+         interval=int(float(args.interval)), num_writers=args.num_writers, concurrent=args.concurrent, raw=args.raw,
+         num_encoders=args.num_encoders, quality=args.quality, verbose=args.verbose, drop_alarm=args.drop_alarm,
+         rectify=args.rectify, rectify_workers=args.rectify_workers,
+         preview=args.preview, preview_rate=args.preview_rate, link_budget=args.link_budget,
+         link_policy=args.link_policy, capture_mode=args.capture_mode, calib=args.calib,
+         processes=args.processes, radar_service=args.radar_service, radar_backend=args.radar_backend)
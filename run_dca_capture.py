@@ -0,0 +1,46 @@
+import os
+from argparse import ArgumentParser
+
+from collector.dca_capture import DCACapture, DCA_DATA_PORT, FORMAT1_FRAME_SIZE
+
+
+def main(out_dir, num_frames=0, frame_size=FORMAT1_FRAME_SIZE, host='', port=DCA_DATA_PORT, idle_timeout=2.0):
+    """
+    Record the raw data stream of the DCA1000 to out_dir until num_frames
+    frames are written, the stream stops or Ctrl+C. The radar is configured
+    and started by mmWave Studio, without its own recording.
+
+    :return: Packet loss statistics, see collector.dca_capture.FrameAssembler.summary.
+    :rtype: dict
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    capture = DCACapture(out_dir, frame_size=frame_size, num_frames=num_frames, host=host, port=port,
+                         idle_timeout=idle_timeout)
+    capture.start()
+    try:
+        while not capture.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        print('Interrupted.')
+    return capture.stop()
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser()
+    parser.add_argument('-o', '--out_dir', dest='out_dir', required=True,
+                        help='output directory, e.g. the radar_h directory of the sequence')
+    parser.add_argument('-n', '--frames', dest='num_frames', type=int, default=0,
+                        help='number of frames to record (0: until the stream stops)')
+    parser.add_argument('--frame_size', dest='frame_size', type=int, default=FORMAT1_FRAME_SIZE,
+                        help='bytes per frame (default: format1, %d)' % FORMAT1_FRAME_SIZE)
+    parser.add_argument('--host', dest='host', default='',
+                        help='local address to listen on, e.g. 192.168.33.30 (default: all)')
+    parser.add_argument('-p', '--port', dest='port', type=int, default=DCA_DATA_PORT,
+                        help='raw data port of the DCA1000')
+    parser.add_argument('--timeout', dest='idle_timeout', type=float, default=2.0,
+                        help='stop when no packet has arrived for this many seconds (0: never)')
+    args = parser.parse_args()
+
+    main(args.out_dir, args.num_frames, args.frame_size, args.host, args.port, args.idle_timeout)
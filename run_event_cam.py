@@ -0,0 +1,87 @@
+import PySpin
+import os
+import datetime
+from argparse import ArgumentParser
+
+from collector import sort_cams
+from collector.event_driver import run_event_capture
+
+
+def main(base_dir, seq_name, frame_rate, pre_seconds, post_seconds, flush_margin=3.0, keyboard=True, port=0,
+         timer=0, max_events=0):
+    """
+    Entry point of the event capture: the cameras capture continuously into
+    ring buffers and every trigger writes the frames around it as a sequence.
+
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    # Retrieve singleton reference to system object
+    system = PySpin.System.GetInstance()
+
+    # Get current library version
+    version = system.GetLibraryVersion()
+    print('Library version: %d.%d.%d.%d' % (version.major, version.minor, version.type, version.build))
+
+    # Retrieve list of cameras from the system
+    cam_list = system.GetCameras()
+    num_cameras = cam_list.GetSize()
+    cam_list = sort_cams(cam_list)
+
+    print('Number of cameras detected: %d' % num_cameras)
+
+    if num_cameras == 0:
+        del cam_list
+        system.ReleaseInstance()
+        print('Not enough cameras!')
+        return False
+
+    result = run_event_capture(cam_list, base_dir, seq_name, frame_rate, pre_seconds=pre_seconds,
+                               post_seconds=post_seconds, flush_margin=flush_margin, keyboard=keyboard,
+                               port=port, timer=timer, max_events=max_events)
+
+    # Release reference to cameras before releasing system
+    del cam_list
+
+    # Release system instance
+    system.ReleaseInstance()
+
+    return result
+
+
+if __name__ == '__main__':
+    """
+    Example:
+        python run_event_cam.py -b D:\\RawData -s onrd_event -fr 30 --pre 10 --post 5 --port 5005
+    Trigger with Enter, or from another process with a UDP datagram to 127.0.0.1:5005.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('-b', '--basedir', dest='base_dir', default='D:\\RawData', help='set base directory')
+    parser.add_argument('-s', '--seqname', dest='sequence_name', default='event', help='set sequence series name')
+    parser.add_argument('-fr', '--framerate', dest='frame_rate', type=float, default=30,
+                        help='set acquisition framerate')
+    parser.add_argument('--pre', dest='pre_seconds', type=float, default=10.0,
+                        help='seconds recorded before the trigger')
+    parser.add_argument('--post', dest='post_seconds', type=float, default=5.0,
+                        help='seconds recorded after the trigger')
+    parser.add_argument('--margin', dest='flush_margin', type=float, default=3.0,
+                        help='additional ring buffer length in seconds for writing an event')
+    parser.add_argument('--port', dest='port', type=int, default=0,
+                        help='local UDP port to receive triggers on, send "stop" to quit (0: disable)')
+    parser.add_argument('--timer', dest='timer', type=float, default=0,
+                        help='trigger every this many seconds (0: disable)')
+    parser.add_argument('--max_events', dest='max_events', type=int, default=0,
+                        help='stop after this number of events (0: no limit)')
+    parser.add_argument('--no_keyboard', dest='keyboard', action='store_false',
+                        help='do not trigger with the Enter key')
+    args = parser.parse_args()
+
+    now = datetime.datetime.now()
+    cur_date = "%s_%02d_%02d" % (now.year, now.month, now.day)
+    base_dir = os.path.join(args.base_dir, cur_date)
+    if not os.path.exists(base_dir):
+        os.makedirs(base_dir)
+
+    main(base_dir, cur_date + '_' + args.sequence_name, args.frame_rate, args.pre_seconds, args.post_seconds,
+         flush_margin=args.flush_margin, keyboard=args.keyboard, port=args.port, timer=args.timer,
+         max_events=args.max_events)
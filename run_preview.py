@@ -0,0 +1,95 @@
+import os
+import time
+import numpy as np
+import cv2
+from argparse import ArgumentParser
+
+from collector.preview import PreviewReader, default_preview_path
+
+
+def draw_status(image, cam_idx, header, dark=20.0, saturated=0.05, stale=2.0):
+    """
+    Draw the camera index, frame index, brightness and warnings on a preview image.
+
+    :return: Image with the status line.
+    :rtype: np.ndarray
+    """
+    age = time.time() - header['wall_ts']
+    warnings = []
+    if header['mean'] < dark:
+        warnings.append('DARK')
+    if header['saturated'] > saturated:
+        warnings.append('SATURATED')
+    if age > stale:
+        warnings.append('STALE %.0fs' % age)
+    text = 'cam %d  #%d  mean %.0f  sat %.1f%%  exp %d us  %s' % (
+        cam_idx, header['frame_idx'], header['mean'], header['saturated'] * 100, header['exposure'], ' '.join(warnings))
+    image = image.copy()
+    color = (0, 0, 255) if len(warnings) > 0 else (0, 255, 0)
+    cv2.putText(image, text, (5, 15), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1, cv2.LINE_AA)
+    return image
+
+
+def main(path, rate=4.0, save_dir=None, duration=0):
+    """
+    Show the live preview of a running capture, see collector/preview.py. The
+    viewer only reads the preview file, the capture never waits for it.
+
+    :param path: Path of the preview file.
+    :param rate: Refresh rate of the viewer in Hz.
+    :param save_dir: If set, write the preview to save_dir/preview.jpg instead of showing it.
+    :param duration: Stop after this many seconds, 0 to run until q is pressed.
+    """
+    while not os.path.exists(path):
+        print('Waiting for %s...' % path)
+        time.sleep(1)
+    reader = PreviewReader(path)
+    print('Preview of %d cameras from %s' % (reader.num_slots, path))
+
+    last_seq = [0] * reader.num_slots
+    tiles = [None] * reader.num_slots
+    time_start = time.time()
+    while duration == 0 or time.time() - time_start < duration:
+        updated = False
+        for i in range(reader.num_slots):
+            latest = reader.read(i, last_seq[i])
+            if latest is None:
+                continue
+            header, image = latest
+            last_seq[i] = int(header['seq'])
+            tiles[i] = draw_status(image, i, header)
+            updated = True
+
+        shown = [tile for tile in tiles if tile is not None]
+        if updated and len(shown) > 0:
+            height = max(tile.shape[0] for tile in shown)
+            mosaic = np.hstack([np.pad(tile, ((0, height - tile.shape[0]), (0, 0), (0, 0)), 'constant')
+                                for tile in shown])
+            if save_dir is not None:
+                cv2.imwrite(os.path.join(save_dir, 'preview.jpg'), mosaic)
+            else:
+                cv2.imshow('preview', mosaic)
+        if save_dir is None:
+            if cv2.waitKey(int(1000 / rate)) & 0xFF == ord('q'):
+                break
+        else:
+            time.sleep(1.0 / rate)
+    print('Preview closed, %d retries on concurrent writes.' % reader.n_retries)
+
+
+if __name__ == '__main__':
+    """
+    Example (in a second console while run_datacol.py --preview is capturing):
+        python run_preview.py
+    Press q in the preview window to quit.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--path', dest='path', default=default_preview_path(), help='preview file')
+    parser.add_argument('--rate', dest='rate', type=float, default=4.0, help='refresh rate in Hz')
+    parser.add_argument('--save', dest='save_dir', default=None,
+                        help='write the preview to SAVE_DIR/preview.jpg instead of showing a window')
+    parser.add_argument('--duration', dest='duration', type=float, default=0,
+                        help='stop after this many seconds (0: until q is pressed)')
+    args = parser.parse_args()
+
+    main(args.path, rate=args.rate, save_dir=args.save_dir, duration=args.duration)
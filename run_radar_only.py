@@ -4,29 +4,22 @@ import time
 import datetime
 from argparse import ArgumentParser
 from collector import copy_radar_data
-from collector import run_radar
-from collector import init_radar
-from collector import check_datetime
+from collector.radar_driver import start_radar, start_radar_transfer, make_radar_backend, RADAR_BACKENDS
+from collector.radar_service import RadarClient, LocalRadarClient, DEFAULT_RADAR_PORT
 
 
-def run_single_radar(seq_dir, radar=True, interval=0):
+def run_single_radar(seq_dir, radar=True, interval=0, radar_client=None):
     """
     This function is to run the other radar on different laptop
     with interval checking and copy raw radar data
+
+    :param radar_client: Client of a running radar service or a LocalRadarClient, None to start a MATLAB engine.
     """
     result = True
 
     if radar:
-        # Init radar
-        engine = init_radar()
-    
-    if radar and interval:
-        assert check_datetime(interval) is True
-    
-    if radar:
-        # Run radar
-        run_radar(engine)
-        result &= True
+        # Init and run radar, through the radar service if a client is given
+        result &= start_radar(interval, radar_client)
 
     # record start time
     start_time = time.time()
@@ -40,11 +33,12 @@ def run_single_radar(seq_dir, radar=True, interval=0):
     return result
 
 
-def main(base_dir, seq_name, frame_rate, num_img, syn=True, interval=0):
+def main(base_dir, seq_name, frame_rate, num_img, syn=True, interval=0, radar_client=None, radar_root=None):
     """
     Example entry point; please see Enumeration example for more in-depth
     comments on preparing and cleaning up the system.
 
+    :param radar_root: Directory of the raw radar files, default the mmWave Studio PostProc directory.
     :return: True if successful, False otherwise.
     :rtype: bool
     """
@@ -55,12 +49,14 @@ def main(base_dir, seq_name, frame_rate, num_img, syn=True, interval=0):
     if not os.path.exists(os.path.join(seq_dir, 'radar_v')):
         os.makedirs(os.path.join(seq_dir, 'radar_v'))
 
-    result &= run_single_radar(seq_dir, interval=interval)
+    # the radar files are moved to the sequence while recording
+    transfer = start_radar_transfer(base_dir, seq_name, vertical, radar_root)
+    result &= run_single_radar(seq_dir, interval=interval, radar_client=radar_client)
     print('Radar %d example complete... \n' % 1)
    
     # move radar data files to right place
     time.sleep(60)
-    copy_radar_data(base_dir, seq_name, vertical)
+    copy_radar_data(base_dir, seq_name, vertical, radar_root, transfer=transfer)
     print('Done! Copy radar data...')
 
     return result
@@ -75,6 +71,12 @@ if __name__ == '__main__':
     parser.add_argument('-n', '--numimg', dest='number_of_images', help='set acquisition image number')
     parser.add_argument('-ns', '--numseq', dest='number_of_seqs', help='set acquisition sequence number')
     parser.add_argument('-i', '--interval', dest='interval', help='set time interval')
+    parser.add_argument('--radar_service', dest='radar_service', type=int, nargs='?', const=DEFAULT_RADAR_PORT,
+                        default=0, help='control the radar through the radar service on this port (default %d), see '
+                                        'run_radar_service.py, instead of starting MATLAB for each sequence'
+                                        % DEFAULT_RADAR_PORT)
+    parser.add_argument('--radar_backend', dest='radar_backend', default='matlab', choices=RADAR_BACKENDS,
+                        help='radar control without a radar service (sim: synthetic raw radar files, no TI tools)')
     args = parser.parse_args()
 
     now = datetime.datetime.now()
@@ -175,6 +177,16 @@ if __name__ == '__main__':
         else:
             pass
 
+    radar_client = None
+    if args.radar_service:
+        radar_client = RadarClient(args.radar_service)
+        if radar_client.status() is None:
+            print('Radar service is not running, start run_radar_service.py first.')
+            quit()
+    elif args.radar_backend != 'matlab':
+        radar_client = LocalRadarClient(make_radar_backend(args.radar_backend))
+    radar_root = radar_client.postproc_dir() if radar_client is not None else None
+
     for name in args.sequence_name:
         data_dir = os.path.join(args.base_dir, name)
         os.makedirs(data_dir)
@@ -182,7 +194,8 @@ if __name__ == '__main__':
         # if not os.path.exists(os.path.join(data_dir, 'radar_v')):
         #     os.makedirs(os.path.join(data_dir, 'radar_v'))
 
-        main(args.base_dir, name, float(args.frame_rate), int(float(args.number_of_images)), interval=int(float(args.interval)))
+        main(args.base_dir, name, float(args.frame_rate), int(float(args.number_of_images)), interval=int(float(args.interval)),
+             radar_client=radar_client, radar_root=radar_root)
 
         print('Waiting for data processing ...')
         time.sleep(1)
@@ -0,0 +1,50 @@
+from argparse import ArgumentParser
+
+from collector.radar_driver import make_radar_backend, RADAR_BACKENDS
+from collector.radar_service import RadarService, RadarClient, DEFAULT_RADAR_PORT
+
+
+def main(port=DEFAULT_RADAR_PORT, warm=True, backend='matlab'):
+    """
+    Run the radar control service until Ctrl+C or a shutdown command. The
+    MATLAB engine is started once and used by run_datacol.py and
+    run_radar_only.py with --radar_service.
+
+    :param port: Local TCP port of the service.
+    :param warm: If True, initialize the radar backend before the first client connects.
+    :param backend: Radar control backend, one of RADAR_BACKENDS, see make_radar_backend.
+    """
+    service = RadarService(make_radar_backend(backend), port=port)
+    if warm:
+        service.execute('init')
+    service.serve_forever()
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--port', dest='port', type=int, default=DEFAULT_RADAR_PORT,
+                        help='local port of the radar service')
+    parser.add_argument('--lazy', dest='warm', action='store_false',
+                        help='start the MATLAB engine on the first init command instead of at startup')
+    parser.add_argument('--status', dest='status', action='store_true',
+                        help='print the state and command latencies of a running service and exit')
+    parser.add_argument('--shutdown', dest='shutdown', action='store_true',
+                        help='stop a running service and exit')
+    parser.add_argument('--backend', dest='backend', default='matlab', choices=RADAR_BACKENDS,
+                        help='radar control backend (sim: synthetic raw radar files, no TI tools)')
+    args = parser.parse_args()
+
+    if args.status or args.shutdown:
+        client = RadarClient(args.port)
+        if args.status:
+            reply = client.status()
+            if reply is not None:
+                for cmd, s in sorted(reply['latency_ms'].items()):
+                    print('\t%-6s n=%-4d p50 %9.1f ms, p95 %9.1f ms, max %9.1f ms'
+                          % (cmd, s['count'], s['p50_ms'], s['p95_ms'], s['max_ms']))
+        if args.shutdown:
+            client.shutdown()
+        client.close()
+    else:
+        main(args.port, args.warm, args.backend)
@@ -0,0 +1,163 @@
+"""
+Benchmark of the camera acquisition path on the simulated PySpin backend.
+
+Example:
+    python scripts/bench_acquisition.py --cameras 2 --frames 300 --fps 30 --concurrent --writers 2
+    python scripts/bench_acquisition.py --cameras 2 --frames 300 --fps 30 --processes --writers 2
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import install_pyspin
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the acquisition path on simulated cameras')
+    parser.add_argument('--cameras', type=int, default=2, help='number of simulated cameras')
+    parser.add_argument('--frames', type=int, default=150, help='number of frames per camera')
+    parser.add_argument('--fps', type=float, default=30, help='acquisition frame rate')
+    parser.add_argument('--jitter', type=float, default=0.0, help='std of frame time jitter in ms')
+    parser.add_argument('--drop_rate', type=float, default=0.0, help='probability of a frame lost in transport')
+    parser.add_argument('--incomplete_rate', type=float, default=0.0, help='probability of an incomplete image')
+    parser.add_argument('--host_bandwidth', type=float, default=0.0,
+                        help='simulated host controller bandwidth in MB/s, beyond which frames are incomplete '
+                             '(0: unlimited)')
+    parser.add_argument('--link_budget', type=float, default=0.0,
+                        help='link budget of the bandwidth planner in MB/s (0: lowest link speed)')
+    parser.add_argument('--link_policy', default='refuse', choices=['refuse', 'warn', 'off'],
+                        help='what to do if the cameras need more bandwidth than the link budget')
+    parser.add_argument('--writers', type=int, default=0, help='number of writer threads (0: save in grab loop)')
+    parser.add_argument('--concurrent', action="store_true", help='grab each camera in a dedicated thread')
+    parser.add_argument('--encoders', type=int, default=0, help='number of JPEG encoder processes per camera')
+    parser.add_argument('--quality', type=int, default=95, help='JPEG quality of the encoder processes')
+    parser.add_argument('--raw', action="store_true", help='write raw frame containers instead of images')
+    parser.add_argument('--processes', action="store_true",
+                        help='capture each camera in its own process, --writers writer processes per camera')
+    parser.add_argument('--out', type=str, default='', help='output directory (default: temporary directory)')
+    parser.add_argument('--verbose', action="store_true", help='show the output of the acquisition code')
+    args = parser.parse_args()
+    return args
+
+
+def percentiles(values):
+    if len(values) == 0:
+        return 'n/a'
+    values = np.array(values) * 1e3
+    return 'p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, max %.2f ms' % (
+        np.percentile(values, 50), np.percentile(values, 95), np.percentile(values, 99), values.max())
+
+
+def run(args, PySpin, seq_dir):
+    from collector import sort_cams
+    from collector.cam_config import CameraProfile, apply_profile
+    from collector.cam_driver import acquire_images
+    from collector.cam_mul_driver import run_multiple_cameras
+
+    if args.processes:
+        return run_processes(args, seq_dir)
+
+    system = PySpin.System.GetInstance()
+    cam_list = sort_cams(system.GetCameras())
+    for i in range(len(cam_list)):
+        os.makedirs(os.path.join(seq_dir, 'images_%d' % i))
+    os.makedirs(os.path.join(seq_dir, 'images'))
+
+    if len(cam_list) == 1:
+        # run_single_camera configures a software trigger, so the free-running
+        # acquisition is benchmarked directly
+        cam = cam_list[0]
+        cam.Init()
+        apply_profile(cam, CameraProfile(frame_rate=args.fps))
+        result = acquire_images(cam, cam.GetNodeMap(), cam.GetTLDeviceNodeMap(), seq_dir, args.fps, args.frames,
+                                radar=False, num_writers=args.writers, raw=args.raw,
+                                num_encoders=args.encoders, quality=args.quality, configure=False)
+        cam.DeInit()
+    else:
+        result = run_multiple_cameras(cam_list, seq_dir, args.fps, args.frames, radar=False,
+                                      concurrent=args.concurrent, num_writers=args.writers, raw=args.raw,
+                                      num_encoders=args.encoders, quality=args.quality,
+                                      host_limit=args.link_budget * 1e6 if args.link_budget > 0 else None,
+                                      link_policy=args.link_policy)
+    del cam_list
+    system.ReleaseInstance()
+    return result
+
+
+def run_processes(args, seq_dir):
+    from collector import ProcessCaptureSession
+
+    for i in range(args.cameras):
+        os.makedirs(os.path.join(seq_dir, 'images_%d' % i))
+    session = ProcessCaptureSession(args.fps, num_writers=args.writers or 2, raw=args.raw, quality=args.quality,
+                                    host_limit=args.link_budget * 1e6 if args.link_budget > 0 else None,
+                                    link_policy=args.link_policy)
+    result = session.open() and session.run_sequence(seq_dir, args.frames, radar=False)
+    result &= session.close()
+    return result
+
+
+def main():
+    args = parse_args()
+    out_dir = args.out if args.out != '' else tempfile.mkdtemp(prefix='bench_acq_')
+    # the simulated cameras in the camera processes follow the master through the trigger file
+    trigger_file = os.path.join(out_dir, 'trigger_line.json') if args.processes else ''
+    PySpin = install_pyspin(num_cameras=args.cameras, jitter=args.jitter * 1e-3, drop_rate=args.drop_rate,
+                            incomplete_rate=args.incomplete_rate, host_bandwidth=args.host_bandwidth * 1e6,
+                            trigger_file=trigger_file)
+
+    seq_dir = os.path.join(out_dir, 'bench_seq')
+    if os.path.exists(seq_dir):
+        shutil.rmtree(seq_dir)
+
+    print('Running %d frames on %d simulated cameras at %.1f FPS '
+          '(writers: %d, encoders: %d, concurrent: %s, processes: %s, raw: %s)...'
+          % (args.frames, args.cameras, args.fps, args.writers, args.encoders, args.concurrent, args.processes,
+             args.raw))
+    time_start = time.perf_counter()
+    if args.verbose:
+        result = run(args, PySpin, seq_dir)
+    else:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = run(args, PySpin, seq_dir)
+    elapsed = time.perf_counter() - time_start
+
+    print('Result: %s, elapsed: %.2f s, nominal: %.2f s' % (result, elapsed, args.frames / args.fps))
+    # the simulated cameras of the camera processes are not visible here
+    for i, stats in enumerate(PySpin.get_stats() if not args.processes else []):
+        n_saved = len(stats['save_latency'])
+        print('Camera %d (%s): delivered %d, saved %d (%.1f FPS), dropped %d, lost %d, incomplete %d'
+              % (i, stats['serial'], stats['delivered'], n_saved, n_saved / elapsed, stats['dropped'],
+                 stats['lost'], stats['incomplete']))
+        print('\tGrab-to-save latency: %s' % percentiles(stats['save_latency']))
+        image_dir = os.path.join(seq_dir, 'images' if args.cameras == 1 else 'images_%d' % i)
+        print('\tImage files written: %d' % len(os.listdir(image_dir)))
+
+    # Per-stage timing measured by the acquisition code
+    with open(os.path.join(seq_dir, 'capture_stats.json')) as f:
+        capture_stats = json.load(f)
+    for i, cam_stats in enumerate(capture_stats['cameras']):
+        print('Camera %d stages:' % i)
+        for name, s in sorted(cam_stats['stages'].items()):
+            print('\t%-10s p50 %7.2f ms, p95 %7.2f ms, p99 %7.2f ms, max %7.2f ms'
+                  % (name, s['p50_ms'], s['p95_ms'], s['p99_ms'], s['max_ms']))
+        print('\t%s' % ', '.join('%s %d' % item for item in sorted(cam_stats['counters'].items())))
+        if 'ring' in cam_stats:
+            print('\tring: %s' % ', '.join('%s %s' % item for item in sorted(cam_stats['ring'].items())))
+        if args.processes:
+            image_dir = os.path.join(seq_dir, 'images_%d' % i)
+            print('\tImage files written: %d' % len(os.listdir(image_dir)))
+
+    if args.out == '':
+        shutil.rmtree(out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark of the DCA1000 capture engine (collector.dca_capture) on the local
+UDP replayer (simulator.dca_replay). The replayer runs in its own process and
+sends synthetic frames, or recorded raw files with --raw, at the line rate of
+the DCA1000; the written frames are checked against the sent ones.
+
+Example:
+    python scripts/bench_dca_capture.py --frames 300
+    python scripts/bench_dca_capture.py --frames 300 --drop_rate 0.001 --reorder_rate 0.01
+    python scripts/bench_dca_capture.py --raw D:\\RawData\\2019_06_26\\2019_06_26_onrd012\\radar_h\\adc_data_Raw_0.bin
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator.fake_radar import FRAME_SIZE, synthetic_frames
+from simulator.dca_replay import DCAReplayer, LINE_RATE, PACKET_DELAY, synthetic_packets, recorded_packets
+
+# Number of distinct synthetic frames, not a divisor of the number of frame
+# buffers of the engine, so that a reused buffer held a different frame
+N_DISTINCT = 7
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the DCA1000 capture engine on a local UDP replay')
+    parser.add_argument('--frames', type=int, default=300, help='number of synthetic frames')
+    parser.add_argument('--frame_size', type=int, default=FRAME_SIZE, help='bytes per frame')
+    parser.add_argument('--raw', nargs='+', default=None, help='replay recorded raw files instead')
+    parser.add_argument('--rate', type=float, default=LINE_RATE / 1e6,
+                        help='replay rate on the wire in MB/s (default: gigabit line rate, 0: unpaced)')
+    parser.add_argument('--packet_delay', type=float, default=PACKET_DELAY * 1e6,
+                        help='delay after every packet in us (default: the DCA1000 default, 0: back to back)')
+    parser.add_argument('--drop_rate', type=float, default=0.0, help='probability of a packet not sent')
+    parser.add_argument('--reorder_rate', type=float, default=0.0, help='probability of a packet sent late')
+    parser.add_argument('--rcvbuf', type=float, default=16, help='requested UDP receive buffer in MB')
+    parser.add_argument('--out', type=str, default='', help='output directory (default: temporary directory)')
+    args = parser.parse_args()
+    return args
+
+
+def replay(args, port, result):
+    replayer = DCAReplayer(port=port, rate=args.rate * 1e6, packet_delay=args.packet_delay * 1e-6,
+                           drop_rate=args.drop_rate,
+                           reorder_rate=args.reorder_rate)
+    if args.raw:
+        packets = recorded_packets(args.raw)
+    else:
+        packets = synthetic_packets(args.frames, args.frame_size, n_distinct=N_DISTINCT)
+    result.update(replayer.send(packets))
+
+
+def check_frames(args, out_dir):
+    """
+    Compare the written frames with the synthetic frames. A complete frame
+    must equal the sent frame; every byte of an incomplete frame must equal
+    the sent byte or be zero, with at least as many zeros as missing bytes.
+
+    :return: Number of complete frames, of complete frames which differ, of
+             incomplete frames and of incomplete frames not zero-filled.
+    :rtype: tuple
+    """
+    frames = [np.frombuffer(frame, dtype=np.uint8) for frame in synthetic_frames(args.frame_size, n=N_DISTINCT)]
+    data = np.memmap(os.path.join(out_dir, 'adc_data.bin'), dtype=np.uint8, mode='r')
+    index = np.loadtxt(os.path.join(out_dir, 'adc_frames.txt'), ndmin=2)
+    n_complete, n_wrong, n_incomplete, n_bad_fill = 0, 0, 0, 0
+    for frame_id, received, missing, _ in index:
+        start = int(frame_id) * args.frame_size
+        written = data[start:start + args.frame_size]
+        sent = frames[int(frame_id) % len(frames)]
+        if missing > 0:
+            n_incomplete += 1
+            zero = written == 0
+            if not np.all((written == sent) | zero) or np.count_nonzero(zero) < missing:
+                n_bad_fill += 1
+            continue
+        n_complete += 1
+        if not np.array_equal(written, sent):
+            n_wrong += 1
+    return n_complete, n_wrong, n_incomplete, n_bad_fill
+
+
+def main():
+    args = parse_args()
+    from collector.dca_capture import DCACapture
+
+    out_dir = args.out if args.out != '' else tempfile.mkdtemp(prefix='bench_dca_')
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    capture = DCACapture(out_dir, frame_size=args.frame_size, num_frames=0 if args.raw else args.frames,
+                         host='127.0.0.1', port=0, idle_timeout=1.0, rcvbuf=int(args.rcvbuf * 1024 * 1024))
+    capture.start()
+
+    result = multiprocessing.Manager().dict()
+    replayer = multiprocessing.Process(target=replay, args=(args, capture.port, result))
+    replayer.start()
+    replayer.join()
+    capture.wait()
+    stats = capture.stop()
+
+    print('Replay: sent %d packets (%.1f MB/s), dropped %d, reordered %d'
+          % (result['sent'], result['mb_per_s'], result['dropped'], result['reordered']))
+    injected = result['dropped']
+    print('Loss beyond the injected drops: %d packets' % (stats['lost_packets'] - injected))
+    if not args.raw:
+        n_complete, n_wrong, n_incomplete, n_bad_fill = check_frames(args, out_dir)
+        print('Check: %d complete frames, %d differ from the sent frames' % (n_complete, n_wrong))
+        print('Check: %d incomplete frames, %d not zero-filled' % (n_incomplete, n_bad_fill))
+
+    if args.out == '':
+        shutil.rmtree(out_dir)
+
+
+if __name__ == '__main__':
+    main()
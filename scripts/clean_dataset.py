@@ -18,6 +18,9 @@ rename_dict = {
     'timestamps.txt': 'timestamps_0.txt',
     'timestamps_0.txt': 'timestamps_0.txt',
     'timestamps_1.txt': 'timestamps_1.txt',
+    'frame_log.bin': 'frame_log_0.bin',
+    'frame_log_0.bin': 'frame_log_0.bin',
+    'frame_log_1.bin': 'frame_log_1.bin',
     'mask_obj_img': 'masks_obj_viz',
     'depth_mono': 'depth_mono',
 }
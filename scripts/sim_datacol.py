@@ -0,0 +1,104 @@
+"""
+End-to-end run of run_datacol.py on the simulated PySpin backend and the
+simulated radar (simulator.fake_radar): camera capture, radar control and
+copy_radar_data, without cameras, MATLAB or the TI tools. The written
+sequences are checked: the number of images per camera and the raw radar
+packets copied to radar_h.
+
+Example:
+    python scripts/sim_datacol.py --sequences 2 --frames 60 --fps 30
+    python scripts/sim_datacol.py --sequences 2 --frames 60 --fps 30 --processes
+"""
+import os
+import sys
+import glob
+import shutil
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import install_pyspin
+from simulator.fake_radar import PACKET_SIZE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run run_datacol.py on simulated cameras and radar')
+    parser.add_argument('--sequences', type=int, default=2, help='number of sequences')
+    parser.add_argument('--frames', type=int, default=60, help='number of frames per camera and sequence')
+    parser.add_argument('--fps', type=float, default=30, help='acquisition frame rate')
+    parser.add_argument('--writers', type=int, default=0, help='number of writer threads (0: save in grab loop)')
+    parser.add_argument('--processes', action="store_true",
+                        help='capture each camera in its own process, --writers writer processes per camera')
+    parser.add_argument('--out', type=str, default='', help='output directory (default: temporary directory)')
+    parser.add_argument('--verbose', action="store_true", help='show the output of run_datacol')
+    args = parser.parse_args()
+    return args
+
+
+def check_raw_file(path):
+    """
+    Walk the packets of a raw radar file.
+
+    :return: Number of packets, payload bytes, number of gaps in the sequence numbers.
+    :rtype: tuple
+    """
+    data = np.fromfile(path, dtype=np.uint8)
+    n_packets, n_bytes, n_gaps = 0, 0, 0
+    pos = 0
+    last_seq = None
+    while pos + 10 <= len(data):
+        seq = int(data[pos:pos + 4].view(np.uint32)[0])
+        payload = min(PACKET_SIZE, len(data) - pos - 10)
+        if last_seq is not None and seq != last_seq + 1:
+            n_gaps += 1
+        last_seq = seq
+        n_packets += 1
+        n_bytes += payload
+        pos += 10 + payload
+    return n_packets, n_bytes, n_gaps
+
+
+def main():
+    args = parse_args()
+    out_dir = args.out if args.out != '' else tempfile.mkdtemp(prefix='sim_datacol_')
+    trigger_file = os.path.join(out_dir, 'trigger_line.json') if args.processes else ''
+    install_pyspin(num_cameras=2, trigger_file=trigger_file)
+    import run_datacol
+
+    base_dir = os.path.join(out_dir, 'data')
+    seq_names = ['sim_seq%03d' % i for i in range(args.sequences)]
+    for name in seq_names:
+        seq_dir = os.path.join(base_dir, name)
+        if os.path.exists(seq_dir):
+            shutil.rmtree(seq_dir)
+        os.makedirs(seq_dir)
+
+    print('Running %d sequences of %d frames at %.1f FPS with the simulated radar...'
+          % (args.sequences, args.frames, args.fps))
+    kwargs = dict(num_writers=args.writers, verbose=False, processes=args.processes, radar_backend='sim')
+    if args.verbose:
+        result = run_datacol.main(base_dir, seq_names, args.fps, args.frames, **kwargs)
+    else:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = run_datacol.main(base_dir, seq_names, args.fps, args.frames, **kwargs)
+    print('Result: %s' % result)
+
+    for name in seq_names:
+        seq_dir = os.path.join(base_dir, name)
+        n_images = [len(os.listdir(os.path.join(seq_dir, 'images_%d' % i))) for i in range(2)]
+        raw_files = sorted(glob.glob(os.path.join(seq_dir, 'radar_h', 'adc_data_Raw_*.bin')))
+        totals = np.array([check_raw_file(path) for path in raw_files]).reshape(-1, 3).sum(axis=0)
+        print('%s: images %s, radar files %d, packets %d, payload %.1f MB, sequence gaps %d'
+              % (name, n_images, len(raw_files), totals[0], totals[1] / 1e6, totals[2]))
+        result &= all(n == args.frames for n in n_images) and len(raw_files) > 0 and totals[2] == 0
+
+    print('Check: %s' % ('passed' if result else 'FAILED'))
+    if args.out == '':
+        shutil.rmtree(out_dir)
+    sys.exit(0 if result else 1)
+
+
+if __name__ == '__main__':
+    main()
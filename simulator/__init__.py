@@ -0,0 +1,15 @@
+import sys
+
+
+def install_pyspin(**kwargs):
+    """
+    Register the simulated backend as the PySpin module. This must be called
+    before the collector package is imported.
+
+    :param kwargs: Simulation settings, see simulator.fake_pyspin.configure.
+    :return: The simulated PySpin module.
+    """
+    from . import fake_pyspin
+    fake_pyspin.configure(**kwargs)
+    sys.modules['PySpin'] = fake_pyspin
+    return fake_pyspin
@@ -0,0 +1,123 @@
+"""
+Local stand-in for the raw data stream of a DCA1000. It sends recorded
+(adc_data_Raw_N.bin) or synthetic raw capture packets over UDP to the capture
+engine (collector.dca_capture), at the line rate of the gigabit Ethernet link
+of the DCA1000 or any other rate. Lost and reordered packets can be injected
+to test the reordering and zero filling of the engine.
+"""
+import random
+import socket
+import time
+
+from .fake_radar import FRAME_SIZE, PacketStream, synthetic_frames, read_raw_packets
+
+DCA_DATA_PORT = 4098
+# 1 Gbit/s, including the Ethernet, IP and UDP overhead of 66 bytes per packet
+LINE_RATE = 125e6
+PACKET_OVERHEAD = 66
+# Default delay between two packets of the DCA1000 configured by mmWave Studio, in s
+PACKET_DELAY = 25e-6
+
+
+def synthetic_packets(num_frames, frame_size=FRAME_SIZE, seed=0, n_distinct=4):
+    """
+    :param n_distinct: Number of distinct frames, which are sent in turn.
+    :return: Generator of the packets of num_frames synthetic frames, see simulator.fake_radar.
+    """
+    frames = synthetic_frames(frame_size, n=n_distinct, seed=seed)
+    stream = PacketStream()
+    for i in range(num_frames):
+        for packet in stream.push(frames[i % len(frames)], last=i == num_frames - 1):
+            yield packet
+
+
+def recorded_packets(paths):
+    """
+    :return: Generator of the packets of raw capture files, in the order of the files.
+    """
+    for path in paths:
+        for packet in read_raw_packets(path):
+            yield packet
+
+
+class DCAReplayer:
+    """
+    Sends raw capture packets to a UDP port at a fixed rate.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DCA_DATA_PORT, rate=LINE_RATE, packet_delay=PACKET_DELAY,
+                 drop_rate=0.0, reorder_rate=0.0, seed=0):
+        """
+        :param host: Address of the capture engine.
+        :param port: Data port of the capture engine.
+        :param rate: Rate on the wire in bytes/s, 0 to send as fast as possible.
+        :param packet_delay: Delay after every packet in s, as configured in the DCA1000.
+        :param drop_rate: Probability of a packet which is not sent.
+        :param reorder_rate: Probability of a packet which is sent after the next one.
+        """
+        self.address = (host, port)
+        self.rate = rate
+        self.packet_delay = packet_delay
+        self.drop_rate = drop_rate
+        self.reorder_rate = reorder_rate
+        self.random = random.Random(seed)
+        self.n_sent = 0
+        self.n_dropped = 0
+        self.n_reordered = 0
+        self.n_bytes = 0
+        self.elapsed = 0.0
+
+    def send(self, packets):
+        """
+        Send the packets, paced to the rate.
+
+        :param packets: Iterable of packets with header.
+        :return: Statistics of the replay.
+        :rtype: dict
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        held = None
+        wire_time = 0.0
+        time_start = time.perf_counter()
+        try:
+            for packet in packets:
+                if self.drop_rate > 0 and self.random.random() < self.drop_rate:
+                    self.n_dropped += 1
+                    continue
+                if held is None and self.reorder_rate > 0 and self.random.random() < self.reorder_rate:
+                    held = packet
+                    self.n_reordered += 1
+                    continue
+                for out in (packet, held) if held is not None else (packet, ):
+                    self._send(sock, out)
+                    if self.rate > 0:
+                        wire_time += (len(out) + PACKET_OVERHEAD) / self.rate + self.packet_delay
+                held = None
+
+                # sleep instead of spinning, the replayer may share the CPU with the capture engine
+                if self.rate > 0 and self.n_sent % 8 == 0:
+                    ahead = time_start + wire_time - time.perf_counter()
+                    if ahead > 0.0002:
+                        time.sleep(ahead)
+            if held is not None:
+                self._send(sock, held)
+        finally:
+            sock.close()
+        self.elapsed = time.perf_counter() - time_start
+        return self.summary()
+
+    def _send(self, sock, packet):
+        while True:
+            try:
+                sock.sendto(packet, self.address)
+                break
+            except BlockingIOError:
+                time.sleep(0.0001)
+        self.n_sent += 1
+        self.n_bytes += len(packet)
+
+    def summary(self):
+        return {'sent': self.n_sent, 'dropped': self.n_dropped, 'reordered': self.n_reordered,
+                'bytes': self.n_bytes, 'elapsed': self.elapsed,
+                'mb_per_s': self.n_bytes / self.elapsed / 1e6 if self.elapsed > 0 else 0.0}
@@ -0,0 +1,979 @@
+"""
+Simulated PySpin backend. It implements the subset of the Spinnaker Python API
+used by the collector package, so that the acquisition path can be run and
+benchmarked on any machine without FLIR cameras or the Spinnaker SDK.
+
+Each simulated camera produces synthetic frames (1440x1080 BayerRG8 by default)
+at the rate set in its AcquisitionFrameRate node. Frame jitter, frames lost in
+transport and incomplete images can be injected with configure(). Frames that
+are not fetched by GetNextImage before the stream buffers are full are dropped,
+like on the real stream. A camera in hardware trigger mode follows the frame
+clock of the free-running (master) camera of the same system, or of a master
+camera in another process if the trigger_file setting is set.
+
+Use simulator.install_pyspin() to register this module as PySpin.
+"""
+import os
+import random
+import threading
+import time
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+EVENT_TIMEOUT_INFINITE = 0xFFFFFFFFFFFFFFFF
+
+PixelFormat_Mono8 = 0
+PixelFormat_BayerRG8 = 1
+PixelFormat_BGR8 = 2
+PixelFormat_RGB8 = 3
+PIXEL_FORMAT_NAMES = ['Mono8', 'BayerRG8', 'BGR8', 'RGB8']
+
+HQ_LINEAR = 0
+NEAREST_NEIGHBOR = 1
+DIRECTIONAL_FILTER = 2
+
+IMAGE_NO_ERROR = 0
+IMAGE_DATA_INCOMPLETE = 5
+
+SENSOR_WIDTH = 1440
+SENSOR_HEIGHT = 1080
+# Sensor readout limit of a BFS-U3-16S2 at full resolution
+SENSOR_MAX_FRAME_RATE = 226.0
+
+_config = {
+    'num_cameras': int(os.environ.get('FAKE_PYSPIN_CAMERAS', 2)),
+    'serials': ['18384019', '19325055', '19325056', '19325057', '19325058', '19325059'],
+    'pixel_format': 'BayerRG8',
+    'jitter': float(os.environ.get('FAKE_PYSPIN_JITTER', 0.0)),                # std of frame time jitter in s
+    'drop_rate': float(os.environ.get('FAKE_PYSPIN_DROP_RATE', 0.0)),          # probability of a lost frame
+    'incomplete_rate': float(os.environ.get('FAKE_PYSPIN_INCOMPLETE_RATE', 0.0)),
+    'trigger_skew': 20e-6,                                                     # slave trigger delay in s
+    'max_buffers': 100,
+    'link_speed': 500000000,                                                   # USB3 link speed in bytes/s
+    # bandwidth of the host controller shared by all cameras in bytes/s, 0 for unlimited; beyond it,
+    # frames become incomplete
+    'host_bandwidth': float(os.environ.get('FAKE_PYSPIN_HOST_BANDWIDTH', 0)),
+    # file shared by the processes of a process-per-camera capture, which carries the trigger output of the
+    # master camera to the hardware-triggered cameras in the other processes; '' to disable it
+    'trigger_file': os.environ.get('FAKE_PYSPIN_TRIGGER_FILE', ''),
+    'seed': 0,
+}
+
+_t0 = time.perf_counter()
+_last_system = None
+
+
+def configure(**kwargs):
+    """
+    Update the simulation settings. Takes effect for cameras created by the next
+    System.GetInstance().
+    """
+    for key, value in kwargs.items():
+        if key not in _config:
+            raise KeyError('Unknown simulation setting: %s' % key)
+        _config[key] = value
+
+
+def get_stats():
+    """
+    Statistics of the cameras of the current (or last released) system: frames
+    delivered, dropped, lost and incomplete, and grab-to-save latencies in s.
+    """
+    if _last_system is None:
+        return []
+    return [cam.stats() for cam in _last_system.cameras]
+
+
+class SpinnakerException(Exception):
+    pass
+
+
+class _TriggerLine:
+    """
+    Trigger output of a master camera, shared with the other processes
+    through the trigger file. time.perf_counter is the monotonic clock of the
+    system, so the start times compare across processes. It stands in for
+    the master camera in Camera._timeline.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.start = None
+        self.acquiring = False
+        self.frame_rate = 0.0
+
+    def publish(self, start, frame_rate, acquiring):
+        tmp_path = self.path + '.%d.tmp' % os.getpid()
+        np.array([start, frame_rate, 1.0 if acquiring else 0.0], dtype=np.float64).tofile(tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def read(self):
+        """
+        :return: self with the state of the master, None if no master has published it.
+        """
+        if not os.path.exists(self.path):
+            return None
+        values = np.fromfile(self.path, dtype=np.float64)
+        if len(values) < 3:
+            return None
+        self.start, self.frame_rate, self.acquiring = float(values[0]), float(values[1]), values[2] > 0
+        return self
+
+    def _frame_rate(self):
+        return self.frame_rate
+
+
+# *** Nodes ***
+
+class _Node:
+    def __init__(self, name, display_name=None, available=True, readable=True, writable=True):
+        self.name = name
+        self.display_name = display_name if display_name is not None else name
+        self.available = available
+        self.readable = readable
+        self.writable = writable
+
+    def GetName(self):
+        return self.name
+
+    def GetDisplayName(self):
+        return self.display_name
+
+    def is_available(self):
+        return self.available() if callable(self.available) else self.available
+
+    def is_readable(self):
+        return self.is_available() and (self.readable() if callable(self.readable) else self.readable)
+
+    def is_writable(self):
+        return self.is_available() and (self.writable() if callable(self.writable) else self.writable)
+
+    def ToString(self):
+        return str(self.GetValue())
+
+    def GetValue(self):
+        raise SpinnakerException('Node %s has no value' % self.name)
+
+
+class _ValueNode(_Node):
+    def __init__(self, name, value=None, getter=None, setter=None, vmin=None, vmax=None, **kwargs):
+        _Node.__init__(self, name, **kwargs)
+        self.value = value
+        self.getter = getter
+        self.setter = setter
+        self.vmin = vmin
+        self.vmax = vmax
+
+    def GetValue(self):
+        if not self.is_readable():
+            raise SpinnakerException('Node %s is not readable' % self.name)
+        if self.getter is not None:
+            return self.getter()
+        return self.value
+
+    def SetValue(self, value):
+        if not self.is_writable():
+            raise SpinnakerException('Node %s is not writable' % self.name)
+        vmin, vmax = self.GetMin(), self.GetMax()
+        if vmin is not None and value < vmin or vmax is not None and value > vmax:
+            raise SpinnakerException('Value %s of node %s out of range [%s, %s]' % (value, self.name, vmin, vmax))
+        if self.setter is not None:
+            self.setter(value)
+        else:
+            self.value = value
+
+    def GetMin(self):
+        return self.vmin() if callable(self.vmin) else self.vmin
+
+    def GetMax(self):
+        return self.vmax() if callable(self.vmax) else self.vmax
+
+
+class _IntegerNode(_ValueNode):
+    def SetValue(self, value):
+        _ValueNode.SetValue(self, int(value))
+
+    def GetInc(self):
+        return 1
+
+
+class _FloatNode(_ValueNode):
+    def SetValue(self, value):
+        _ValueNode.SetValue(self, float(value))
+
+
+class _BooleanNode(_ValueNode):
+    def SetValue(self, value):
+        _ValueNode.SetValue(self, bool(value))
+
+
+class _StringNode(_ValueNode):
+    pass
+
+
+class _EnumEntry(_Node):
+    def __init__(self, enum_name, symbolic, value):
+        _Node.__init__(self, 'EnumEntry_%s_%s' % (enum_name, symbolic), display_name=symbolic, writable=False)
+        self.symbolic = symbolic
+        self.value = value
+
+    def GetValue(self):
+        return self.value
+
+    def GetSymbolic(self):
+        return self.symbolic
+
+
+class _EnumNode(_ValueNode):
+    def __init__(self, name, symbolics, default, **kwargs):
+        _ValueNode.__init__(self, name, **kwargs)
+        self.entries = [_EnumEntry(name, symbolic, i) for i, symbolic in enumerate(symbolics)]
+        self.value = symbolics.index(default)
+
+    def GetEntries(self):
+        return list(self.entries)
+
+    def GetEntryByName(self, symbolic):
+        for entry in self.entries:
+            if entry.symbolic == symbolic:
+                return entry
+        return None
+
+    def GetIntValue(self):
+        return _ValueNode.GetValue(self)
+
+    def SetIntValue(self, value):
+        if value not in range(len(self.entries)):
+            raise SpinnakerException('Invalid entry %s of node %s' % (value, self.name))
+        _ValueNode.SetValue(self, value)
+
+    def GetValue(self):
+        return self.GetIntValue()
+
+    def SetValue(self, value):
+        self.SetIntValue(value)
+
+    def GetCurrentEntry(self):
+        return self.entries[self.GetIntValue()]
+
+    def symbolic(self):
+        return self.entries[self.value].symbolic
+
+    def ToString(self):
+        return self.GetCurrentEntry().symbolic
+
+
+class _CommandNode(_Node):
+    def __init__(self, name, callback, **kwargs):
+        _Node.__init__(self, name, **kwargs)
+        self.callback = callback
+
+    def Execute(self):
+        if not self.is_writable():
+            raise SpinnakerException('Node %s is not writable' % self.name)
+        self.callback()
+
+    def IsDone(self):
+        return True
+
+
+class _CategoryNode(_Node):
+    def __init__(self, name, features, **kwargs):
+        _Node.__init__(self, name, writable=False, **kwargs)
+        self.features = features
+
+    def GetFeatures(self):
+        return list(self.features)
+
+
+class _NodeMap:
+    def __init__(self):
+        self.nodes = {}
+
+    def add(self, node):
+        self.nodes[node.name] = node
+        return node
+
+    def GetNode(self, name):
+        return self.nodes.get(name)
+
+    def GetNodes(self):
+        return list(self.nodes.values())
+
+
+def _cast(node=None):
+    return node
+
+
+CNodePtr = CValuePtr = CIntegerPtr = CFloatPtr = CBooleanPtr = CStringPtr = _cast
+CEnumerationPtr = CEnumEntryPtr = CCommandPtr = CCategoryPtr = _cast
+
+
+def IsAvailable(node):
+    return node is not None and node.is_available()
+
+
+def IsReadable(node):
+    return node is not None and node.is_readable()
+
+
+def IsWritable(node):
+    return node is not None and node.is_writable()
+
+
+# *** Images ***
+
+class ChunkData:
+    def __init__(self, frame_id=0, timestamp=0, exposure_time=0.0, gain=0.0, width=0, height=0,
+                 offset_x=0, offset_y=0):
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.exposure_time = exposure_time
+        self.gain = gain
+        self.width = width
+        self.height = height
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+
+    def GetFrameID(self):
+        return self.frame_id
+
+    def GetTimestamp(self):
+        return self.timestamp
+
+    def GetExposureTime(self):
+        return self.exposure_time
+
+    def GetGain(self):
+        return self.gain
+
+    def GetWidth(self):
+        return self.width
+
+    def GetHeight(self):
+        return self.height
+
+    def GetOffsetX(self):
+        return self.offset_x
+
+    def GetOffsetY(self):
+        return self.offset_y
+
+    def GetSequencerSetActive(self):
+        return 0
+
+
+class Image:
+    def __init__(self, data, pixel_format, chunk=None, frame_id=0, timestamp=0, status=IMAGE_NO_ERROR,
+                 camera=None, arrival=None, in_stream=False):
+        self.data = data
+        self.pixel_format = pixel_format
+        self.chunk = chunk if chunk is not None else ChunkData()
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.status = status
+        self.camera = camera
+        self.arrival = arrival
+        self.in_stream = in_stream
+        self.released = False
+
+    @staticmethod
+    def Create(*args):
+        """
+        Image.Create(image) makes a deep copy of an image, which does not hold a
+        stream buffer; Image.Create(width, height, offset_x, offset_y, pixel_format, data)
+        wraps the given data.
+        """
+        if len(args) == 1 and isinstance(args[0], Image):
+            src = args[0]
+            return Image(src.data.copy(), src.pixel_format, chunk=src.chunk, frame_id=src.frame_id,
+                         timestamp=src.timestamp, status=src.status, camera=src.camera, arrival=src.arrival)
+        width, height, _, _, pixel_format, data = args[:6]
+        channels = 3 if pixel_format in (PixelFormat_BGR8, PixelFormat_RGB8) else 1
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        return Image(np.asarray(data, dtype=np.uint8).reshape(shape), pixel_format)
+
+    def _check(self):
+        if self.released:
+            raise SpinnakerException('Image has been released')
+
+    def GetNDArray(self):
+        self._check()
+        return self.data
+
+    def GetData(self):
+        self._check()
+        return self.data.reshape(-1)
+
+    def GetWidth(self):
+        return self.data.shape[1]
+
+    def GetHeight(self):
+        return self.data.shape[0]
+
+    def GetOffsetX(self):
+        return self.chunk.offset_x
+
+    def GetOffsetY(self):
+        return self.chunk.offset_y
+
+    def GetPixelFormat(self):
+        return self.pixel_format
+
+    def GetPixelFormatName(self):
+        return PIXEL_FORMAT_NAMES[self.pixel_format]
+
+    def GetBufferSize(self):
+        return self.data.nbytes
+
+    def GetImageSize(self):
+        return self.data.nbytes
+
+    def GetBitsPerPixel(self):
+        return 8 * (self.data.shape[2] if self.data.ndim == 3 else 1)
+
+    def GetFrameID(self):
+        return self.frame_id
+
+    def GetTimeStamp(self):
+        return self.timestamp
+
+    def GetChunkData(self):
+        return self.chunk
+
+    def IsIncomplete(self):
+        return self.status != IMAGE_NO_ERROR
+
+    def GetImageStatus(self):
+        return self.status
+
+    def IsInUse(self):
+        return self.in_stream and not self.released
+
+    def Convert(self, pixel_format, algorithm=HQ_LINEAR):
+        self._check()
+        data = self.data
+        if pixel_format == self.pixel_format:
+            data = data.copy()
+        elif cv2 is not None and self.pixel_format == PixelFormat_BayerRG8 and pixel_format == PixelFormat_BGR8:
+            data = cv2.cvtColor(data, cv2.COLOR_BayerRG2BGR)
+        elif pixel_format == PixelFormat_Mono8:
+            data = data.mean(axis=2).astype(np.uint8) if data.ndim == 3 else data.copy()
+        else:
+            data = np.repeat(data[:, :, None], 3, axis=2) if data.ndim == 2 else data.copy()
+        return Image(data, pixel_format, chunk=self.chunk, frame_id=self.frame_id, timestamp=self.timestamp,
+                     status=self.status, camera=self.camera, arrival=self.arrival)
+
+    def Save(self, filename, *args):
+        """
+        Encode and save the image. OpenCV is used to encode by file extension if it
+        is installed; otherwise the image is written as a binary PGM/PPM file.
+        """
+        self._check()
+        if cv2 is not None:
+            cv2.imwrite(filename, self.data)
+        else:
+            with open(filename, 'wb') as f:
+                magic = b'P6' if self.data.ndim == 3 else b'P5'
+                f.write(magic + b'\n%d %d\n255\n' % (self.GetWidth(), self.GetHeight()))
+                f.write(self.data.tobytes())
+        if self.camera is not None and self.arrival is not None:
+            self.camera._record_save(time.perf_counter() - self.arrival)
+
+    def Release(self):
+        if not self.in_stream:
+            raise SpinnakerException('Image is not part of a stream and cannot be released')
+        if not self.released:
+            self.released = True
+            self.camera._release_buffer()
+
+
+# *** Cameras ***
+
+class _LibraryVersion:
+    def __init__(self, major, minor, type, build):
+        self.major = major
+        self.minor = minor
+        self.type = type
+        self.build = build
+
+
+class Camera:
+    def __init__(self, system, index, serial, seed):
+        self.system = system
+        self.index = index
+        self.serial = serial
+        self.rng = random.Random(seed)
+        self.initialized = False
+        self.acquiring = False
+        self.lock = threading.Lock()
+
+        # device clock epoch in ns since "power on"
+        self.device_epoch = self.rng.randint(10 ** 11, 10 ** 13)
+        self.chunk_enabled = {}
+        self.last_chunk = None
+        self.pattern = None
+
+        self.start = None
+        self.next_k = 0
+        self.master_k0 = None
+        self.n_outstanding = 0
+        self.software_triggers = []
+
+        self.n_delivered = 0
+        self.n_dropped = 0
+        self.n_lost = 0
+        self.n_incomplete = 0
+        self.n_underrun = 0
+        self.save_latency = []
+
+        self.tl_device_nodemap = self._build_tl_device_nodemap()
+        self.nodemap = self._build_nodemap()
+        self.stream_nodemap = self._build_stream_nodemap()
+
+    # nodemaps
+
+    def _build_tl_device_nodemap(self):
+        nodemap = _NodeMap()
+        features = [
+            nodemap.add(_StringNode('DeviceID', value=self.serial, writable=False)),
+            nodemap.add(_StringNode('DeviceSerialNumber', value=self.serial, writable=False)),
+            nodemap.add(_StringNode('DeviceVendorName', value='FLIR (simulated)', writable=False)),
+            nodemap.add(_StringNode('DeviceModelName', value='Blackfly S BFS-U3-16S2C (simulated)', writable=False)),
+            nodemap.add(_StringNode('DeviceType', value='U3V', writable=False)),
+        ]
+        nodemap.add(_CategoryNode('DeviceInformation', features))
+        return nodemap
+
+    def _build_nodemap(self):
+        nodemap = _NodeMap()
+        initialized = lambda: self.initialized
+        idle = lambda: self.initialized and not self.acquiring
+
+        def add(node):
+            node.available = initialized
+            return nodemap.add(node)
+
+        add(_StringNode('DeviceSerialNumber', value=self.serial, writable=False))
+        add(_EnumNode('AcquisitionMode', ['Continuous', 'SingleFrame', 'MultiFrame'], 'Continuous', writable=idle))
+        self.frame_rate_enable = add(_BooleanNode('AcquisitionFrameRateEnable', value=False))
+        self.frame_rate = add(_FloatNode('AcquisitionFrameRate', value=30.0, vmin=1.0, vmax=self._max_frame_rate,
+                                         writable=lambda: self.frame_rate_enable.value))
+        add(_FloatNode('AcquisitionResultingFrameRate', getter=self._resulting_frame_rate, writable=False))
+        self.exposure_time = add(_FloatNode('ExposureTime', value=10000.0, vmin=10.0, vmax=30000000.0))
+        add(_EnumNode('ExposureAuto', ['Off', 'Once', 'Continuous'], 'Continuous'))
+        self.gain = add(_FloatNode('Gain', value=0.0, vmin=0.0, vmax=47.99))
+        add(_EnumNode('GainAuto', ['Off', 'Once', 'Continuous'], 'Continuous'))
+
+        self.pixel_format = add(_EnumNode('PixelFormat', PIXEL_FORMAT_NAMES, _config['pixel_format'], writable=idle))
+        add(_IntegerNode('SensorWidth', value=SENSOR_WIDTH, writable=False))
+        add(_IntegerNode('SensorHeight', value=SENSOR_HEIGHT, writable=False))
+        self.binning_h = add(_IntegerNode('BinningHorizontal', value=1, vmin=1, vmax=4, writable=idle,
+                                          setter=lambda v: self._set_binning(v, None)))
+        self.binning_v = add(_IntegerNode('BinningVertical', value=1, vmin=1, vmax=4, writable=idle,
+                                          setter=lambda v: self._set_binning(None, v)))
+        add(_IntegerNode('WidthMax', getter=lambda: SENSOR_WIDTH // self.binning_h.value, writable=False))
+        add(_IntegerNode('HeightMax', getter=lambda: SENSOR_HEIGHT // self.binning_v.value, writable=False))
+        self.width = add(_IntegerNode('Width', value=SENSOR_WIDTH, vmin=8, writable=idle,
+                                      vmax=lambda: SENSOR_WIDTH // self.binning_h.value - self.offset_x.value))
+        self.height = add(_IntegerNode('Height', value=SENSOR_HEIGHT, vmin=8, writable=idle,
+                                       vmax=lambda: SENSOR_HEIGHT // self.binning_v.value - self.offset_y.value))
+        self.offset_x = add(_IntegerNode('OffsetX', value=0, vmin=0, writable=idle,
+                                         vmax=lambda: SENSOR_WIDTH // self.binning_h.value - self.width.value))
+        self.offset_y = add(_IntegerNode('OffsetY', value=0, vmin=0, writable=idle,
+                                         vmax=lambda: SENSOR_HEIGHT // self.binning_v.value - self.height.value))
+        add(_IntegerNode('PayloadSize', getter=self._payload_size, writable=False))
+        add(_IntegerNode('DeviceLinkSpeed', value=_config['link_speed'], writable=False))
+        self.throughput_limit = add(_IntegerNode('DeviceLinkThroughputLimit', value=int(_config['link_speed'] * 0.76),
+                                                 vmin=10000000, vmax=_config['link_speed'], writable=idle))
+        add(_IntegerNode('DeviceLinkCurrentThroughput', getter=self._throughput, writable=False))
+
+        self.trigger_mode = add(_EnumNode('TriggerMode', ['Off', 'On'], 'Off'))
+        add(_EnumNode('TriggerSelector', ['FrameStart'], 'FrameStart'))
+        self.trigger_source = add(_EnumNode('TriggerSource', ['Software', 'Line0', 'Line1', 'Line2', 'Line3'],
+                                            'Software', writable=lambda: self.trigger_mode.symbolic() == 'Off'))
+        add(_EnumNode('TriggerActivation', ['RisingEdge', 'FallingEdge'], 'RisingEdge'))
+        add(_EnumNode('TriggerOverlap', ['Off', 'ReadOut', 'PreviousFrame'], 'Off'))
+        add(_CommandNode('TriggerSoftware', self._software_trigger))
+
+        # chunk data
+        self.chunk_mode_active = add(_BooleanNode('ChunkModeActive', value=False))
+        chunk_names = ['Image', 'CRC', 'FrameID', 'OffsetX', 'OffsetY', 'Width', 'Height', 'ExposureTime', 'Gain',
+                       'BlackLevel', 'PixelFormat', 'SequencerSetActive', 'Timestamp']
+        self.chunk_enabled = dict((name, name == 'Image') for name in chunk_names)
+        self.chunk_selector = add(_EnumNode('ChunkSelector', chunk_names, 'Image'))
+        chunk_enable = add(_BooleanNode(
+            'ChunkEnable',
+            getter=lambda: self.chunk_enabled[self.chunk_selector.symbolic()],
+            setter=lambda v: self.chunk_enabled.__setitem__(self.chunk_selector.symbolic(), v),
+            writable=lambda: self.chunk_selector.symbolic() != 'Image'))
+
+        def chunk_node(cls, name, display_name, attr):
+            def readable():
+                return self.chunk_mode_active.value and self.chunk_enabled[name] and self.last_chunk is not None
+            return add(cls('Chunk' + name, display_name=display_name, writable=False, readable=readable,
+                           getter=lambda: getattr(self.last_chunk, attr)))
+
+        features = [self.chunk_mode_active, self.chunk_selector, chunk_enable,
+                    chunk_node(_IntegerNode, 'FrameID', 'Chunk Frame ID', 'frame_id'),
+                    chunk_node(_IntegerNode, 'OffsetX', 'Chunk Offset X', 'offset_x'),
+                    chunk_node(_IntegerNode, 'OffsetY', 'Chunk Offset Y', 'offset_y'),
+                    chunk_node(_IntegerNode, 'Width', 'Chunk Width', 'width'),
+                    chunk_node(_IntegerNode, 'Height', 'Chunk Height', 'height'),
+                    chunk_node(_FloatNode, 'ExposureTime', 'Chunk Exposure Time', 'exposure_time'),
+                    chunk_node(_FloatNode, 'Gain', 'Chunk Gain', 'gain'),
+                    chunk_node(_IntegerNode, 'Timestamp', 'Chunk Timestamp', 'timestamp')]
+        add(_CategoryNode('ChunkDataControl', features))
+        return nodemap
+
+    def _build_stream_nodemap(self):
+        nodemap = _NodeMap()
+        idle = lambda: not self.acquiring
+        self.buffer_handling = nodemap.add(_EnumNode(
+            'StreamBufferHandlingMode', ['OldestFirst', 'OldestFirstOverwrite', 'NewestOnly', 'NewestFirst'],
+            'OldestFirst', writable=idle))
+        self.buffer_count_mode = nodemap.add(_EnumNode('StreamBufferCountMode', ['Auto', 'Manual'], 'Auto',
+                                                       writable=idle))
+        self.buffer_count = nodemap.add(_IntegerNode('StreamBufferCountManual', value=10, vmin=1,
+                                                     vmax=lambda: _config['max_buffers'], writable=idle))
+        nodemap.add(_IntegerNode('StreamBufferCountResult', getter=self._num_buffers, writable=False))
+        nodemap.add(_IntegerNode('StreamDeliveredFrameCount', getter=lambda: self.n_delivered, writable=False))
+        nodemap.add(_IntegerNode('StreamDroppedFrameCount', getter=lambda: self.n_dropped, writable=False))
+        nodemap.add(_IntegerNode('StreamLostFrameCount', getter=lambda: self.n_lost, writable=False))
+        nodemap.add(_IntegerNode('StreamIncompleteFrameCount', getter=lambda: self.n_incomplete, writable=False))
+        nodemap.add(_IntegerNode('StreamBufferUnderrunCount', getter=lambda: self.n_underrun, writable=False))
+        return nodemap
+
+    # node helpers
+
+    def _set_binning(self, binning_h, binning_v):
+        if binning_h is not None:
+            self.binning_h.value = binning_h
+            self.offset_x.value = 0
+            self.width.value = SENSOR_WIDTH // binning_h
+        if binning_v is not None:
+            self.binning_v.value = binning_v
+            self.offset_y.value = 0
+            self.height.value = SENSOR_HEIGHT // binning_v
+
+    def _bytes_per_pixel(self):
+        return 3 if self.pixel_format.symbolic() in ('BGR8', 'RGB8') else 1
+
+    def _payload_size(self):
+        return self.width.value * self.height.value * self._bytes_per_pixel()
+
+    def _max_frame_rate(self):
+        # readout time scales with the number of sensor rows read out, and the
+        # frames must fit into the link throughput limit
+        rows = self.height.value * self.binning_v.value
+        return min(SENSOR_MAX_FRAME_RATE * SENSOR_HEIGHT / float(rows),
+                   self.throughput_limit.value / float(self._payload_size()))
+
+    def _throughput(self):
+        # bytes/s sent over the link while acquiring
+        if not self.acquiring:
+            return 0
+        if self._is_hardware_triggered():
+            master = self.system._master(self)
+            return int(self._payload_size() * master._frame_rate()) if master is not None else 0
+        if self._is_software_triggered():
+            return 0
+        return int(self._payload_size() * self._frame_rate())
+
+    def _frame_rate(self):
+        if self.frame_rate_enable.value:
+            return min(self.frame_rate.value, self._max_frame_rate())
+        return self._max_frame_rate()
+
+    def _resulting_frame_rate(self):
+        return self._frame_rate()
+
+    def _num_buffers(self):
+        if self.buffer_count_mode.symbolic() == 'Manual':
+            return self.buffer_count.value
+        return 10
+
+    def _is_hardware_triggered(self):
+        return self.trigger_mode.symbolic() == 'On' and self.trigger_source.symbolic().startswith('Line')
+
+    def _is_software_triggered(self):
+        return self.trigger_mode.symbolic() == 'On' and self.trigger_source.symbolic() == 'Software'
+
+    def _software_trigger(self):
+        if self.acquiring:
+            with self.lock:
+                self.software_triggers.append(time.perf_counter())
+
+    def _release_buffer(self):
+        with self.lock:
+            self.n_outstanding -= 1
+
+    def _record_save(self, latency):
+        with self.lock:
+            self.save_latency.append(latency)
+
+    def stats(self):
+        return {
+            'serial': self.serial,
+            'delivered': self.n_delivered,
+            'dropped': self.n_dropped,
+            'lost': self.n_lost,
+            'incomplete': self.n_incomplete,
+            'underrun': self.n_underrun,
+            'save_latency': list(self.save_latency),
+        }
+
+    # camera API
+
+    def GetUniqueID(self):
+        return 'USB\\VID_1E10&PID_4000\\%s_%d' % (self.serial, self.index)
+
+    def GetTLDeviceNodeMap(self):
+        return self.tl_device_nodemap
+
+    def GetNodeMap(self):
+        return self.nodemap
+
+    def GetTLStreamNodeMap(self):
+        return self.stream_nodemap
+
+    def Init(self):
+        self.initialized = True
+
+    def DeInit(self):
+        if self.acquiring:
+            raise SpinnakerException('Camera %s is still acquiring' % self.serial)
+        self.initialized = False
+
+    def IsInitialized(self):
+        return self.initialized
+
+    def IsStreaming(self):
+        return self.acquiring
+
+    def IsValid(self):
+        return True
+
+    def BeginAcquisition(self):
+        if not self.initialized:
+            raise SpinnakerException('Camera %s is not initialized' % self.serial)
+        if self.acquiring:
+            raise SpinnakerException('Camera %s is already acquiring' % self.serial)
+        height, width = self.height.value, self.width.value
+        shape = (height, width, 3) if self._bytes_per_pixel() == 3 else (height, width)
+        if self.pattern is None or self.pattern.shape != shape:
+            # a static gradient pattern; a moving bar is drawn on each frame
+            ramp = (np.arange(width) * 256 // width + 16 * self.index).clip(0, 255).astype(np.uint8)
+            pattern = np.empty(shape, dtype=np.uint8)
+            pattern[...] = ramp[:, None] if len(shape) == 3 else ramp
+            self.pattern = pattern
+        self.next_k = 0
+        self.master_k0 = None
+        self.software_triggers = []
+        self.start = time.perf_counter()
+        self.acquiring = True
+        if _config['trigger_file'] and self.trigger_mode.symbolic() == 'Off':
+            _TriggerLine(_config['trigger_file']).publish(self.start, self._frame_rate(), True)
+
+    def EndAcquisition(self):
+        if not self.acquiring:
+            raise SpinnakerException('Camera %s is not acquiring' % self.serial)
+        self.acquiring = False
+        if _config['trigger_file'] and self.trigger_mode.symbolic() == 'Off':
+            _TriggerLine(_config['trigger_file']).publish(self.start, self._frame_rate(), False)
+
+    def _timeline(self):
+        """
+        Start time and period of the frame clock of this camera, None if the
+        camera is waiting for its trigger master to start.
+        """
+        if self._is_hardware_triggered():
+            master = self.system._master(self)
+            if master is None or master.start is None or not master.acquiring:
+                return None
+            period = 1.0 / master._frame_rate()
+            if self.master_k0 is None:
+                # first master frame after this camera was armed
+                self.master_k0 = max(0, int(np.ceil((self.start - master.start) / period)))
+            return master.start + (self.master_k0 * period) + _config['trigger_skew'], period
+        return self.start, 1.0 / self._frame_rate()
+
+    def _wait_frame(self, deadline):
+        """
+        Wait for the next frame of the stream.
+
+        :return: Frame number since BeginAcquisition and the time the frame arrived.
+        """
+        while True:
+            now = time.perf_counter()
+            if self._is_software_triggered():
+                with self.lock:
+                    trigger = self.software_triggers.pop(0) if self.software_triggers else None
+                if trigger is None:
+                    if now >= deadline:
+                        raise SpinnakerException('Failed waiting for EventData on NEW_BUFFER_DATA event.')
+                    time.sleep(min(0.001, deadline - now))
+                    continue
+                k = self.next_k
+                self.next_k += 1
+                return k, max(trigger, now)
+
+            timeline = self._timeline()
+            if timeline is None:
+                if now >= deadline:
+                    raise SpinnakerException('Failed waiting for EventData on NEW_BUFFER_DATA event.')
+                time.sleep(min(0.001, deadline - now))
+                continue
+            start, period = timeline
+
+            # frames which arrived while all stream buffers were full are dropped
+            n_arrived = int((now - start) / period) + 1 if now >= start else 0
+            with self.lock:
+                n_free = self._num_buffers() - self.n_outstanding
+            backlog = n_arrived - self.next_k
+            if backlog > max(n_free, 0):
+                # approximation: the oldest frames are dropped whatever the buffer handling mode
+                n_drop = backlog - max(n_free, 0)
+                self.n_dropped += n_drop
+                if n_free <= 0:
+                    self.n_underrun += 1
+                self.next_k += n_drop
+
+            k = self.next_k
+            jitter = 0.0
+            if _config['jitter'] > 0:
+                jitter = max(-0.5 * period, min(0.5 * period, self.rng.gauss(0.0, _config['jitter'])))
+            t_k = max(start + k * period + jitter, start)
+            if t_k > now:
+                if t_k > deadline:
+                    time.sleep(max(0.0, deadline - now))
+                    raise SpinnakerException('Failed waiting for EventData on NEW_BUFFER_DATA event.')
+                time.sleep(t_k - now)
+            self.next_k += 1
+
+            if _config['drop_rate'] > 0 and self.rng.random() < _config['drop_rate']:
+                # lost in transport
+                self.n_lost += 1
+                continue
+            return k, t_k
+
+    def GetNextImage(self, grabTimeout=EVENT_TIMEOUT_INFINITE, streamIndex=0):
+        if not self.acquiring:
+            raise SpinnakerException('Camera %s is not acquiring' % self.serial)
+        if grabTimeout == EVENT_TIMEOUT_INFINITE:
+            deadline = float('inf')
+        else:
+            deadline = time.perf_counter() + grabTimeout / 1000.0
+
+        k, t_k = self._wait_frame(deadline)
+
+        data = self.pattern.copy()
+        bar = (k * 8) % data.shape[1]
+        data[:, bar:bar + 8] = 255
+
+        chunk = ChunkData(frame_id=k,
+                          timestamp=self.device_epoch + int((t_k - _t0) * 1e9),
+                          exposure_time=self.exposure_time.value,
+                          gain=self.gain.value,
+                          width=self.width.value, height=self.height.value,
+                          offset_x=self.offset_x.value, offset_y=self.offset_y.value)
+        status = IMAGE_NO_ERROR
+        incomplete_rate = _config['incomplete_rate']
+        if _config['host_bandwidth'] > 0:
+            # the share of the frames which does not fit through the host controller
+            total = sum(cam._throughput() for cam in self.system.cameras)
+            if total > _config['host_bandwidth']:
+                incomplete_rate = max(incomplete_rate, 1.0 - _config['host_bandwidth'] / float(total))
+        if incomplete_rate > 0 and self.rng.random() < incomplete_rate:
+            status = IMAGE_DATA_INCOMPLETE
+            self.n_incomplete += 1
+
+        with self.lock:
+            self.n_outstanding += 1
+            self.n_delivered += 1
+        if self.chunk_mode_active.value:
+            self.last_chunk = chunk
+        return Image(data, self.pixel_format.value, chunk=chunk, frame_id=k, timestamp=chunk.timestamp,
+                     status=status, camera=self, arrival=time.perf_counter(), in_stream=True)
+
+
+class CameraList:
+    def __init__(self, cameras=None):
+        self.cameras = list(cameras) if cameras is not None else []
+
+    def GetSize(self):
+        return len(self.cameras)
+
+    def GetByIndex(self, index):
+        return self.cameras[index]
+
+    def GetBySerial(self, serial):
+        for cam in self.cameras:
+            if cam.serial == serial:
+                return cam
+        return None
+
+    def Clear(self):
+        self.cameras = []
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __iter__(self):
+        return iter(self.cameras)
+
+    def __getitem__(self, index):
+        return self.cameras[index]
+
+
+class System:
+    _instance = None
+
+    def __init__(self):
+        n = int(_config['num_cameras'])
+        serials = list(_config['serials'])
+        while len(serials) < n:
+            serials.append('%08d' % (20000000 + len(serials)))
+        self.cameras = [Camera(self, i, serials[i], _config['seed'] * 100 + i) for i in range(n)]
+        self.trigger_line = None
+
+    @staticmethod
+    def GetInstance():
+        global _last_system
+        if System._instance is None:
+            System._instance = System()
+            _last_system = System._instance
+        return System._instance
+
+    def ReleaseInstance(self):
+        if System._instance is self:
+            System._instance = None
+
+    def IsInUse(self):
+        return any(cam.initialized for cam in self.cameras)
+
+    def GetLibraryVersion(self):
+        return _LibraryVersion(1, 23, 0, 27)
+
+    def GetCameras(self, updateInterfaces=True, updateCameras=True):
+        return CameraList(self.cameras)
+
+    def _master(self, cam):
+        """
+        The free-running camera whose exposure output drives the hardware trigger
+        of the other cameras.
+        """
+        for other in self.cameras:
+            if other is not cam and other.acquiring and other.trigger_mode.symbolic() == 'Off':
+                return other
+        if _config['trigger_file']:
+            # the master camera may be acquiring in another process
+            if self.trigger_line is None:
+                self.trigger_line = _TriggerLine(_config['trigger_file'])
+            return self.trigger_line.read()
+        return None
@@ -0,0 +1,218 @@
+"""
+Simulated radar control backend. It stands in for mmWave Studio and the
+DCA1000 behind MatlabRadar (collector.radar_driver), so that run_datacol.py,
+the radar service and copy_radar_data can be run end to end without the TI
+tools, MATLAB or Windows.
+
+init, arm and start take about as long as configured, like starting the MATLAB
+engine and running the Lua scripts. After start, a thread records synthetic
+ADC frames at the frame rate of the radar into adc_data_Raw_N.bin files in a
+PostProc-like directory, in the packet format of the DCA1000 raw capture:
+every UDP packet is stored as a 4-byte sequence number, a 6-byte count of the
+bytes sent before the packet and the payload. A new file is started when a
+file would exceed max_file_size, as in mmWave Studio.
+
+The default frame is the format1 configuration of archive/lua_datacapture:
+128 complex ADC samples, 4 receivers, 2 transmitters and 255 loops per frame,
+30 frames per second.
+"""
+import os
+import glob
+import math
+import struct
+import tempfile
+import threading
+import time
+import numpy as np
+
+
+NUM_ADC_SAMPLES = 128
+NUM_RX = 4
+NUM_CHIRPS = 2 * 255
+# complex int16 samples (I and Q)
+FRAME_SIZE = NUM_ADC_SAMPLES * NUM_RX * NUM_CHIRPS * 4
+FRAME_RATE = 30.0
+NUM_FRAMES = 900
+# payload of a DCA1000 data packet in bytes
+PACKET_SIZE = 1456
+MAX_FILE_SIZE = 1024 * 1024 * 1024
+
+DEFAULT_POSTPROC_DIR = os.path.join(tempfile.gettempdir(), 'fake_mmwave_postproc')
+
+
+def packet_header(seq, byte_count):
+    """
+    :return: Header of a raw capture packet: sequence number (from 1) and the number of bytes sent before it.
+    :rtype: bytes
+    """
+    return struct.pack('<IHI', seq, byte_count & 0xFFFF, byte_count >> 16)
+
+
+def synthetic_frames(frame_size=FRAME_SIZE, n=4, seed=0):
+    """
+    :return: n noisy frames of int16 samples with one target.
+    :rtype: list
+    """
+    rng = np.random.RandomState(seed)
+    n_values = frame_size // 2
+    tone = (1000 * np.sin(2 * np.pi * 0.1 * np.arange(n_values))).astype(np.int16)
+    return [(tone + rng.normal(0, 50, n_values).astype(np.int16)).tobytes() for _ in range(n)]
+
+
+class PacketStream:
+    """
+    Splits the ADC data stream of the DCA1000 into packets of PACKET_SIZE
+    bytes with the raw capture header.
+    """
+
+    def __init__(self, packet_size=PACKET_SIZE):
+        self.packet_size = packet_size
+        self.n_packets = 0
+        self.byte_count = 0
+        self.pending = b''
+
+    def push(self, data, last=False):
+        """
+        :param data: Next bytes of the stream, e.g. a frame.
+        :param last: If True, the stream ends with data, and the rest is sent in a short packet.
+        :return: Packets with header.
+        :rtype: list
+        """
+        self.pending += data
+        n_full = len(self.pending) // self.packet_size
+        if last and len(self.pending) % self.packet_size > 0:
+            n_full += 1
+        packets = []
+        for k in range(n_full):
+            payload = self.pending[k * self.packet_size:(k + 1) * self.packet_size]
+            self.n_packets += 1
+            packets.append(packet_header(self.n_packets, self.byte_count) + payload)
+            self.byte_count += len(payload)
+        self.pending = self.pending[n_full * self.packet_size:]
+        return packets
+
+
+def read_raw_packets(path, packet_size=PACKET_SIZE):
+    """
+    Read the packets of a raw capture file (adc_data_Raw_N.bin). The payload
+    size is not stored, so every packet but the last one of the file must
+    have packet_size bytes, the default packet size of the DCA1000.
+
+    :return: Generator of the packets with header.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            packet = f.read(10 + packet_size)
+            if len(packet) <= 10:
+                break
+            yield packet
+
+
+class SimulatedRadar:
+    """
+    Radar control backend with init(), arm(), start(), stop() and close(),
+    like MatlabRadar, which records synthetic raw files instead of
+    controlling a radar.
+    """
+
+    def __init__(self, postproc_dir=None, frame_rate=FRAME_RATE, num_frames=NUM_FRAMES, duration=None,
+                 frame_size=FRAME_SIZE, max_file_size=MAX_FILE_SIZE, init_latency=1.0, arm_latency=0.3,
+                 start_latency=0.005, seed=0):
+        """
+        :param postproc_dir: Directory of the raw files, default a directory in the temp directory.
+        :param frame_rate: Radar frames per second.
+        :param num_frames: Number of frames of a recording.
+        :param duration: Length of a recording in s, instead of num_frames.
+        :param frame_size: Bytes per frame.
+        :param max_file_size: Maximum size of a raw file in bytes.
+        :param init_latency: Time init() takes in s, e.g. to start the MATLAB engine.
+        :param arm_latency: Time arm() takes in s.
+        :param start_latency: Time start() takes in s.
+        """
+        self.postproc_dir = postproc_dir or DEFAULT_POSTPROC_DIR
+        self.frame_rate = frame_rate
+        self.num_frames = int(math.ceil(duration * frame_rate)) if duration is not None else num_frames
+        self.frame_size = frame_size
+        self.max_file_size = max_file_size
+        self.latency = {'init': init_latency, 'arm': arm_latency, 'start': start_latency}
+        self.initialized = False
+        self.stopped = threading.Event()
+        self.thread = None
+        self.n_frames = 0
+        self.n_packets = 0
+        self.n_files = 0
+
+        # a few noisy frames with one target, cycled through while recording
+        self.frames = synthetic_frames(frame_size, seed=seed)
+
+        if not os.path.exists(self.postproc_dir):
+            os.makedirs(self.postproc_dir)
+
+    def init(self):
+        if not self.initialized:
+            time.sleep(self.latency['init'])
+            self.initialized = True
+            print('Simulated radar initialized, raw files in %s' % self.postproc_dir)
+
+    def arm(self):
+        """
+        Stop a running recording and remove the raw files of the last one.
+        """
+        self.stop()
+        time.sleep(self.latency['arm'])
+        for path in glob.glob(os.path.join(self.postproc_dir, 'adc_data_Raw_*.bin')):
+            os.remove(path)
+
+    def start(self):
+        self.stop()
+        time.sleep(self.latency['start'])
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._record, name='fake-radar')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        self.initialized = False
+
+    def _record(self):
+        self.n_frames = self.n_packets = self.n_files = 0
+        stream = PacketStream()
+        out_file = None
+        file_size = 0
+        period = 1.0 / self.frame_rate
+        time_start = time.perf_counter()
+
+        try:
+            for i in range(self.num_frames):
+                # a frame is sent when its chirps are done
+                remaining = time_start + (i + 1) * period - time.perf_counter()
+                if remaining > 0 and self.stopped.wait(remaining):
+                    break
+                if self.stopped.is_set():
+                    break
+                # the last frame is sent with a short packet
+                packets = stream.push(self.frames[i % len(self.frames)], last=i == self.num_frames - 1)
+                self.n_frames += 1
+                self.n_packets = stream.n_packets
+
+                for packet in packets:
+                    if out_file is None or file_size + len(packet) > self.max_file_size:
+                        if out_file is not None:
+                            out_file.close()
+                        out_file = open(os.path.join(self.postproc_dir, 'adc_data_Raw_%d.bin' % self.n_files), 'wb')
+                        self.n_files += 1
+                        file_size = 0
+                    out_file.write(packet)
+                    file_size += len(packet)
+        finally:
+            if out_file is not None:
+                out_file.close()
+
+        print('Simulated radar: %d frames, %d packets, %d raw files' % (self.n_frames, self.n_packets, self.n_files))
@@ -0,0 +1,183 @@
+import os
+import json
+import numpy as np
+
+try:
+    import yaml
+except ImportError:
+    print("Warning: PyYAML is not installed!")
+
+# Image format of a sequence, written by the capture session. It lists the
+# binning and region of interest of every camera, so the calibration of the
+# full sensor can be adjusted to the recorded frames, see adjust_calib.
+IMAGE_FORMAT_FILE = 'image_format.json'
+
+
+def load_calib(calib_yaml):
+    """
+    Load a camera calibration file in the format of the ROS camera calibrator
+    (see preprocess/ost.yaml).
+
+    :return: Image width and height, camera matrix K, distortion coefficients D,
+        rectification matrix R and projection matrix P.
+    :rtype: tuple
+    """
+    with open(calib_yaml, "r") as stream:
+        data = yaml.safe_load(stream)
+
+    def matrix(name):
+        entry = data[name]
+        return np.reshape(np.array(entry['data'], dtype=np.float64), (entry['rows'], entry['cols']))
+
+    return data['image_width'], data['image_height'], matrix('camera_matrix'), \
+        np.squeeze(matrix('distortion_coefficients')), matrix('rectification_matrix'), matrix('projection_matrix')
+
+
+def load_calib_format(calib_yaml):
+    """
+    Load the image format a calibration file is valid for. Files written by
+    write_calib for a binned or cropped stream carry the binning, the region
+    of interest and the full sensor size; files of the ROS camera calibrator
+    are valid for the full sensor.
+
+    :return: Image format, see full_format.
+    :rtype: dict
+    """
+    with open(calib_yaml, "r") as stream:
+        data = yaml.safe_load(stream)
+    image_format = full_format(data['image_width'], data['image_height'])
+    if 'roi' in data:
+        image_format.update({
+            'binning_x': data.get('binning_x', 1),
+            'binning_y': data.get('binning_y', 1),
+            'x_offset': data['roi']['x_offset'],
+            'y_offset': data['roi']['y_offset'],
+            'width': data['roi']['width'],
+            'height': data['roi']['height'],
+            'sensor_width': data['roi']['sensor_width'],
+            'sensor_height': data['roi']['sensor_height'],
+        })
+    return image_format
+
+
+def full_format(width, height):
+    """
+    :return: Image format of the full sensor without binning.
+    :rtype: dict
+    """
+    return {'binning_x': 1, 'binning_y': 1, 'x_offset': 0, 'y_offset': 0, 'width': width, 'height': height,
+            'sensor_width': width, 'sensor_height': height}
+
+
+def is_full_format(image_format):
+    return image_format['binning_x'] == 1 and image_format['binning_y'] == 1 and \
+        image_format['x_offset'] == 0 and image_format['y_offset'] == 0 and \
+        image_format['width'] == image_format['sensor_width'] and \
+        image_format['height'] == image_format['sensor_height']
+
+
+def adjust_calib(calib, image_format):
+    """
+    Adjust the calibration of the full sensor to binned and cropped frames.
+    The focal lengths scale with the binning; the principal point scales with
+    the binning (pixel centers are at half-integer sensor positions) and
+    moves by the offset of the region of interest. The projection matrix is
+    adjusted the same way, so the rectified frames are the binned crop of the
+    rectified full frames. The distortion coefficients and the rectification
+    matrix do not depend on the pixel grid.
+
+    :param calib: Calibration of the full sensor, see load_calib.
+    :param image_format: Binning and region of interest, offsets in binned pixels.
+    :type calib: tuple
+    :type image_format: dict
+    :return: Calibration of the frames, as load_calib.
+    :rtype: tuple
+    """
+    width, height, K, D, R, P = calib
+    if (width, height) != (image_format['sensor_width'], image_format['sensor_height']):
+        raise ValueError('The calibration is for %dx%d, not for the %dx%d sensor.'
+                         % (width, height, image_format['sensor_width'], image_format['sensor_height']))
+    scale_x = 1.0 / image_format['binning_x']
+    scale_y = 1.0 / image_format['binning_y']
+
+    def adjust(M):
+        M = np.array(M, dtype=np.float64)
+        M[0] *= scale_x
+        M[1] *= scale_y
+        M[0, 2] += 0.5 * scale_x - 0.5 - image_format['x_offset']
+        M[1, 2] += 0.5 * scale_y - 0.5 - image_format['y_offset']
+        return M
+
+    return image_format['width'], image_format['height'], adjust(K), D, R, adjust(P)
+
+
+def kept_rows(crop, image_format):
+    """
+    Number of rows of the rectified frames kept by a crop of the full frame
+    height from the top, as in preprocess/cam_stereo_rectify.py, so binned
+    and cropped streams keep the same field of view as full frames.
+
+    :param crop: Fraction of the full frame height kept from the top.
+    :type image_format: dict
+    :rtype: int
+    """
+    rows = int(crop * image_format['sensor_height']) // image_format['binning_y'] - image_format['y_offset']
+    return min(max(rows, 0), image_format['height'])
+
+
+def write_calib(calib_yaml, calib, image_format=None, camera_name='camera'):
+    """
+    Write a calibration in the format of the ROS camera calibrator. If the
+    image format is not the full sensor, the binning and region of interest
+    are added as binning_x, binning_y and roi, see load_calib_format.
+
+    :param calib: Calibration, see load_calib.
+    :param image_format: Image format the calibration is valid for, None for the full sensor.
+    :type calib: tuple
+    :type image_format: dict
+    """
+    width, height, K, D, R, P = calib
+
+    def matrix(M, rows, cols):
+        return {'rows': rows, 'cols': cols, 'data': [float(x) for x in np.ravel(M)]}
+
+    data = {
+        'image_width': int(width),
+        'image_height': int(height),
+        'camera_name': camera_name,
+        'camera_matrix': matrix(K, 3, 3),
+        'distortion_model': 'plumb_bob',
+        'distortion_coefficients': matrix(D, 1, np.size(D)),
+        'rectification_matrix': matrix(R, 3, 3),
+        'projection_matrix': matrix(P, 3, 4),
+    }
+    if image_format is not None and not is_full_format(image_format):
+        data['binning_x'] = int(image_format['binning_x'])
+        data['binning_y'] = int(image_format['binning_y'])
+        data['roi'] = dict((key, int(image_format[key])) for key in
+                           ('x_offset', 'y_offset', 'width', 'height', 'sensor_width', 'sensor_height'))
+    with open(calib_yaml, 'w') as stream:
+        yaml.safe_dump(data, stream, default_flow_style=None, sort_keys=False)
+
+
+def write_image_formats(seq_dir, image_formats):
+    """
+    :param seq_dir: Sequence directory.
+    :param image_formats: Image format of every camera, by camera index.
+    :type image_formats: list
+    """
+    with open(os.path.join(seq_dir, IMAGE_FORMAT_FILE), 'w') as f:
+        json.dump(image_formats, f, indent=2)
+
+
+def load_image_formats(seq_dir):
+    """
+    :param seq_dir: Sequence directory.
+    :return: Image format of every camera, None if the sequence has no image format file.
+    :rtype: list
+    """
+    path = os.path.join(seq_dir, IMAGE_FORMAT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -2,6 +2,7 @@ import os
 import numpy as np
 
 from utils import get_sec
+from utils.frame_log import load_frame_log, frame_log_timestamps
 
 # parameter settings
 camera_configs = {
@@ -12,6 +13,8 @@ camera_configs = {
     # 'image_folder': 'images_hist_0',
     'time_stamp_name': 'timestamps.txt',
     # 'time_stamp_name': 'timestamps_0.txt',
+    'frame_log_name': 'frame_log.bin',
+    # 'frame_log_name': 'frame_log_0.bin',
     'frame_expo': 0,
     # 'frame_expo': 40,
     'start_time_name': 'start_time.txt',
@@ -19,21 +22,67 @@ camera_configs = {
 }
 
 
-def fix_cam_drop_frames(seq_path, label_names):
+def load_timestamps(seq_path):
+    """
+    Load the camera timestamps (in seconds, relative to the first frame) of a sequence.
+    The binary frame log is used if it exists, otherwise the timestamps text file.
+    """
+    log_path = os.path.join(seq_path, camera_configs['frame_log_name'])
+    if os.path.exists(log_path):
+        return frame_log_timestamps(load_frame_log(log_path)).tolist()
     ts_path = os.path.join(seq_path, camera_configs['time_stamp_name'])
+    with open(ts_path) as ts_f:
+        return [float(line.rstrip()) for line in ts_f.readlines()]
+
+
+def load_frame_positions(seq_path):
+    """
+    Load the positions of the saved frames in the camera frame sequence, relative
+    to the first frame. They are exact if the binary frame log has chunk FrameIDs
+    (the gaps are the ones listed in frame_gaps.txt while capturing), otherwise
+    they are estimated from the timestamps and the frame rate.
+    """
+    log_path = os.path.join(seq_path, camera_configs['frame_log_name'])
+    if os.path.exists(log_path):
+        frame_ids = np.asarray(load_frame_log(log_path)['frame_id'], dtype=np.int64)
+        if len(frame_ids) > 1 and frame_ids[-1] > frame_ids[0]:
+            return (frame_ids - frame_ids[0]).tolist()
+    ts = load_timestamps(seq_path)
+    return [int(time * camera_configs['frame_rate']) for time in ts]
+
+
+def load_stereo_pairs(seq_path):
+    """
+    Load the stereo pair index written while capturing (pairs.txt).
+
+    :return: Left and right frame indices of every pair, None if the sequence has no pair index.
+    :rtype: list
+    """
+    pairs_path = os.path.join(seq_path, 'pairs.txt')
+    if not os.path.exists(pairs_path):
+        return None
+    pairs = []
+    with open(pairs_path) as pairs_f:
+        for line in pairs_f.readlines():
+            fields = line.split()
+            if len(fields) >= 3:
+                pairs.append((int(fields[1]), int(fields[2])))
+    return pairs
+
+
+def fix_cam_drop_frames(seq_path, label_names):
     try:
-        with open(ts_path) as ts_f:
-            ts = ts_f.readlines()
+        positions = load_frame_positions(seq_path)
     except:
         return label_names
-    n_labels = len(ts)
-    if int(float(ts[-1].rstrip()) * camera_configs['frame_rate']) == n_labels - 1:
+    n_labels = len(positions)
+    if n_labels == 0:
+        return label_names
+    if positions[-1] == n_labels - 1:
         # no dropped frame
         return label_names
     label_names_new = [None] * n_labels
-    for idx, line in enumerate(ts):
-        time = float(line.rstrip())
-        real_id = int(time * camera_configs['frame_rate'])
+    for idx, real_id in enumerate(positions):
         if real_id < n_labels:
             label_names_new[real_id] = label_names[idx]
     # search for the nearest element with labels
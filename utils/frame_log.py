@@ -0,0 +1,102 @@
+import os
+import numpy as np
+
+# Binary per-frame metadata log: a 16-byte header followed by fixed-size,
+# little-endian records, one per saved frame.
+FRAME_LOG_MAGIC = b'CRFLOG01'
+FRAME_LOG_HEADER_SIZE = 16
+FRAME_LOG_DTYPE = np.dtype([
+    ('frame_idx', '<u4'),   # index of the frame in the sequence (image file name)
+    ('frame_id', '<u8'),    # chunk FrameID from the camera
+    ('device_ts', '<u8'),   # chunk timestamp from the camera in ns
+    ('host_ts', '<f8'),     # host monotonic time (time.perf_counter) in s
+    ('exposure', '<u4'),    # exposure time in us
+    ('gain', '<i4'),        # gain in 0.001 dB
+])
+
+
+class FrameLogWriter:
+    """
+    Append-only writer of the binary frame log. Records are collected in a
+    preallocated buffer and written to disk every flush_every records.
+    """
+
+    def __init__(self, path, flush_every=30):
+        self.path = path
+        self.flush_every = max(1, int(flush_every))
+        self.buffer = np.zeros((self.flush_every, ), dtype=FRAME_LOG_DTYPE)
+        self.n_buffered = 0
+        self.n_records = 0
+        self.f = open(path, 'wb')
+        header = FRAME_LOG_MAGIC + np.array([FRAME_LOG_DTYPE.itemsize, 0], dtype='<u4').tobytes()
+        self.f.write(header)
+
+    def append(self, frame_idx, frame_id, device_ts, host_ts, exposure=0, gain=0):
+        self.buffer[self.n_buffered] = (frame_idx, frame_id, device_ts, host_ts, exposure, gain)
+        self.n_buffered += 1
+        self.n_records += 1
+        if self.n_buffered == self.flush_every:
+            self.flush()
+
+    def append_chunk(self, frame_idx, chunk, host_ts):
+        """
+        Append a record from the ChunkInfo of a frame.
+        """
+        self.append(frame_idx, chunk.frame_id, chunk.timestamp, host_ts, chunk.exposure, chunk.gain)
+
+    def flush(self):
+        if self.n_buffered > 0:
+            self.f.write(self.buffer[:self.n_buffered].tobytes())
+            self.n_buffered = 0
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+
+def load_frame_log(path):
+    """
+    Memory-map a binary frame log. A trailing partial record (e.g. after a crash)
+    is ignored.
+
+    :param path: Path of the frame log.
+    :return: Structured array of the records, see FRAME_LOG_DTYPE.
+    :rtype: np.memmap
+    """
+    with open(path, 'rb') as f:
+        header = f.read(FRAME_LOG_HEADER_SIZE)
+    if len(header) < FRAME_LOG_HEADER_SIZE or header[:8] != FRAME_LOG_MAGIC:
+        raise ValueError('%s is not a frame log.' % path)
+    record_size = int(np.frombuffer(header[8:12], dtype='<u4')[0])
+    if record_size != FRAME_LOG_DTYPE.itemsize:
+        raise ValueError('Unsupported record size %d in %s.' % (record_size, path))
+
+    n_records = (os.path.getsize(path) - FRAME_LOG_HEADER_SIZE) // record_size
+    if n_records == 0:
+        return np.zeros((0, ), dtype=FRAME_LOG_DTYPE)
+    return np.memmap(path, dtype=FRAME_LOG_DTYPE, mode='r', offset=FRAME_LOG_HEADER_SIZE, shape=(n_records, ))
+
+
+def frame_log_timestamps(frame_log):
+    """
+    Timestamps of the frames in seconds relative to the first frame, the same
+    values as written to the timestamps text files.
+    """
+    device_ts = np.asarray(frame_log['device_ts'], dtype=np.int64)
+    if len(device_ts) == 0:
+        return np.zeros((0, ))
+    return (device_ts - device_ts[0]) * 1e-9
+
+
+def export_timestamps_txt(log_path, txt_path):
+    """
+    Export a binary frame log to the timestamps text format (one relative
+    timestamp in seconds per line) for backward compatibility.
+    """
+    timestamps = frame_log_timestamps(load_frame_log(log_path))
+    with open(txt_path, 'w') as f:
+        for value in timestamps:
+            f.write("%.10f\n" % value)
+    return len(timestamps)
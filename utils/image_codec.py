@@ -0,0 +1,80 @@
+import time
+
+try:
+    import cv2
+except ImportError:
+    print("Warning: OpenCV is not installed!")
+
+# OpenCV names Bayer patterns by the second row of the pattern, so an RGGB
+# sensor (Spinnaker BayerRG8) is converted with COLOR_BayerBG2BGR.
+DEBAYER_CODES = {
+    'BayerRG8': 'COLOR_BayerBG2BGR',
+    'BayerBG8': 'COLOR_BayerRG2BGR',
+    'BayerGR8': 'COLOR_BayerGB2BGR',
+    'BayerGB8': 'COLOR_BayerGR2BGR',
+}
+
+
+def to_bgr(frame, pixel_format):
+    """
+    Convert a raw sensor frame to a BGR image. Frames of other pixel formats
+    (e.g. Mono8, BGR8) are returned unchanged.
+
+    :param frame: Raw frame, e.g. the GetNDArray() of an image.
+    :param pixel_format: Pixel format name of the frame, e.g. 'BayerRG8'.
+    :type frame: np.ndarray
+    :type pixel_format: str
+    :rtype: np.ndarray
+    """
+    code = DEBAYER_CODES.get(pixel_format)
+    if code is None:
+        return frame
+    return cv2.cvtColor(frame, getattr(cv2, code))
+
+
+def encode_image(frame, pixel_format, ext='jpg', quality=95):
+    """
+    Debayer and encode a raw frame to the image format of the file extension
+    ext; quality is the JPEG quality (ignored for other formats).
+
+    :return: Encoded image.
+    :rtype: bytes
+    """
+    image = to_bgr(frame, pixel_format)
+    ext = ext.lower()
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if ext in ('jpg', 'jpeg') else []
+    ok, buf = cv2.imencode('.' + ext, image, params)
+    if not ok:
+        raise IOError('Unable to encode image as %s' % ext)
+    return buf.tobytes()
+
+
+def write_image(filename, frame, pixel_format, quality=95):
+    """
+    Debayer, encode and write a raw frame. The format is given by the file
+    extension.
+
+    :return: Size of the written file in bytes.
+    :rtype: int
+    """
+    data = encode_image(frame, pixel_format, filename.rsplit('.', 1)[-1], quality)
+    with open(filename, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def encode_task(task):
+    """
+    Worker function of the encoder processes: encode and write a frame given
+    as task tuple (filename, frame, pixel_format, quality).
+
+    :return: Size of the written file in bytes, encode time and write time in seconds.
+    :rtype: tuple
+    """
+    filename, frame, pixel_format, quality = task
+    time_start = time.perf_counter()
+    data = encode_image(frame, pixel_format, filename.rsplit('.', 1)[-1], quality)
+    time_encoded = time.perf_counter()
+    with open(filename, 'wb') as f:
+        f.write(data)
+    return len(data), time_encoded - time_start, time.perf_counter() - time_encoded
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+
+# Raw frame container: one preallocated, memory-mapped file per camera holding
+# the raw sensor buffers (Bayer or Mono8) of a sequence.
+#
+# Layout:
+#   header (RAW_HEADER_SIZE bytes), see RAW_HEADER_DTYPE
+#   frame index (max_frames records), see RAW_INDEX_DTYPE
+#   frame slots (max_frames slots of slot_size bytes, page aligned)
+RAW_MAGIC = b'CRRAW001'
+RAW_HEADER_SIZE = 4096
+RAW_PAGE_SIZE = 4096
+RAW_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('max_frames', '<u4'),
+    ('n_frames', '<u4'),
+    ('frame_size', '<u8'),
+    ('slot_size', '<u8'),
+    ('data_offset', '<u8'),
+    ('pixel_format', 'S16'),
+])
+RAW_INDEX_DTYPE = np.dtype([
+    ('frame_idx', '<u4'),   # index of the frame in the sequence
+    ('frame_id', '<u8'),    # chunk FrameID from the camera
+    ('device_ts', '<u8'),   # chunk timestamp from the camera in ns
+    ('offset', '<u8'),      # offset of the frame data in the file
+])
+
+
+def _align(size, alignment=RAW_PAGE_SIZE):
+    return (size + alignment - 1) // alignment * alignment
+
+
+class RawFrameWriter:
+    """
+    Writer of a raw frame container. The file is preallocated for max_frames
+    frames and memory-mapped, so appending a frame is a single copy of the
+    sensor buffer.
+    """
+
+    def __init__(self, path, shape, pixel_format, max_frames):
+        """
+        :param path: Path of the container file.
+        :param shape: Shape of the frames, (height, width) or (height, width, channels).
+        :param pixel_format: Pixel format name of the frames, e.g. 'BayerRG8' or 'Mono8'.
+        :param max_frames: Number of frames to preallocate.
+        """
+        self.path = path
+        self.shape = tuple(shape)
+        self.max_frames = int(max_frames)
+        self.n_frames = 0
+
+        height, width = self.shape[:2]
+        channels = self.shape[2] if len(self.shape) == 3 else 1
+        self.frame_size = height * width * channels
+        self.slot_size = _align(self.frame_size)
+        self.index_offset = RAW_HEADER_SIZE
+        self.data_offset = _align(RAW_HEADER_SIZE + self.max_frames * RAW_INDEX_DTYPE.itemsize)
+
+        header = np.zeros((1, ), dtype=RAW_HEADER_DTYPE)
+        header[0] = (RAW_MAGIC, height, width, channels, self.max_frames, 0, self.frame_size, self.slot_size,
+                     self.data_offset, pixel_format.encode())
+        self.header = header
+
+        total_size = self.data_offset + self.max_frames * self.slot_size
+        with open(path, 'wb') as f:
+            f.truncate(total_size)
+        self.mm = np.memmap(path, dtype=np.uint8, mode='r+', shape=(total_size, ))
+        self.mm[:RAW_HEADER_DTYPE.itemsize] = header.view(np.uint8)
+        self.index = self.mm[self.index_offset:self.index_offset + self.max_frames * RAW_INDEX_DTYPE.itemsize] \
+            .view(RAW_INDEX_DTYPE)
+        self.slots = self.mm[self.data_offset:].reshape(self.max_frames, self.slot_size)
+
+    def append(self, frame, frame_idx, frame_id=0, device_ts=0):
+        """
+        Copy a frame into the next slot of the container.
+
+        :param frame: Raw frame, e.g. the GetNDArray() of an unreleased image.
+        :return: True if successful, False if the container is full.
+        :rtype: bool
+        """
+        if self.n_frames >= self.max_frames:
+            return False
+        slot = self.n_frames
+        self.slots[slot, :self.frame_size] = np.asarray(frame).reshape(-1)
+        self.index[slot] = (frame_idx, frame_id, device_ts, self.data_offset + slot * self.slot_size)
+        self.n_frames += 1
+        return True
+
+    def flush(self):
+        self.header['n_frames'] = self.n_frames
+        self.mm[:RAW_HEADER_DTYPE.itemsize] = self.header.view(np.uint8)
+        self.mm.flush()
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.flush()
+        self.index = None
+        self.slots = None
+        self.mm = None
+        # drop the unused preallocated slots
+        with open(self.path, 'r+b') as f:
+            f.truncate(self.data_offset + self.n_frames * self.slot_size)
+
+
+def load_raw_container(path):
+    """
+    Memory-map a raw frame container.
+
+    :param path: Path of the container file.
+    :return: Header (dict), frame index and frames of shape (n_frames, height, width[, channels]).
+    """
+    header = np.fromfile(path, dtype=RAW_HEADER_DTYPE, count=1)
+    if len(header) == 0 or header[0]['magic'] != RAW_MAGIC:
+        raise ValueError('%s is not a raw frame container.' % path)
+    header = dict((name, header[0][name]) for name in RAW_HEADER_DTYPE.names)
+    header['pixel_format'] = header['pixel_format'].decode()
+
+    n_frames = int(header['n_frames'])
+    index = np.memmap(path, dtype=RAW_INDEX_DTYPE, mode='r', offset=RAW_HEADER_SIZE, shape=(max(n_frames, 1), ))
+    index = index[:n_frames]
+
+    shape = (int(header['height']), int(header['width']))
+    if header['channels'] > 1:
+        shape += (int(header['channels']), )
+    if n_frames == 0:
+        return header, index, np.zeros((0, ) + shape, dtype=np.uint8)
+    slot_size = int(header['slot_size'])
+    slots = np.memmap(path, dtype=np.uint8, mode='r', offset=int(header['data_offset']),
+                      shape=(n_frames, slot_size))
+    frames = slots[:, :int(header['frame_size'])].reshape((n_frames, ) + shape)
+    return header, index, frames